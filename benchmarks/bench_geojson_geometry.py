@@ -0,0 +1,87 @@
+"""
+Benchmark writing Span geometries to GeoJSON, comparing the old
+json.loads(asJson()) round trip with the direct vertex encoder.
+
+Run from the repository root, with the QGIS python libraries on PYTHONPATH:
+
+    python -m benchmarks.bench_geojson_geometry
+"""
+import io
+import json
+import math
+import timeit
+
+from qgis.core import QgsGeometry, QgsPointXY
+
+from tool.model.network import NetworkDescription, Span
+from tool.model.qgis_utils import QVariantJSONEncoder, write_geojson_from_features
+
+N_SPANS = 500
+N_VERTICES = 2000
+REPEATS = 3
+
+
+def make_spans(n_spans: int, n_vertices: int):
+    network = NetworkDescription(id="bench-network", name="Benchmark Network")
+    spans = []
+    for i in range(n_spans):
+        points = [
+            QgsPointXY(-4.25 + j * 0.0001, 55.86 + math.sin(i + j * 0.01) * 0.01)
+            for j in range(n_vertices)
+        ]
+        spans.append(
+            Span(
+                _id=str(i),
+                properties={
+                    "id": str(i),
+                    "name": f"Span {i}",
+                    "start": {"id": f"{i}-start"},
+                    "end": {"id": f"{i}-end"},
+                    "network": network.to_network_object(),
+                },
+                featureId=i,
+                featureGeometry=QgsGeometry.fromPolylineXY(points),
+                ofds_network=network,
+            )
+        )
+    return spans
+
+
+def write_geojson_via_asjson(fh, features):
+    """The previous implementation, kept here as the baseline."""
+    geojson_features = [
+        {
+            "type": "Feature",
+            "properties": feat.properties.copy(),
+            "geometry": json.loads(feat.featureGeometry.asJson()),
+        }
+        for feat in features
+    ]
+    json.dump(
+        obj={"type": "FeatureCollection", "features": geojson_features},
+        fp=fh,
+        cls=QVariantJSONEncoder,
+        indent=4,
+    )
+
+
+def main():
+    spans = make_spans(N_SPANS, N_VERTICES)
+    print(f"{N_SPANS} spans x {N_VERTICES} vertices, best of {REPEATS}")
+
+    cases = [
+        ("json.loads(asJson())", lambda: write_geojson_via_asjson(io.StringIO(), spans)),
+        ("vertex encoder", lambda: write_geojson_from_features(io.StringIO(), spans)),
+        (
+            "vertex encoder, precision=6",
+            lambda: write_geojson_from_features(io.StringIO(), spans, precision=6),
+        ),
+    ]
+
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=1, repeat=REPEATS))
+        print(f"{name:>30}: {best:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
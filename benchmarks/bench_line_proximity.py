@@ -0,0 +1,59 @@
+"""
+Benchmark scoring the line proximity of long, many-vertex Spans, comparing
+resampling each Span for every comparison with the cached resampled lines.
+
+Run from the repository root, with the QGIS python libraries on PYTHONPATH:
+
+    python -m benchmarks.bench_line_proximity
+"""
+import timeit
+
+from benchmarks.bench_geojson_geometry import make_spans
+from tool.model.line_proximity import (
+    ResampledLineCache,
+    line_proximity_score,
+    np,
+    resample_line,
+)
+
+N_SPANS = 200
+N_VERTICES = 5000
+REPEATS = 3
+
+
+def score_all_pairs_uncached(spans):
+    for span_a in spans:
+        for span_b in spans:
+            line_proximity_score(
+                resample_line(span_a.featureGeometry),
+                resample_line(span_b.featureGeometry),
+            )
+
+
+def score_all_pairs_cached(spans):
+    cache = ResampledLineCache()
+    for span_a in spans:
+        for span_b in spans:
+            line_proximity_score(cache.get(span_a), cache.get(span_b))
+
+
+def main():
+    spans = make_spans(N_SPANS, N_VERTICES)
+    backend = "numpy" if np is not None else "pure python"
+    print(
+        f"{N_SPANS}x{N_SPANS} span comparisons, {N_VERTICES} vertices each, "
+        + f"using {backend}, best of {REPEATS}"
+    )
+
+    cases = [
+        ("resample every comparison", lambda: score_all_pairs_uncached(spans)),
+        ("cached resampled lines", lambda: score_all_pairs_cached(spans)),
+    ]
+
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=1, repeat=REPEATS))
+        print(f"{name:>30}: {best:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark merging Span properties, comparing interpreting the merge config on every
+merge with running the precompiled merge plan.
+
+Run from the repository root, with the QGIS python libraries on PYTHONPATH:
+
+    python -m benchmarks.bench_property_merge
+"""
+import timeit
+
+from qgis.core import QgsGeometry, QgsPointXY
+
+from tool.model.network import NetworkDescription, Span
+from tool.model.properties import (
+    SPANS_PROPERTIES_MERGE_CONFIG,
+    SPANS_PROPERTIES_MERGE_PLAN,
+    PropMergeOp,
+    get_prop,
+    set_prop,
+)
+
+N_MERGES = 20000
+REPEATS = 3
+
+
+def make_span(i: int, network: NetworkDescription) -> Span:
+    return Span(
+        _id=str(i),
+        properties={
+            "id": str(i),
+            "name": f"Span {i}",
+            "status": "operational",
+            "fibreType": "G.652",
+            "fibreTypeDetails": {"fibreSubType": "G.652.D", "description": f"F{i}"},
+            "deploymentDetails": {"description": f"Buried {i}"},
+            "capacityDetails": {"description": f"Capacity {i}"},
+            "transmissionMedium": ["fibre"],
+            "deployment": ["belowGround"],
+            "countries": ["GB"],
+            "capacity": 10,
+            "networkProviders": [{"name": f"Provider {i}"}],
+            "start": {"id": f"{i}-start"},
+            "end": {"id": f"{i}-end"},
+            "network": network.to_network_object(),
+        },
+        featureId=i,
+        featureGeometry=QgsGeometry.fromPolylineXY(
+            [QgsPointXY(0, 0), QgsPointXY(1, 1)]
+        ),
+        ofds_network=network,
+    )
+
+
+def merge_by_interpreting_config(props_config, primary, secondary):
+    """The previous implementation, kept here as the baseline."""
+    props = primary.properties.copy()
+
+    for k, op in props_config:
+        prop_a = get_prop(primary.properties, k)
+        prop_b = get_prop(secondary.properties, k)
+
+        if not prop_a and not prop_b:
+            continue
+
+        if op == PropMergeOp.KEEP_OR_COPY:
+            if prop_a:
+                set_prop(props, k, prop_a)
+            elif prop_b:
+                set_prop(props, k, prop_b)
+        elif op == PropMergeOp.CONCAT_ARRAY:
+            new_array = list()
+            new_array.extend(prop_a or [])
+            new_array.extend(prop_b or [])
+            set_prop(props, k, new_array)
+        elif op == PropMergeOp.MERGE_ARRAY:
+            set_prop(props, k, list(set().union(prop_a or []).union(prop_b or [])))
+        elif op == PropMergeOp.SUM_NUMBER:
+            if prop_a is not None or prop_b is not None:
+                set_prop(props, k, (prop_a or 0) + (prop_b or 0))
+        elif op == PropMergeOp.CONCAT_DESCRIPTION:
+            if prop_a is not None and prop_b is not None:
+                strs = list(set([s for s in [prop_a, prop_b] if s]))
+                set_prop(props, k, ", ".join(strs))
+
+    return props
+
+
+def main():
+    network = NetworkDescription(id="bench-network", name="Benchmark Network")
+    primary = make_span(1, network)
+    secondary = make_span(2, network)
+    print(f"{N_MERGES} Span merges, best of {REPEATS}")
+
+    cases = [
+        (
+            "interpret config",
+            lambda: merge_by_interpreting_config(
+                SPANS_PROPERTIES_MERGE_CONFIG, primary, secondary
+            ),
+        ),
+        (
+            "compiled plan",
+            lambda: SPANS_PROPERTIES_MERGE_PLAN.merge(primary, secondary),
+        ),
+    ]
+
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=N_MERGES, repeat=REPEATS))
+        print(f"{name:>20}: {N_MERGES / best:,.0f} merges/s")
+
+
+if __name__ == "__main__":
+    main()
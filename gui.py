@@ -28,6 +28,12 @@ class Ui_OFDSDedupToolDialog(object):
         self.startButton = QtWidgets.QPushButton(self.tabSelectInput)
         self.startButton.setObjectName("startButton")
         self.gridLayout_3.addWidget(self.startButton, 6, 1, 1, 1)
+        self.loadRunButton = QtWidgets.QPushButton(self.tabSelectInput)
+        self.loadRunButton.setObjectName("loadRunButton")
+        self.gridLayout_3.addWidget(self.loadRunButton, 6, 0, 1, 1)
+        self.addLayersButton = QtWidgets.QPushButton(self.tabSelectInput)
+        self.addLayersButton.setObjectName("addLayersButton")
+        self.gridLayout_3.addWidget(self.addLayersButton, 2, 0, 1, 1)
         self.inputSelectionLabel = QtWidgets.QLabel(self.tabSelectInput)
         self.inputSelectionLabel.setObjectName("inputSelectionLabel")
         self.gridLayout_3.addWidget(self.inputSelectionLabel, 0, 0, 1, 1)
@@ -129,6 +135,12 @@ class Ui_OFDSDedupToolDialog(object):
         self.comparisonProgressBar.setProperty("value", 0)
         self.comparisonProgressBar.setObjectName("comparisonProgressBar")
         self.nodesProgressLayout.addWidget(self.comparisonProgressBar)
+        self.acceptAboveNodesButton = QtWidgets.QPushButton(self.tabConsolidateNodes)
+        self.acceptAboveNodesButton.setObjectName("acceptAboveNodesButton")
+        self.nodesProgressLayout.addWidget(self.acceptAboveNodesButton)
+        self.rejectBelowNodesButton = QtWidgets.QPushButton(self.tabConsolidateNodes)
+        self.rejectBelowNodesButton.setObjectName("rejectBelowNodesButton")
+        self.nodesProgressLayout.addWidget(self.rejectBelowNodesButton)
         self.finishedNodesButton = QtWidgets.QPushButton(self.tabConsolidateNodes)
         self.finishedNodesButton.setObjectName("finishedNodesButton")
         self.nodesProgressLayout.addWidget(self.finishedNodesButton)
@@ -199,6 +211,12 @@ class Ui_OFDSDedupToolDialog(object):
         self.spansComparisonProgressBar.setProperty("value", 0)
         self.spansComparisonProgressBar.setObjectName("spansComparisonProgressBar")
         self.spansProgressLayout.addWidget(self.spansComparisonProgressBar)
+        self.spansAcceptAboveButton = QtWidgets.QPushButton(self.tabConsolidateSpans)
+        self.spansAcceptAboveButton.setObjectName("spansAcceptAboveButton")
+        self.spansProgressLayout.addWidget(self.spansAcceptAboveButton)
+        self.spansRejectBelowButton = QtWidgets.QPushButton(self.tabConsolidateSpans)
+        self.spansRejectBelowButton.setObjectName("spansRejectBelowButton")
+        self.spansProgressLayout.addWidget(self.spansRejectBelowButton)
         self.spansFinishedButton = QtWidgets.QPushButton(self.tabConsolidateSpans)
         self.spansFinishedButton.setObjectName("spansFinishedButton")
         self.spansProgressLayout.addWidget(self.spansFinishedButton)
@@ -274,6 +292,21 @@ class Ui_OFDSDedupToolDialog(object):
         self.outputSaveSpans = QtWidgets.QPushButton(self.tabOutput)
         self.outputSaveSpans.setGeometry(QtCore.QRect(150, 840, 221, 36))
         self.outputSaveSpans.setObjectName("outputSaveSpans")
+        self.outputSavePackage = QtWidgets.QPushButton(self.tabOutput)
+        self.outputSavePackage.setGeometry(QtCore.QRect(400, 790, 221, 36))
+        self.outputSavePackage.setObjectName("outputSavePackage")
+        self.outputSaveAll = QtWidgets.QPushButton(self.tabOutput)
+        self.outputSaveAll.setGeometry(QtCore.QRect(400, 840, 221, 36))
+        self.outputSaveAll.setObjectName("outputSaveAll")
+        self.outputSaveDelta = QtWidgets.QPushButton(self.tabOutput)
+        self.outputSaveDelta.setGeometry(QtCore.QRect(10, 790, 131, 36))
+        self.outputSaveDelta.setObjectName("outputSaveDelta")
+        self.outputSaveRun = QtWidgets.QPushButton(self.tabOutput)
+        self.outputSaveRun.setGeometry(QtCore.QRect(10, 840, 131, 36))
+        self.outputSaveRun.setObjectName("outputSaveRun")
+        self.outputSharedMetadata = QtWidgets.QCheckBox(self.tabOutput)
+        self.outputSharedMetadata.setGeometry(QtCore.QRect(630, 790, 291, 24))
+        self.outputSharedMetadata.setObjectName("outputSharedMetadata")
         self.tabWidget.addTab(self.tabOutput, "")
         self.verticalLayout.addWidget(self.tabWidget)
 
@@ -286,6 +319,8 @@ class Ui_OFDSDedupToolDialog(object):
         _translate = QtCore.QCoreApplication.translate
         OFDSDedupToolDialog.setWindowTitle(_translate("OFDSDedupToolDialog", "OFDS Consolidation Tool"))
         self.startButton.setText(_translate("OFDSDedupToolDialog", "Start"))
+        self.loadRunButton.setText(_translate("OFDSDedupToolDialog", "Load Previous Run..."))
+        self.addLayersButton.setText(_translate("OFDSDedupToolDialog", "Add Layers From Files..."))
         self.inputSelectionLabel.setText(_translate("OFDSDedupToolDialog", "Input Selection"))
         self.groupBoxA.setTitle(_translate("OFDSDedupToolDialog", "Primary Network"))
         self.nodesLabelA.setText(_translate("OFDSDedupToolDialog", "Nodes"))
@@ -302,6 +337,8 @@ class Ui_OFDSDedupToolDialog(object):
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tabSelectInput), _translate("OFDSDedupToolDialog", "Select Input"))
         self.comparisonLabel.setText(_translate("OFDSDedupToolDialog", "Node Comparisons"))
         self.comparisonProgressBar.setFormat(_translate("OFDSDedupToolDialog", "%v of %m"))
+        self.acceptAboveNodesButton.setText(_translate("OFDSDedupToolDialog", "Consolidate Above..."))
+        self.rejectBelowNodesButton.setText(_translate("OFDSDedupToolDialog", "Keep Below..."))
         self.finishedNodesButton.setText(_translate("OFDSDedupToolDialog", "Finish"))
         self.label_3.setText(_translate("OFDSDedupToolDialog", "Primary Node"))
         self.label_2.setText(_translate("OFDSDedupToolDialog", "Secondary Node"))
@@ -312,6 +349,8 @@ class Ui_OFDSDedupToolDialog(object):
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tabConsolidateNodes), _translate("OFDSDedupToolDialog", "Consolidate Nodes"))
         self.spansComparisonLabel.setText(_translate("OFDSDedupToolDialog", "Span Comparisons"))
         self.spansComparisonProgressBar.setFormat(_translate("OFDSDedupToolDialog", "%v of %m"))
+        self.spansAcceptAboveButton.setText(_translate("OFDSDedupToolDialog", "Consolidate Above..."))
+        self.spansRejectBelowButton.setText(_translate("OFDSDedupToolDialog", "Keep Below..."))
         self.spansFinishedButton.setText(_translate("OFDSDedupToolDialog", "Finish"))
         self.label_4.setText(_translate("OFDSDedupToolDialog", "Span A"))
         self.label_5.setText(_translate("OFDSDedupToolDialog", "Span B"))
@@ -321,7 +360,13 @@ class Ui_OFDSDedupToolDialog(object):
         self.spansNotSameButton.setText(_translate("OFDSDedupToolDialog", "Keep Both"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tabConsolidateSpans), _translate("OFDSDedupToolDialog", "Consolidate Spans"))
         self.outputFinishedButton.setText(_translate("OFDSDedupToolDialog", "Close"))
-        self.outputSaveNodes.setText(_translate("OFDSDedupToolDialog", "Save Nodes GeoJSON"))
-        self.outputSaveSpans.setText(_translate("OFDSDedupToolDialog", "Save Spans GeoJSON"))
+        self.outputSaveNodes.setText(_translate("OFDSDedupToolDialog", "Save Nodes..."))
+        self.outputSaveSpans.setText(_translate("OFDSDedupToolDialog", "Save Spans..."))
+        self.outputSavePackage.setText(_translate("OFDSDedupToolDialog", "Save OFDS JSON..."))
+        self.outputSaveAll.setText(_translate("OFDSDedupToolDialog", "Save All..."))
+        self.outputSaveDelta.setText(_translate("OFDSDedupToolDialog", "Export Delta..."))
+        self.outputSaveRun.setText(_translate("OFDSDedupToolDialog", "Save Run..."))
+        self.outputSharedMetadata.setToolTip(_translate("OFDSDedupToolDialog", "Write the network object and provenance timestamp once per GeoJSON file, instead of on every feature. Features in these files aren't valid OFDS on their own, and can't be used as input layers."))
+        self.outputSharedMetadata.setText(_translate("OFDSDedupToolDialog", "Write network metadata once per file"))
         self.tabWidget.setTabText(self.tabWidget.indexOf(self.tabOutput), _translate("OFDSDedupToolDialog", "Output"))
 from qgis import gui
@@ -0,0 +1,36 @@
+from tool.model.assignment import assign_one_to_one
+
+
+def _assign(edges):
+    return assign_one_to_one(
+        edges,
+        key_a=lambda e: e[0],
+        key_b=lambda e: e[1],
+        weight=lambda e: e[2],
+    )
+
+
+def test_assign_one_to_one():
+    edges = [
+        ("a1", "b1", 95),
+        ("a1", "b2", 99),
+        ("a2", "b2", 97),
+        ("a2", "b3", 96),
+        ("a3", "b4", 91),
+    ]
+
+    matches = _assign(edges)
+
+    assert sorted(matches) == [
+        ("a1", "b2", 99),
+        ("a2", "b3", 96),
+        ("a3", "b4", 91),
+    ]
+
+    # No feature is matched more than once
+    assert len(set(a for a, _, _ in matches)) == len(matches)
+    assert len(set(b for _, b, _ in matches)) == len(matches)
+
+
+def test_assign_one_to_one_empty():
+    assert _assign([]) == []
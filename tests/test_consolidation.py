@@ -1,19 +1,57 @@
+import dataclasses
+import io
+import json
 import logging
 from pathlib import Path
 from tempfile import TemporaryDirectory
+from types import SimpleNamespace
 from typing import Tuple
 
-from qgis.core import QgsVectorLayer
+import pytest
+from qgis.core import QgsGeometry, QgsPointXY, QgsVectorLayer
 
 from tool.model.comparison import (
     ConsolidationReason,
     NodeComparisonOutcome,
     SpanComparisonOutcome,
 )
-from tool.model.consolidation import NetworkNodesConsolidator, NetworkSpansConsolidator
-from tool.model.network import Network
+from tool.model.consolidation import (
+    NetworkNodesConsolidator,
+    NetworkSpansConsolidator,
+    bulk_consolidate_above,
+    bulk_keep_below,
+    remap_spans_node_ids,
+    review_priority,
+)
+from tool.model.decisions import RunRecord, read_run_record, write_run_record
+from tool.model.delta import compute_feature_delta, export_delta
+from tool.model.journal import (
+    STAGE_NODES,
+    STAGE_SPANS,
+    JournalHeader,
+    ReviewJournal,
+    ScoredPair,
+    network_fingerprint,
+    read_review_journal,
+)
+from tool.model.multi_consolidation import MultiNetworkConsolidator
+from tool.model.score_cache import ScoreCache
+from tool.model.export import (
+    ExportFormat,
+    write_features_file,
+    write_ofds_json_package,
+)
+from tool.model.network import (
+    Network,
+    NetworkDescription,
+    Node,
+    OFDSInvalidFeature,
+    Span,
+)
+from tool.model.settings import Settings
+from tool.viewmodel import state as tool_state
 from .. import setup_logging
-from ..tool.model.qgis_utils import write_geojson_from_features
+from ..tool.model.qgis_utils import load_geojson_layer, write_geojson_from_features
 
 # QgsApplication.setPrefixPath("/usr")  # for Linux?
 
@@ -55,8 +93,11 @@ def load_test_networks(request) -> Tuple[Network, Network]:
     return network_a, network_b
 
 
-# noinspection PyUnusedLocal
-def test_consolidation(qgis_app, qgis_new_project, request):
+def consolidate_test_networks(request) -> Tuple[NetworkNodesConsolidator, Network]:
+    """
+    Consolidate the test networks, as if the user pressed Same on every comparison.
+    Returns the Nodes stage's consolidator, and the consolidated network.
+    """
     network_a, network_b = load_test_networks(request)
 
     # Test Nodes Consolidation
@@ -96,7 +137,8 @@ def test_consolidation(qgis_app, qgis_new_project, request):
 
     # Test Spans Consolidation
     nsc = NetworkSpansConsolidator(
-        network_a_consolidated_nodes, network_b_consolidated_nodes, new_ofds_network=nnc.new_ofds_network
+        network_a_consolidated_nodes, network_b_consolidated_nodes, new_ofds_network=nnc.new_ofds_network,
+        ledger=nnc.ledger,
     )
 
     span_comparisons = nsc.get_comparisons_to_ask_user()
@@ -121,6 +163,16 @@ def test_consolidation(qgis_app, qgis_new_project, request):
     consolidated_network = nsc.get_consolidated_network_from_outcomes(
         span_comparison_outcomes
     )
+    return nnc, consolidated_network
+
+
+# noinspection PyUnusedLocal
+def test_consolidation(qgis_app, qgis_new_project, request):
+    nnc, consolidated_network = consolidate_test_networks(request)
+
+    # The whole run is recorded in the Nodes stage's ledger
+    assert len(nnc.ledger.merges_of("SPAN")) == 2
+    assert len(nnc.ledger) == len(nnc.ledger.merges_of("NODE")) + 2
 
     # Numbers based on test data layers
 
@@ -176,3 +228,594 @@ def test_consolidation(qgis_app, qgis_new_project, request):
 
         assert nodes_geojson.stat().st_size > 100
         assert spans_geojson.stat().st_size > 100
+
+
+# noinspection PyUnusedLocal
+def test_export_ogr(qgis_app, qgis_new_project, request):
+    _, consolidated_network = consolidate_test_networks(request)
+    node_ids = set(n.id for n in consolidated_network.nodes)
+
+    with TemporaryDirectory() as td:
+        for export_format in [ExportFormat.GEOPACKAGE, ExportFormat.FLATGEOBUF]:
+            nodes_path = Path(td, f"nodes.{export_format.file_extension}")
+            spans_path = Path(td, f"spans.{export_format.file_extension}")
+
+            write_features_file(nodes_path, consolidated_network.nodes, Node, export_format)
+            write_features_file(spans_path, consolidated_network.spans, Span, export_format)
+
+            nodes_layer = QgsVectorLayer(nodes_path.as_posix(), "nodes", "ogr")
+            spans_layer = QgsVectorLayer(spans_path.as_posix(), "spans", "ogr")
+
+            # Nested properties are stored as JSON, and load back in as objects
+            reloaded_nodes = [Node.from_qgis_feature(f) for f in nodes_layer.getFeatures()]
+            reloaded_spans = [Span.from_qgis_feature(f) for f in spans_layer.getFeatures()]
+            assert len(reloaded_nodes) == 5
+            assert len(reloaded_spans) == 4
+            assert set(s.start_id for s in reloaded_spans) <= node_ids
+
+
+# noinspection PyUnusedLocal
+def test_export_ofds_package(qgis_app, qgis_new_project, request):
+    _, consolidated_network = consolidate_test_networks(request)
+    node_ids = set(n.id for n in consolidated_network.nodes)
+
+    with TemporaryDirectory() as td:
+        package_json = Path(td, "network.json")
+        with package_json.open("w") as f:
+            write_ofds_json_package(f, consolidated_network)
+
+        with package_json.open() as f:
+            package = json.load(f)
+
+    assert len(package["networks"]) == 1
+    package_network = package["networks"][0]
+    assert package_network["id"] == consolidated_network.ofds_network.id
+    assert len(package_network["nodes"]) == 5
+    assert len(package_network["spans"]) == 4
+    assert all("network" not in n for n in package_network["nodes"])
+    assert all(s["start"] in node_ids and s["end"] in node_ids for s in package_network["spans"])
+
+
+# noinspection PyUnusedLocal
+def test_compressed_geojson(qgis_app, qgis_new_project, request):
+    _, consolidated_network = consolidate_test_networks(request)
+
+    with TemporaryDirectory() as td:
+        nodes_geojson = Path(td, "nodes.geojson")
+        write_features_file(nodes_geojson, consolidated_network.nodes, Node, ExportFormat.GEOJSON)
+
+        nodes_gzip = Path(td, "nodes.geojson.gz")
+        write_features_file(nodes_gzip, consolidated_network.nodes, Node, ExportFormat.GEOJSON_GZIP)
+        assert nodes_gzip.stat().st_size < nodes_geojson.stat().st_size
+        assert len(list(load_geojson_layer(nodes_gzip, "nodes").getFeatures())) == 5
+
+
+# noinspection PyUnusedLocal
+def test_delta_export(qgis_app, qgis_new_project, request):
+    _, consolidated_network = consolidate_test_networks(request)
+
+    with TemporaryDirectory() as td:
+        nodes_geojson = Path(td, "nodes.geojson")
+        spans_geojson = Path(td, "spans.geojson")
+
+        with nodes_geojson.open("w") as f:
+            write_geojson_from_features(f, consolidated_network.nodes)
+
+        with spans_geojson.open("w") as f:
+            write_geojson_from_features(f, consolidated_network.spans)
+
+        # Against its own output, the delta only has the span that's been dropped
+        manifest = export_delta(
+            Path(td, "delta"),
+            previous_nodes_path=nodes_geojson,
+            previous_spans_path=spans_geojson,
+            nodes=consolidated_network.nodes,
+            spans=consolidated_network.spans[1:],
+        )
+    assert manifest["nodes"]["counts"] == {
+        "added": 0, "changed": 0, "removed": 0, "unchanged": 5
+    }
+    assert manifest["spans"]["counts"]["removed"] == 1
+    assert manifest["spans"]["counts"]["unchanged"] == 3
+
+
+# noinspection PyUnusedLocal
+def test_multi_network_consolidation(qgis_app, qgis_new_project, request):
+    network_a, network_b = load_test_networks(request)
+
+    consolidator = MultiNetworkConsolidator(
+        [network_a, network_b], merge_above=0, match_radius_km=10
+    )
+    consolidated_network = consolidator.get_consolidated_network()
+
+    # Some nodes are merged, and each merged node has at most one node per network
+    assert 4 <= len(consolidated_network.nodes) < 8
+    for node in consolidated_network.nodes:
+        derived_from = node.properties["provenance"]["wasDerivedFrom"]
+        assert len(derived_from) <= 2
+
+    # All spans link to consolidated nodes
+    node_ids = set(n.id for n in consolidated_network.nodes)
+    assert len(node_ids) == len(consolidated_network.nodes)
+    for span in consolidated_network.spans:
+        assert span.start_id in node_ids
+        assert span.end_id in node_ids
+
+
+def _load_network(directory, network_id, nodes, spans) -> Network:
+    """
+    Write a network to GeoJSON files in directory and load it, given its nodes as
+    {name: (x, y)} and its spans as {name: (start node name, end node name,
+    coordinates)}. Features' IDs are their names prefixed by the network ID.
+    """
+    network = {"id": network_id, "name": f"Network {network_id}"}
+    node_features = [
+        {
+            "type": "Feature",
+            "properties": {
+                "id": f"{network_id}-{name}",
+                "name": name,
+                "status": "operational",
+                "phase": {"name": "Phase 1"},
+                "network": network,
+            },
+            "geometry": {"type": "Point", "coordinates": list(coordinates)},
+        }
+        for name, coordinates in nodes.items()
+    ]
+    span_features = [
+        {
+            "type": "Feature",
+            "properties": {
+                "id": f"{network_id}-{name}",
+                "name": name,
+                "start": {"id": f"{network_id}-{start}"},
+                "end": {"id": f"{network_id}-{end}"},
+                "network": network,
+            },
+            "geometry": {"type": "LineString", "coordinates": coordinates},
+        }
+        for name, (start, end, coordinates) in spans.items()
+    ]
+
+    layers = []
+    for kind, features in [("nodes", node_features), ("spans", span_features)]:
+        path = Path(directory, f"{network_id}_{kind}.geojson")
+        path.write_text(json.dumps({"type": "FeatureCollection", "features": features}))
+        layers.append(QgsVectorLayer(f"GeoJSON:{path.as_posix()}", kind, "ogr"))
+    return Network.from_qgs_vectorlayers(*layers, network_id)
+
+
+# noinspection PyUnusedLocal
+def test_multi_network_parallel_spans(qgis_app, qgis_new_project):
+    # Two parallel routes between the same pair of nodes, taking different ways
+    routes = {"Coast": 55.3, "Ridge": 54.7}
+
+    def _network(directory, network_id, route_names):
+        return _load_network(
+            directory,
+            network_id,
+            {"West": (-4.0, 55.0), "East": (-3.0, 55.0)},
+            {
+                name: ("West", "East", [[-4.0, 55.0], [-3.5, routes[name]], [-3.0, 55.0]])
+                for name in route_names
+            },
+        )
+
+    with TemporaryDirectory() as td:
+        # The spans are listed in a different order in each network
+        network_a = _network(td, "a", ["Coast", "Ridge"])
+        network_b = _network(td, "b", ["Ridge", "Coast"])
+
+        consolidator = MultiNetworkConsolidator(
+            [network_a, network_b], merge_above=15, match_radius_km=10
+        )
+        consolidated_network = consolidator.get_consolidated_network()
+
+    assert len(consolidated_network.nodes) == 2
+
+    # Each route is merged with the same route from the other network
+    derived_from = sorted(
+        sorted(span.properties["provenance"]["wasDerivedFrom"])
+        for span in consolidated_network.spans
+    )
+    assert derived_from == [["a-Coast", "b-Coast"], ["a-Ridge", "b-Ridge"]]
+
+
+# noinspection PyUnusedLocal
+def test_spans_compared_by_route(qgis_app, qgis_new_project):
+    nodes = {"West": (-4.0, 55.0), "East": (-3.0, 55.0), "North": (-3.5, 55.5)}
+
+    with TemporaryDirectory() as td:
+        network_a = _load_network(
+            td, "a", nodes, {"Main": ("West", "East", [[-4.0, 55.0], [-3.0, 55.0]])}
+        )
+        # None of the spans are between the same Nodes as Network A's, as the Nodes
+        # haven't been consolidated
+        network_b = _load_network(
+            td,
+            "b",
+            nodes,
+            {
+                # About 20m from Network A's span
+                "Near": ("West", "East", [[-4.0, 55.0002], [-3.0, 55.0002]]),
+                # About 1km from Network A's span
+                "Far": ("West", "East", [[-4.0, 55.01], [-3.0, 55.01]]),
+                # Follows Network A's span half way, then turns off
+                "Branch": (
+                    "West",
+                    "North",
+                    [[-4.0, 55.0], [-3.5, 55.0], [-3.5, 55.5]],
+                ),
+            },
+        )
+
+        nsc = NetworkSpansConsolidator(
+            network_a,
+            network_b,
+            new_ofds_network=NetworkDescription(id="ab", name="A + B"),
+            match_distance_km=0.05,
+        )
+        comparisons = nsc.get_comparisons_to_ask_user()
+
+    # Only the span within match_distance_km of Network A's all along is compared
+    assert [(c.span_a.id, c.span_b.id) for c in comparisons] == [("a-Main", "b-Near")]
+
+
+# noinspection PyUnusedLocal
+def test_incremental_node_consolidation(qgis_app, qgis_new_project, request):
+    network_a, network_b = load_test_networks(request)
+
+    nnc = NetworkNodesConsolidator(
+        network_a, network_b, merge_above=100, ask_above=0, match_radius_km=10
+    )
+    node_comparisons = nnc.get_comparisons_to_ask_user()
+    nnc.add_comparison_outcomes(
+        NodeComparisonOutcome(comparison=comparison, consolidate=False)
+        for comparison in node_comparisons
+    )
+
+    with TemporaryDirectory() as td:
+        record_path = Path(td, "run.json")
+        write_run_record(
+            record_path,
+            RunRecord(
+                network_a_id=network_a.ofds_network.id,
+                network_b_id=network_b.ofds_network.id,
+                settings={},
+                nodes=nnc.stage_record(),
+            ),
+        )
+        previous = read_run_record(record_path).nodes
+
+    # Nothing has changed, so the same pairs are compared and every decision reused
+    rerun = NetworkNodesConsolidator(
+        network_a,
+        network_b,
+        merge_above=100,
+        ask_above=0,
+        match_radius_km=10,
+        previous=previous,
+    )
+    assert set(rerun.compared_pairs) == set(nnc.compared_pairs)
+
+    rerun_comparisons = rerun.get_comparisons_to_ask_user()
+    assert len(rerun_comparisons) == len(node_comparisons)
+    for comparison in rerun_comparisons:
+        outcome = rerun.previous_outcome(comparison)
+        assert outcome is not None
+        assert outcome.consolidate is False
+
+
+# noinspection PyUnusedLocal
+def test_cached_scores(qgis_app, qgis_new_project, request):
+    network_a, network_b = load_test_networks(request)
+    score_cache = ScoreCache()
+
+    first = NetworkNodesConsolidator(
+        network_a, network_b, match_radius_km=10, score_cache=score_cache
+    )
+    assert score_cache.hits == 0
+
+    # Only the thresholds have changed, so every score comes from the cache
+    second = NetworkNodesConsolidator(
+        network_a,
+        network_b,
+        merge_above=90,
+        match_radius_km=10,
+        score_cache=score_cache,
+    )
+    assert score_cache.hits == score_cache.misses > 0
+    assert set(second.compared_pairs) == set(first.compared_pairs)
+
+
+# noinspection PyUnusedLocal
+def test_deferred_node_scoring(qgis_app, qgis_new_project, request):
+    network_a, network_b = load_test_networks(request)
+
+    nnc = NetworkNodesConsolidator(network_a, network_b, match_radius_km=10)
+
+    deferred = NetworkNodesConsolidator(
+        network_a, network_b, match_radius_km=10, defer_scoring=True
+    )
+    assert deferred.get_comparisons_to_ask_user() == []
+
+    streamed = list(deferred.score_candidates())
+    deferred.finish_scoring()
+
+    # Scoring in batches finds the same matches as scoring up front
+    assert set(deferred.compared_pairs) == set(nnc.compared_pairs)
+    assert [
+        (c.feature_a.id, c.feature_b.id)
+        for c in sorted(deferred.without_consolidated(streamed), key=review_priority)
+    ] == [(c.feature_a.id, c.feature_b.id) for c in nnc.get_comparisons_to_ask_user()]
+
+
+# noinspection PyUnusedLocal
+def test_review_journal(qgis_app, qgis_new_project, request):
+    network_a, network_b = load_test_networks(request)
+
+    nnc = NetworkNodesConsolidator(network_a, network_b, match_radius_km=10)
+    asked = nnc.get_comparisons_to_ask_user()
+    assert len(asked) > 0
+
+    def _scored(c):
+        return ScoredPair(c.node_a.id, c.node_b.id, c.scores, c.distance_km)
+
+    header = JournalHeader(
+        network_a_id=network_a.ofds_network.id,
+        network_b_id=network_b.ofds_network.id,
+        settings={},
+        fingerprint_a=network_fingerprint(network_a),
+        fingerprint_b=network_fingerprint(network_b),
+    )
+
+    with TemporaryDirectory() as td:
+        path = Path(td, "review.jsonl")
+        journal = ReviewJournal(path, header, resume=False)
+        journal.record_comparisons(
+            STAGE_NODES,
+            [_scored(c) for c in asked],
+            [_scored(c) for c in nnc.merge_candidates],
+        )
+        journal.record_decision(STAGE_NODES, asked[0].node_a.id, asked[0].node_b.id, True)
+        journal.flush()
+
+        # An incomplete line, e.g. from QGIS being closed part way through writing it
+        with path.open("a", encoding="utf-8") as f:
+            f.write('{"type":"decis')
+
+        contents = read_review_journal(path)
+
+        # Resuming drops the incomplete line before carrying on
+        ReviewJournal(path, header, resume=True).close()
+        assert read_review_journal(path) == contents
+
+    assert contents.header == header
+    nodes = contents.stage(STAGE_NODES)
+    assert nodes.decisions == {(asked[0].node_a.id, asked[0].node_b.id): True}
+
+    # The comparisons are restored without scoring them again
+    restored = NetworkNodesConsolidator(
+        network_a, network_b, match_radius_km=10, defer_scoring=True
+    )
+    restored_asked = restored.restore_scoring(nodes.asked, nodes.merged)
+    restored.finish_scoring()
+    assert set(restored.compared_pairs) == set(nnc.compared_pairs)
+    assert [(c.node_a.id, c.node_b.id, c.confidence) for c in restored_asked] == [
+        (c.node_a.id, c.node_b.id, c.confidence) for c in asked
+    ]
+
+
+# noinspection PyUnusedLocal
+def test_resume_review_after_cancelled_scoring(
+        qgis_app, qgis_new_project, request, monkeypatch
+):
+    network_a, network_b = load_test_networks(request)
+    # Every match is auto-consolidated, so none are lost only if they're journaled
+    settings = Settings(
+        nodes_merge_threshold=0, nodes_ask_threshold=0, nodes_match_radius_km=10
+    )
+
+    # Run tasks by hand rather than in the background, and don't ask the user
+    tasks = []
+    monkeypatch.setattr(
+        tool_state,
+        "QgsApplication",
+        SimpleNamespace(taskManager=lambda: SimpleNamespace(addTask=tasks.append)),
+    )
+    monkeypatch.setattr(tool_state, "get_score_cache", lambda: ScoreCache())
+    monkeypatch.setattr(tool_state, "show_warningbox", lambda *args: True)
+
+    def _consolidated_node_ids(state):
+        if isinstance(state, tool_state.ToolOutputState):
+            return sorted(n.id for n in state.output_network.nodes)
+        return sorted(n.id for n in state.networks[0].nodes)
+
+    with TemporaryDirectory() as td:
+        path = Path(td, "review.jsonl")
+        monkeypatch.setattr(tool_state, "get_review_journal_path", lambda a, b: path)
+
+        nodes_state = tool_state.ToolLayerSelectState([]).startComparing(
+            (network_a, network_b), settings
+        )
+        assert isinstance(nodes_state, tool_state.ToolNodeComparisonState)
+        assert tasks == [nodes_state.scoringTask]
+
+        # Comparing nodes is cancelled, after some matches have been found
+        task = nodes_state.scoringTask
+        task.run()
+        task.finished(False)
+        assert not nodes_state.scoring
+        assert len(nodes_state.consolidator.merge_candidates) > 0
+
+        spans_state = nodes_state.toSpanComparison()
+        consolidated_node_ids = _consolidated_node_ids(spans_state)
+        assert len(consolidated_node_ids) < len(network_a.nodes) + len(network_b.nodes)
+        spans_state.close()
+
+        contents = read_review_journal(path)
+        assert contents.stage(STAGE_NODES).finished
+        assert contents.stage(STAGE_NODES).asked is not None
+
+        # The nodes found before cancelling are consolidated again when resuming,
+        # without comparing them again
+        resumed = tool_state.ToolLayerSelectState([]).startComparing(
+            (network_a, network_b), settings
+        )
+        assert not isinstance(resumed, tool_state.ToolNodeComparisonState)
+        assert len(tasks) == 1
+        assert _consolidated_node_ids(resumed) == consolidated_node_ids
+        resumed.close()
+
+        # A journal of a finished review, but without the node comparisons, is
+        # resumed from comparing nodes
+        header = JournalHeader(
+            network_a_id=network_a.ofds_network.id,
+            network_b_id=network_b.ofds_network.id,
+            settings=dataclasses.asdict(settings),
+            fingerprint_a=network_fingerprint(network_a),
+            fingerprint_b=network_fingerprint(network_b),
+        )
+        journal = ReviewJournal(path, header, resume=False)
+        journal.record_finished(STAGE_NODES)
+        journal.record_finished(STAGE_SPANS)
+        journal.close()
+
+        resumed = tool_state.ToolLayerSelectState([]).startComparing(
+            (network_a, network_b), settings
+        )
+        assert isinstance(resumed, tool_state.ToolNodeComparisonState)
+        assert resumed.scoring and tasks[-1] is resumed.scoringTask
+        resumed.close()
+
+
+def test_delta_with_clashing_ids():
+    network_a = NetworkDescription(id="network-a", name="A")
+    network_b = NetworkDescription(id="network-b", name="B")
+    consolidated = NetworkDescription(id="consolidated", name="A + B")
+
+    def _node(network, fid, name, x):
+        geometry = QgsGeometry.fromPointXY(QgsPointXY(x, 0))
+        return Node("1", {"id": "1", "name": name}, fid, geometry, network)
+
+    # Both networks have a node with id "1", kept apart by their source networks
+    previous_nodes = [
+        _node(network_a, 1, "Node A", 0).with_new_id("1", consolidated),
+        _node(network_b, 2, "Node B", 1).with_new_id("2", consolidated),
+    ]
+    with io.StringIO() as f:
+        write_geojson_from_features(f, previous_nodes)
+        previous = json.loads(f.getvalue())["features"]
+
+    delta = compute_feature_delta(previous, previous_nodes)
+    assert delta.is_empty
+    assert delta.unchanged_count == 2
+
+    # Only network B's node has changed, and it's not mistaken for network A's
+    nodes = [
+        _node(network_a, 1, "Node A", 0).with_new_id("1", consolidated),
+        _node(network_b, 2, "Node B renamed", 1).with_new_id("2", consolidated),
+    ]
+    delta = compute_feature_delta(previous, nodes)
+    assert [n.get("name") for n in delta.changed] == ["Node B renamed"]
+    assert delta.added == [] and delta.removed == []
+    assert delta.unchanged_count == 1
+
+
+def test_remap_spans_node_ids():
+    network = NetworkDescription(id="network", name="Network")
+    geometry = QgsGeometry.fromWkt("LineString (0 0, 1 1)")
+
+    def _span(_id, start_id, end_id):
+        properties = {
+            "id": _id,
+            "start": {"id": start_id, "name": f"Node {start_id}"},
+            "end": {"id": end_id, "name": f"Node {end_id}"},
+            "deploymentDetails": {"description": "Underground"},
+        }
+        return Span(_id, properties, 0, geometry, network)
+
+    spans = [_span("s1", "a", "b"), _span("s2", "b", "c"), _span("s3", "c", "a")]
+    remapped = remap_spans_node_ids(spans, {"a": "a", "b": "b", "c": "1"})
+
+    # Spans whose endpoints kept their IDs are reused as they are
+    assert remapped[0] is spans[0]
+
+    # The rest are copied with their new start/end IDs, sharing everything else
+    assert (remapped[1].start_id, remapped[1].end_id) == ("b", "1")
+    assert (remapped[2].start_id, remapped[2].end_id) == ("1", "a")
+    assert remapped[1].properties["end"] == {"id": "1", "name": "Node c"}
+    assert remapped[1].properties["start"] is spans[1].properties["start"]
+    for original, copy in zip(spans[1:], remapped[1:]):
+        assert copy is not original
+        assert (
+                copy.properties["deploymentDetails"]
+                is original.properties["deploymentDetails"]
+        )
+
+    # The original spans aren't modified
+    assert (spans[1].end_id, spans[2].start_id) == ("c", "c")
+
+    # A span with an endpoint that isn't a Node in the network is invalid
+    with pytest.raises(OFDSInvalidFeature):
+        remap_spans_node_ids(spans, {"a": "a", "b": "b"})
+
+
+def _bulk_comparisons(pairs):
+    """Stand-ins for comparisons of (A ID, B ID, confidence), with no outcomes yet."""
+    return [
+        [
+            SimpleNamespace(
+                feature_a=SimpleNamespace(id=a),
+                feature_b=SimpleNamespace(id=b),
+                confidence=confidence,
+            ),
+            None,
+        ]
+        for a, b, confidence in pairs
+    ]
+
+
+def _reason(comparison):
+    return ConsolidationReason(
+        feature_type="NODE",
+        primary=comparison.feature_a,
+        secondary=comparison.feature_b,
+        confidence=comparison.confidence,
+        similar_fields=[],
+    )
+
+
+def test_bulk_consolidate_above():
+    comparisons_outcomes = _bulk_comparisons(
+        [
+            ("a1", "b1", 97),
+            ("a1", "b2", 99),  # Overlaps the pair above, and is more confident
+            ("a2", "b2", 96),  # Overlaps the pair above
+            ("a3", "b3", 98),  # Already consolidated by the user, below
+            ("a3", "b4", 95),
+            ("a4", "b4", 40),  # Below the threshold, but overlaps nothing chosen
+            ("a5", "b2", 30),  # Below the threshold, overlaps a chosen pair
+        ]
+    )
+    comparison, _ = comparisons_outcomes[3]
+    comparisons_outcomes[3][1] = NodeComparisonOutcome(comparison, _reason(comparison))
+
+    consolidate, keep = bulk_consolidate_above(comparisons_outcomes, 95)
+
+    # The most confident of the overlapping pairs is chosen, and the features that
+    # are already consolidated aren't consolidated again
+    assert consolidate == [1]
+    assert sorted(keep) == [0, 2, 4, 6]
+
+
+def test_bulk_keep_below():
+    comparisons_outcomes = _bulk_comparisons(
+        [("a1", "b1", 20), ("a2", "b2", 50), ("a3", "b3", 51), ("a4", "b4", 10)]
+    )
+    comparison, _ = comparisons_outcomes[3]
+    comparisons_outcomes[3][1] = NodeComparisonOutcome(comparison, _reason(comparison))
+
+    # Decided comparisons are left as they are
+    assert bulk_keep_below(comparisons_outcomes, 50) == [0, 1]
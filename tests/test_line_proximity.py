@@ -0,0 +1,101 @@
+import pytest
+from qgis.core import QgsGeometry, QgsPointXY
+
+from tool.model import line_proximity
+from tool.model.line_proximity import (
+    ResampledLineCache,
+    line_proximity_score,
+    mean_offset_km,
+    resample_line,
+)
+from tool.model.network import NetworkDescription, Span
+from tool.model.qgis_utils import KM_PER_DEGREE
+
+requires_numpy = pytest.mark.skipif(
+    line_proximity.np is None, reason="numpy isn't installed"
+)
+
+
+def _line(points):
+    return QgsGeometry.fromPolylineXY([QgsPointXY(x, y) for x, y in points])
+
+
+def _offset_north(points, km):
+    return [(x, y + km / KM_PER_DEGREE) for x, y in points]
+
+
+ROUTE = [(-4.0, 55.0), (-3.8, 55.1), (-3.5, 55.05), (-3.0, 55.2)]
+
+
+def test_resample_line():
+    xs, ys = resample_line(_line([(0, 0), (4, 0)]), 5)
+    assert list(xs) == pytest.approx([0, 1, 2, 3, 4])
+    assert list(ys) == pytest.approx([0, 0, 0, 0, 0])
+
+    # A line with a single vertex is resampled to that point
+    xs, ys = resample_line(_line([(1, 2)]), 3)
+    assert list(xs) == pytest.approx([1, 1, 1])
+    assert list(ys) == pytest.approx([2, 2, 2])
+
+    # The parts of a multi-part line are joined up in order
+    geometry = QgsGeometry.fromWkt("MultiLineString ((0 0, 1 0), (1 0, 1 1))")
+    xs, ys = resample_line(geometry, 5)
+    assert list(xs) == pytest.approx([0, 0.5, 1, 1, 1])
+    assert list(ys) == pytest.approx([0, 0, 0, 0.5, 1])
+
+
+def test_mean_offset_km_ignores_direction():
+    a = resample_line(_line(ROUTE))
+    b = resample_line(_line(_offset_north(ROUTE, 0.2)))
+    b_reversed = resample_line(_line(list(reversed(_offset_north(ROUTE, 0.2)))))
+
+    assert mean_offset_km(a, b) == pytest.approx(0.2)
+    assert mean_offset_km(a, b_reversed) == pytest.approx(mean_offset_km(a, b))
+
+
+def test_line_proximity_score():
+    a = resample_line(_line(ROUTE))
+    for km, score in [(0, 1), (0.5, 0.5), (1, 0), (1.5, 0)]:
+        b = resample_line(_line(_offset_north(ROUTE, km)))
+        assert line_proximity_score(a, b) == pytest.approx(score, abs=1e-6)
+
+
+@requires_numpy
+def test_numpy_and_python_agree():
+    xs, ys = line_proximity._line_vertices(_line(ROUTE))
+    a_numpy = line_proximity._resample_numpy(xs, ys, 16)
+    a_python = line_proximity._resample_python(xs, ys, 16)
+    for numpy_values, python_values in zip(a_numpy, a_python):
+        assert list(numpy_values) == pytest.approx(python_values)
+
+    xs, ys = line_proximity._line_vertices(_line(_offset_north(ROUTE[::-1], 0.3)))
+    b_numpy = line_proximity._resample_numpy(xs, ys, 16)
+    b_python = line_proximity._resample_python(xs, ys, 16)
+
+    kx, ky = 64.0, KM_PER_DEGREE
+    assert line_proximity._mean_offset_numpy(
+        a_numpy, b_numpy, kx, ky
+    ) == pytest.approx(line_proximity._mean_offset_python(a_python, b_python, kx, ky))
+
+
+def test_resampled_line_cache(monkeypatch):
+    calls = []
+
+    def _resample_line(geometry, n):
+        calls.append(geometry)
+        return resample_line(geometry, n)
+
+    monkeypatch.setattr(line_proximity, "resample_line", _resample_line)
+
+    network = NetworkDescription(id="network", name="Network")
+    span = Span("1", {"id": "1"}, 1, _line(ROUTE), network)
+    # Spans from different networks can have the same ID
+    other_span = Span("1", {"id": "1"}, 1, _line(ROUTE[::-1]), network)
+
+    cache = ResampledLineCache()
+    line = cache.get(span)
+    assert cache.get(span) is line
+    assert len(calls) == 1
+
+    cache.get(other_span)
+    assert len(calls) == 2
@@ -0,0 +1,135 @@
+import copy
+from types import SimpleNamespace
+
+from tool.model.properties import (
+    NODES_PROPERTIES_MERGE_CONFIG,
+    NODES_PROPERTIES_MERGE_PLAN,
+    SPANS_PROPERTIES_MERGE_CONFIG,
+    SPANS_PROPERTIES_MERGE_PLAN,
+    PropMergeOp,
+    get_prop,
+    set_prop,
+)
+
+
+def _merge_by_walking_config(props_config, primary, secondary):
+    """How properties were merged before merge plans, interpreting the config."""
+    props = primary.properties.copy()
+
+    for k, op in props_config:
+        prop_a = get_prop(primary.properties, k)
+        prop_b = get_prop(secondary.properties, k)
+
+        if not prop_a and not prop_b:
+            continue
+
+        if op == PropMergeOp.KEEP_OR_COPY:
+            set_prop(props, k, prop_a or prop_b)
+        elif op == PropMergeOp.CONCAT_ARRAY:
+            set_prop(props, k, [*(prop_a or []), *(prop_b or [])])
+        elif op == PropMergeOp.MERGE_ARRAY:
+            set_prop(props, k, list(set().union(prop_a or []).union(prop_b or [])))
+        elif op == PropMergeOp.SUM_NUMBER:
+            set_prop(props, k, (prop_a or 0) + (prop_b or 0))
+        elif op == PropMergeOp.CONCAT_DESCRIPTION:
+            if prop_a is not None and prop_b is not None:
+                set_prop(props, k, ", ".join(set([s for s in [prop_a, prop_b] if s])))
+
+    return props
+
+
+NODE_PROPERTIES = [
+    {
+        "id": "1",
+        "name": "Node",
+        "location": {"type": "Point", "coordinates": [1, 2]},
+        "type": ["pop", "cabinet"],
+        "technologies": ["ethernet"],
+        "networkProviders": [{"name": "Provider A"}],
+    },
+    {
+        "id": "2",
+        "address": {"country": "GB"},
+        "power": True,
+        "type": ["cabinet", "exchange"],
+        "internationalConnections": [{"country": "FR"}],
+        "technologies": ["sdh"],
+        "networkProviders": [{"name": "Provider B"}],
+    },
+    {"id": "3"},
+]
+
+SPAN_PROPERTIES = [
+    {
+        "id": "1",
+        "name": "Span",
+        "status": "operational",
+        "fibreTypeDetails": {"description": "Single mode"},
+        "deploymentDetails": {"description": "Buried"},
+        "capacityDetails": {"description": "10G"},
+        "transmissionMedium": ["fibre"],
+        "countries": ["GB"],
+        "capacity": 10,
+        "networkProviders": [{"name": "Provider A"}],
+    },
+    {
+        "id": "2",
+        "phase": {"name": "Phase 2"},
+        "fibreType": "G.652",
+        "fibreTypeDetails": {"fibreSubType": "G.652.D", "description": "Dark"},
+        "deploymentDetails": {"description": "Buried"},
+        "transmissionMedium": ["fibre", "copper"],
+        "deployment": ["belowGround"],
+        "countries": ["FR"],
+        "capacity": 5,
+        "networkProviders": [{"name": "Provider B"}],
+    },
+    {
+        "id": "3",
+        "capacityDetails": {"description": ""},
+        "fibreTypeDetails": {"description": "Multi mode"},
+        "capacity": 0,
+    },
+]
+
+
+def test_merge_plans_match_config():
+    for config, plan, all_properties in [
+        (NODES_PROPERTIES_MERGE_CONFIG, NODES_PROPERTIES_MERGE_PLAN, NODE_PROPERTIES),
+        (SPANS_PROPERTIES_MERGE_CONFIG, SPANS_PROPERTIES_MERGE_PLAN, SPAN_PROPERTIES),
+    ]:
+        for properties_a in all_properties:
+            for properties_b in all_properties:
+                primary = SimpleNamespace(properties=copy.deepcopy(properties_a))
+                secondary = SimpleNamespace(properties=copy.deepcopy(properties_b))
+
+                # Merging used to change nested objects in place, so give it copies
+                expected = _merge_by_walking_config(
+                    config, copy.deepcopy(primary), copy.deepcopy(secondary)
+                )
+                assert plan.merge(primary, secondary) == expected
+
+                # Neither feature is changed, including their nested objects
+                assert primary.properties == properties_a
+                assert secondary.properties == properties_b
+
+
+def test_merge_plan_copies_changed_nested_objects():
+    primary = SimpleNamespace(properties=copy.deepcopy(SPAN_PROPERTIES[0]))
+    secondary = SimpleNamespace(properties=copy.deepcopy(SPAN_PROPERTIES[1]))
+
+    merged = SPANS_PROPERTIES_MERGE_PLAN.merge(primary, secondary)
+
+    assert merged["fibreTypeDetails"] == {
+        "fibreSubType": "G.652.D",
+        "description": merged["fibreTypeDetails"]["description"],
+    }
+    assert sorted(merged["fibreTypeDetails"]["description"].split(", ")) == [
+        "Dark",
+        "Single mode",
+    ]
+    assert merged["fibreTypeDetails"] is not primary.properties["fibreTypeDetails"]
+    assert primary.properties["fibreTypeDetails"] == {"description": "Single mode"}
+
+    # Objects that aren't changed are shared rather than copied
+    assert merged["capacityDetails"] is primary.properties["capacityDetails"]
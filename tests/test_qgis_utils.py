@@ -0,0 +1,41 @@
+import json
+
+from qgis.core import QgsGeometry
+
+from tool.model.qgis_utils import geometry_to_geojson, without_shared_properties
+
+
+def test_geometry_to_geojson_matches_asjson():
+    for wkt in [
+        "Point (-4.252606805462818 55.859869035181475)",
+        "LineString (-3.19196935 55.95261739, -3.44156633 55.92304552, -4.248212 55.854322)",
+        "MultiPoint ((1 2), (3 4))",
+        "MultiLineString ((1 2, 3 4), (5 6, 7 8, 9 10))",
+        "LineString Z (1 2 3, 4 5 6)",
+    ]:
+        geometry = QgsGeometry.fromWkt(wkt)
+        assert json.loads(geometry_to_geojson(geometry)) == json.loads(geometry.asJson())
+
+
+def test_geometry_to_geojson_precision():
+    geometry = QgsGeometry.fromWkt("LineString (-4.252606805462818 55.859869035181475, 1 2)")
+    assert json.loads(geometry_to_geojson(geometry, precision=6)) == {
+        "type": "LineString",
+        "coordinates": [[-4.252607, 55.859869], [1.0, 2.0]],
+    }
+
+
+def test_without_shared_properties():
+    network = {"id": "n1", "name": "Network"}
+    shared = {"network": network, "provenance": {"generatedAtTime": "2024-01-01"}}
+    properties = {
+        "id": "a",
+        "network": network,
+        "provenance": {"wasDerivedFrom": ["b", "c"], "generatedAtTime": "2024-01-01"},
+    }
+    assert without_shared_properties(properties, shared) == {
+        "id": "a",
+        "provenance": {"wasDerivedFrom": ["b", "c"]},
+    }
+    # The feature's own properties aren't modified
+    assert properties["network"] is network
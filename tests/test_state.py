@@ -0,0 +1,211 @@
+from collections import defaultdict
+from pathlib import Path
+from types import SimpleNamespace
+
+from qgis.core import QgsVectorLayer
+
+from tool.model.comparison import NodeComparisonOutcome
+from tool.model.journal import STAGE_NODES
+from tool.viewmodel import state as tool_state
+
+
+class _Comparison:
+    """Stand-in for a comparison of the features with these IDs."""
+
+    def __init__(self, a_id, b_id, confidence):
+        self.feature_a = SimpleNamespace(id=a_id)
+        self.feature_b = SimpleNamespace(id=b_id)
+        self.confidence = confidence
+
+    def get_high_scoring_properties(self):
+        return []
+
+
+class _Consolidator:
+    """Stand-in consolidator, that auto-consolidates the features in network A given."""
+
+    FEATURE_TYPE = "NODE"
+
+    def __init__(self, auto_consolidated_a=()):
+        self.auto_consolidated_a = set(auto_consolidated_a)
+
+    def get_comparisons_to_ask_user(self):
+        return []
+
+    def previous_outcome(self, comparison):
+        return None
+
+    def finish_scoring(self, keep_a=(), keep_b=()):
+        self.auto_consolidated_a -= set(keep_a)
+
+    def without_consolidated(self, comparisons):
+        return [c for c in comparisons if c.feature_a.id not in self.auto_consolidated_a]
+
+
+class _ComparisonState(tool_state.AbstractToolComparisonState):
+    """A comparison state of stand-in comparisons, without any networks."""
+
+    state = tool_state.ToolStateEnum.COMPARING_NODES
+    ComparisonOutcomeCls = NodeComparisonOutcome
+    JOURNAL_STAGE = STAGE_NODES
+
+    # Auto-consolidating only depends on the consolidator, not the type of features
+    _autoConsolidate = tool_state.ToolNodeComparisonState._autoConsolidate
+
+    def __init__(self, consolidator):
+        super().__init__(networks=(None, None), consolidator=consolidator, settings=None)
+
+    def finish(self):
+        return self
+
+
+def _assert_indexes_match_rebuild(state):
+    by_a = defaultdict(list)
+    by_b = defaultdict(list)
+    for i, (comparison, _) in enumerate(state.comparisons_outcomes):
+        by_a[comparison.feature_a.id].append(i)
+        by_b[comparison.feature_b.id].append(i)
+
+    # Features whose comparisons have all been dropped are left with empty indexes
+    assert {k: v for k, v in state.comparisonsByFeatureA.items() if v} == by_a
+    assert {k: v for k, v in state.comparisonsByFeatureB.items() if v} == by_b
+
+
+def test_add_comparisons_after_current():
+    state = _ComparisonState(_Consolidator(auto_consolidated_a={"a4"}))
+    state.addComparisons(
+        [
+            _Comparison("a1", "b1", 95),
+            _Comparison("a2", "b2", 85),
+            _Comparison("a3", "b3", 75),
+            _Comparison("a4", "b4", 65),
+        ]
+    )
+    _assert_indexes_match_rebuild(state)
+
+    state.current = 1
+    current = state.currentComparison
+
+    # Comparisons found later are merged in after the current one, in priority order
+    state.addComparisons(
+        [
+            _Comparison("a1", "b2", 99),
+            _Comparison("a3", "b2", 80),
+            _Comparison("a2", "b5", 70),
+            _Comparison("a5", "b3", 60),
+        ]
+    )
+    assert state.currentComparison is current
+    assert [c.confidence for c, _ in state.comparisons_outcomes] == [
+        95, 85, 99, 80, 75, 70, 65, 60
+    ]
+    _assert_indexes_match_rebuild(state)
+
+    # Auto-consolidating drops comparisons, moving the rest, and more are added after
+    state._autoConsolidate()
+    assert state.currentComparison is current
+    assert "a4" not in [c.feature_a.id for c, _ in state.comparisons_outcomes]
+    _assert_indexes_match_rebuild(state)
+
+    state.addComparisons([_Comparison("a5", "b2", 90), _Comparison("a6", "b6", 10)])
+    _assert_indexes_match_rebuild(state)
+
+    # Consolidating the current comparison marks every other comparison with either
+    # of its features as not the same, and leaves the rest undecided
+    assert state.setOutcomeConsolidate()
+    for i, (comparison, outcome) in enumerate(state.comparisons_outcomes):
+        if i == state.current:
+            assert outcome.consolidate is not False
+        elif comparison.feature_a.id == "a2" or comparison.feature_b.id == "b2":
+            assert outcome is not None and outcome.consolidate is False
+        else:
+            assert outcome is None
+
+
+def _assert_counts_match_recount(state):
+    outcomes = [o for _, o in state.comparisons_outcomes if o is not None]
+    n_rejected = len([o for o in outcomes if o.consolidate is False])
+    assert state.nRejected == n_rejected
+    assert state.nConsolidated == len(outcomes) - n_rejected
+    assert state.nCompared == len(outcomes)
+
+
+def test_outcome_counts():
+    state = _ComparisonState(_Consolidator(auto_consolidated_a={"a5"}))
+    state.addComparisons(
+        [
+            _Comparison("a1", "b1", 95),
+            _Comparison("a1", "b2", 90),
+            _Comparison("a2", "b2", 85),
+            _Comparison("a3", "b3", 60),
+            _Comparison("a4", "b4", 40),
+            _Comparison("a5", "b5", 30),
+            _Comparison("a6", "b6", 20),
+        ]
+    )
+    _assert_counts_match_recount(state)
+
+    # The user changes their mind about the first comparison, then changes it back
+    state.current = 0
+    assert state.setOutcomeConsolidate()
+    _assert_counts_match_recount(state)
+    state.setOutcomeDontConsolidate()
+    _assert_counts_match_recount(state)
+    assert state.setOutcomeConsolidate()
+    _assert_counts_match_recount(state)
+
+    assert state.consolidateAbove(50) == 2
+    _assert_counts_match_recount(state)
+    assert state.keepBelow(35) == 2
+    _assert_counts_match_recount(state)
+
+    # Auto-consolidating drops the decided comparison with a5
+    state._autoConsolidate()
+    _assert_counts_match_recount(state)
+    assert (state.nConsolidated, state.nRejected, state.nTotal) == (3, 2, 6)
+
+
+def _load_test_layer(request, name):
+    path = Path(Path(request.path).parent, "test_data", f"{name}.geojson").absolute()
+    return QgsVectorLayer("GeoJSON:" + path.as_posix(), name, "ogr")
+
+
+# noinspection PyUnusedLocal
+def test_stale_network_discovery_dropped(qgis_app, request, monkeypatch):
+    tasks = []
+    monkeypatch.setattr(
+        tool_state,
+        "QgsApplication",
+        SimpleNamespace(taskManager=lambda: SimpleNamespace(addTask=tasks.append)),
+    )
+    a_nodes = _load_test_layer(request, "nodes_a")
+    a_spans = _load_test_layer(request, "spans_a")
+    b_nodes = _load_test_layer(request, "nodes_b")
+    b_spans = _load_test_layer(request, "spans_b")
+
+    state = tool_state.ToolLayerSelectState([])
+    updates = []
+    state.onUpdated = lambda: updates.append(state)
+
+    state.update_networks_list((a_nodes, None), (None, None))
+    old_task = tasks[-1]
+    assert old_task.run()
+
+    # The selection changes while the first search is finishing
+    state.update_networks_list((a_nodes, b_nodes), (a_spans, b_spans))
+    new_task = tasks[-1]
+    assert new_task.generation > old_task.generation
+
+    old_task.finished(True)
+    assert old_task.networks[0]
+    assert state.selectableNetworksA == []
+    assert state.selectableNetworksB == []
+    assert state.discovering
+    assert updates == []
+
+    assert new_task.run()
+    new_task.finished(True)
+    assert state.selectableNetworksA
+    assert state.selectableNetworksB
+    assert not state.discovering
+    assert updates == [state]
@@ -0,0 +1,54 @@
+import json
+from pathlib import Path
+from tempfile import TemporaryDirectory
+
+from qgis.core import QgsGeometry, QgsPointXY
+
+from tool.model.export import ExportFormat
+from tool.model.network import NetworkDescription, Node
+from tool.model.tasks import SaveFeaturesTask, partial_file_path
+
+
+def _nodes():
+    network = NetworkDescription(id="network", name="Network")
+    return [
+        Node(
+            str(i),
+            {"id": str(i), "name": f"Node {i}", "network": {"id": "network"}},
+            i,
+            QgsGeometry.fromPointXY(QgsPointXY(i, 0)),
+            network,
+        )
+        for i in range(1, 4)
+    ]
+
+
+# noinspection PyUnusedLocal
+def test_save_features_task(qgis_app):
+    with TemporaryDirectory() as td:
+        path = Path(td, "nodes.geojson")
+
+        # The file is written next to the final path, then renamed into place
+        task = SaveFeaturesTask(path, _nodes(), Node, ExportFormat.GEOJSON)
+        assert task.run()
+        assert task.error is None
+        assert not partial_file_path(path).exists()
+        with path.open() as f:
+            assert len(json.load(f)["features"]) == 3
+
+        # A cancelled save leaves the file that was already there as it was
+        saved = path.read_bytes()
+        task = SaveFeaturesTask(path, _nodes()[:1], Node, ExportFormat.GEOJSON)
+        task.cancel()
+        assert not task.run()
+        assert task.error is None
+        assert not partial_file_path(path).exists()
+        assert path.read_bytes() == saved
+
+        # A failed save doesn't leave a partial file behind either
+        missing_path = Path(td, "missing", "nodes.geojson")
+        task = SaveFeaturesTask(missing_path, _nodes(), Node, ExportFormat.GEOJSON)
+        assert not task.run()
+        assert task.error is not None
+        assert not missing_path.exists()
+        assert not partial_file_path(missing_path).exists()
@@ -5,6 +5,7 @@ from qgis.core import QgsProject, QgsMapLayer, QgsVectorLayer, QgsMapLayerType
 
 from .model.network import Network
 from .model.settings import Settings
+from .view_warningbox import ask_confidence_threshold
 from .viewmodel.state import (
     ToolLayerSelectState,
     ToolNodeComparisonState,
@@ -16,6 +17,10 @@ from ..gui import Ui_OFDSDedupToolDialog
 
 logger = logging.getLogger(__name__)
 
+# Suggested thresholds when deciding many comparisons at once
+BULK_CONSOLIDATE_DEFAULT = 95.0
+BULK_KEEP_DEFAULT = 50.0
+
 
 # The controller is responsible for acceping input from the UI (i.e. button clicks)
 # and then translating that into state updates.
@@ -97,10 +102,7 @@ class ToolController:
                 nodes_match_radius_km=float(self.ui.nodesMatchRadiusSpinBox.value()),
             )
 
-            return ToolNodeComparisonState(
-                settings=settings,
-                networks=(networkA, networkB),
-            )
+            return state.startComparing((networkA, networkB), settings)
 
         else:
             raise ControllerInvalidState
@@ -145,6 +147,42 @@ class ToolController:
         else:
             raise ControllerInvalidState
 
+    def onConsolidateAboveButton(self, state: ToolState) -> ToolState:
+        if isinstance(state, ToolNodeComparisonState) or isinstance(
+                state, ToolSpanComparisonState
+        ):
+            threshold = ask_confidence_threshold(
+                "Consolidate comparisons",
+                "Mark all undecided comparisons with at least this confidence (%) "
+                + "as the same:",
+                BULK_CONSOLIDATE_DEFAULT,
+            )
+            if threshold is not None:
+                n = state.consolidateAbove(threshold)
+                logger.info(f"Marked {n} comparisons >= {threshold}% as the same")
+            return state
+
+        else:
+            raise ControllerInvalidState
+
+    def onKeepBelowButton(self, state: ToolState) -> ToolState:
+        if isinstance(state, ToolNodeComparisonState) or isinstance(
+                state, ToolSpanComparisonState
+        ):
+            threshold = ask_confidence_threshold(
+                "Keep both features",
+                "Mark all undecided comparisons with at most this confidence (%) "
+                + "as not the same:",
+                BULK_KEEP_DEFAULT,
+            )
+            if threshold is not None:
+                n = state.keepBelow(threshold)
+                logger.info(f"Marked {n} comparisons <= {threshold}% as not the same")
+            return state
+
+        else:
+            raise ControllerInvalidState
+
     def onFinishedButton(self, state: ToolState) -> ToolState:
         if isinstance(state, ToolNodeComparisonState):
             return state.finish()
@@ -161,12 +199,54 @@ class ToolController:
 
     def onSaveNodesButton(self, state: ToolState) -> ToolState:
         if isinstance(state, ToolOutputState):
-            return state.saveNodes()
+            return state.saveNodes(
+                shared_metadata=self.ui.outputSharedMetadata.isChecked()
+            )
         else:
             raise ControllerInvalidState
 
     def onSaveSpansButton(self, state: ToolState) -> ToolState:
         if isinstance(state, ToolOutputState):
-            return state.saveSpans()
+            return state.saveSpans(
+                shared_metadata=self.ui.outputSharedMetadata.isChecked()
+            )
+        else:
+            raise ControllerInvalidState
+
+    def onSaveAllButton(self, state: ToolState) -> ToolState:
+        if isinstance(state, ToolOutputState):
+            return state.saveAll(
+                shared_metadata=self.ui.outputSharedMetadata.isChecked()
+            )
+        else:
+            raise ControllerInvalidState
+
+    def onSavePackageButton(self, state: ToolState) -> ToolState:
+        if isinstance(state, ToolOutputState):
+            return state.savePackage()
+        else:
+            raise ControllerInvalidState
+
+    def onSaveDeltaButton(self, state: ToolState) -> ToolState:
+        if isinstance(state, ToolOutputState):
+            return state.saveDelta()
+        else:
+            raise ControllerInvalidState
+
+    def onSaveRunButton(self, state: ToolState) -> ToolState:
+        if isinstance(state, ToolOutputState):
+            return state.saveRun()
+        else:
+            raise ControllerInvalidState
+
+    def onAddLayersButton(self, state: ToolState) -> ToolState:
+        if isinstance(state, ToolLayerSelectState):
+            return state.addLayersFromFiles(self.project)
+        else:
+            raise ControllerInvalidState
+
+    def onLoadRunButton(self, state: ToolState) -> ToolState:
+        if isinstance(state, ToolLayerSelectState):
+            return state.loadPreviousRun()
         else:
             raise ControllerInvalidState
@@ -0,0 +1,100 @@
+import logging
+from typing import Callable, Dict, Hashable, Iterable, List, Set, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def _connected_components(
+    candidates: List[T],
+    key_a: Callable[[T], Hashable],
+    key_b: Callable[[T], Hashable],
+) -> List[List[T]]:
+    """
+    Split candidate pairs into the connected components of the bipartite graph they
+    form, using union-find over the A and B keys.
+    """
+    parent: Dict[Hashable, Hashable] = dict()
+
+    def find(x: Hashable) -> Hashable:
+        root = x
+        while parent.setdefault(root, root) != root:
+            root = parent[root]
+        # Path compression
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    for candidate in candidates:
+        root_a = find(("A", key_a(candidate)))
+        root_b = find(("B", key_b(candidate)))
+        if root_a != root_b:
+            parent[root_b] = root_a
+
+    components: Dict[Hashable, List[T]] = dict()
+    for candidate in candidates:
+        components.setdefault(find(("A", key_a(candidate))), []).append(candidate)
+
+    return list(components.values())
+
+
+def _greedy_max_weight_matching(
+    candidates: List[T],
+    key_a: Callable[[T], Hashable],
+    key_b: Callable[[T], Hashable],
+    weight: Callable[[T], float],
+) -> List[T]:
+    matched_a: Set[Hashable] = set()
+    matched_b: Set[Hashable] = set()
+    matches: List[T] = list()
+
+    # sorted() is stable, so ties are broken by the order the candidates were found
+    for candidate in sorted(candidates, key=weight, reverse=True):
+        a = key_a(candidate)
+        b = key_b(candidate)
+        if a in matched_a or b in matched_b:
+            continue
+        matched_a.add(a)
+        matched_b.add(b)
+        matches.append(candidate)
+
+    return matches
+
+
+def assign_one_to_one(
+    candidates: Iterable[T],
+    key_a: Callable[[T], Hashable],
+    key_b: Callable[[T], Hashable],
+    weight: Callable[[T], float],
+) -> List[T]:
+    """
+    Choose a one-to-one matching from a sparse graph of candidate pairs between
+    features in Network A and B, so that no feature is matched more than once.
+
+    Each connected component of the graph is solved on its own, by greedily taking the
+    highest weighted pair whose features are both still unmatched. Most components are
+    a single pair, which are taken as they are.
+    """
+    candidates = list(candidates)
+    matches: List[T] = list()
+    n_conflicts = 0
+
+    for component in _connected_components(candidates, key_a, key_b):
+        if len(component) == 1:
+            matches.extend(component)
+            continue
+
+        component_matches = _greedy_max_weight_matching(
+            component, key_a, key_b, weight
+        )
+        n_conflicts += len(component) - len(component_matches)
+        matches.extend(component_matches)
+
+    if n_conflicts:
+        logger.info(
+            f"Assigned {len(matches)} of {len(candidates)} candidate pairs, dropping "
+            + f"{n_conflicts} that conflicted with a better match"
+        )
+
+    return matches
@@ -13,6 +13,7 @@ from typing import (
 )
 from qgis.core import QgsPointXY, QgsWkbTypes, QgsDistanceArea, QgsUnitTypes
 
+from .line_proximity import RESAMPLED_LINES, line_proximity_score
 from .network import Feature, Node, Span
 
 from .._lib.jellyfish import _jellyfish as jellyfish
@@ -140,6 +141,7 @@ class NodeComparison(Comparison):
     confidence: float
     scores: Dict[str, float]
     weights: Dict[str, float]
+    _distance_km: Optional[float]
 
     @property
     def node_a(self):
@@ -154,13 +156,26 @@ class NodeComparison(Comparison):
         node_a: Node,
         node_b: Node,
         weights: Optional[Dict[str, float]] = None,
+        scores: Optional[Dict[str, float]] = None,
+        distance_km: Optional[float] = None,
     ):
+        """
+        Compare two nodes. Scores (and distance) previously calculated for the same
+        pair of nodes can be passed in, e.g. from a ScoreCache, to skip scoring them.
+        """
         super().__init__(weights)
 
         self.features = (node_a, node_b)
         self.weights = weights if weights else self.default_node_weights()
+        self._distance_km = distance_km
 
-        self.scores = {
+        self.scores = dict(scores) if scores else self.compute_scores(node_a, node_b)
+
+        self.calculate_total()
+        self.calculate_confidence()
+
+    def compute_scores(self, node_a: Node, node_b: Node) -> Dict[str, float]:
+        return {
             "name": self.compare_strings(node_a.get("name"), node_b.get("name")),
             "type": self.compare_types(node_a.get("type"), node_b.get("type")),
             "location/address/country": self.compare_equals(
@@ -222,9 +237,6 @@ class NodeComparison(Comparison):
             ),
         }
 
-        self.calculate_total()
-        self.calculate_confidence()
-
     def default_node_weights(self) -> Dict[str, float]:
         # We can pass different weights on the fly if needed, but falls back to this.
         weights = {
@@ -265,13 +277,16 @@ class NodeComparison(Comparison):
 
     @property
     def distance_km(self) -> float:
-        assert self.node_a.featureGeometry.wkbType() == QgsWkbTypes.Type.Point
-        assert self.node_b.featureGeometry.wkbType() == QgsWkbTypes.Type.Point
+        if self._distance_km is None:
+            assert self.node_a.featureGeometry.wkbType() == QgsWkbTypes.Type.Point
+            assert self.node_b.featureGeometry.wkbType() == QgsWkbTypes.Type.Point
+
+            point_a = self.node_a.featureGeometry.asPoint()
+            point_b = self.node_b.featureGeometry.asPoint()
 
-        point_a = self.node_a.featureGeometry.asPoint()
-        point_b = self.node_b.featureGeometry.asPoint()
+            self._distance_km = self._point_distance_km(point_a, point_b)
 
-        return self._point_distance_km(point_a, point_b)
+        return self._distance_km
 
     def __eq__(self, value: object) -> bool:
         if isinstance(value, NodeComparison):
@@ -306,7 +321,12 @@ class SpanComparison(Comparison):
     def span_b(self):
         return self.features[1]
 
-    def __init__(self, span_a, span_b, weights=None):
+    def __init__(self, span_a, span_b, weights=None, scores=None):
+        """
+        Compare two spans. Scores previously calculated for the same pair of spans can
+        be passed in, e.g. from a ScoreCache, to skip scoring them. The start/end
+        nodes are always compared, as their IDs change when nodes are consolidated.
+        """
         super().__init__(weights)
 
         self.features = (span_a, span_b)
@@ -314,12 +334,19 @@ class SpanComparison(Comparison):
         self.span_b_id = span_b.id
         self.weights = weights if weights else self.default_span_weights()
 
-        self.scores = {
+        self.scores = dict(scores) if scores else self.compute_scores(span_a, span_b)
+        self.scores["nodes"] = self.compare_start_and_end_nodes(
+            [span_a.get("start"), span_a.get("end")],
+            [span_b.get("start"), span_b.get("end")],
+        )
+
+        self.calculate_total()
+        self.calculate_confidence()
+
+    def compute_scores(self, span_a: Span, span_b: Span) -> Dict[str, float]:
+        """Scores of everything except the start/end nodes."""
+        return {
             "name": self.compare_strings(span_a.get("name"), span_b.get("name")),
-            "nodes": self.compare_start_and_end_nodes(
-                [span_a.get("start"), span_a.get("end")],
-                [span_b.get("start"), span_b.get("end")],
-            ),
             "phase/name": self.compare_strings(
                 span_a.get("phase/name"), span_b.get("phase/name")
             ),
@@ -362,11 +389,9 @@ class SpanComparison(Comparison):
             "capacity": self.compare_equals(
                 span_a.get("capacity"), span_b.get("capacity")
             ),  # TODO: check if this should be equals or if there's a threshold to use
+            "coordinates": self.compare_line_proximity(span_a, span_b),
         }
 
-        self.calculate_total()
-        self.calculate_confidence()
-
     def default_span_weights(self) -> Dict[str, float]:
         weights = {
             "name": 0.5,
@@ -405,15 +430,19 @@ class SpanComparison(Comparison):
         diff = abs(first - second)
         return 1 - diff if diff < 1 else 0
 
-    def compare_line_proximity(self, first, second):
-        # TODO
-        # Return a higher score the closer together two lines are.
-        # This might not be very accurate, so think about how much to depend on it.
-        # Compare only if they're given to a certain degree of accuracy in the
-        # coordinates?
-        # or calculate score based on accuracy as well as proximity
-        # Thresholds tbd
-        pass
+    def compare_line_proximity(self, first: Span, second: Span):
+        """
+        Score how closely two spans follow the same route, from the average distance
+        between points evenly spaced along each of them.
+
+        Geometries must be lon/lat (WGS 84), as OFDS GeoJSON is, since the distance is
+        converted to km assuming their coordinates are in degrees.
+        """
+        if first.featureGeometry.isEmpty() or second.featureGeometry.isEmpty():
+            return 0
+        return line_proximity_score(
+            RESAMPLED_LINES.get(first), RESAMPLED_LINES.get(second)
+        )
 
     def compare_start_and_end_nodes(self, first, second):
         """
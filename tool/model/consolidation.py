@@ -1,59 +1,446 @@
 import json
 import logging
 import uuid
+from collections import defaultdict
 from abc import ABC, abstractmethod
-from typing import Dict, Generic, Iterable, List, Set, Tuple, Type
+from typing import Any, Dict, Generic, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Type
+
+from qgis.core import QgsFeedback, QgsGeometry, QgsRectangle, QgsSpatialIndex
 
 from .comparison import (
+    Comparison,
     NodeComparison,
-    NodeComparisonOutcome,
+    ComparisonOutcome,
     ConsolidationReason,
     SpanComparison,
     ComparisonT,
     SpanComparisonOutcome,
 )
+from .assignment import assign_one_to_one
+from .decisions import DecisionRecord, StageRecord
+from .hashing import feature_content_hash
+from .journal import ScoredPair
+from .ledger import ConsolidationLedger
+from .score_cache import CachedScores, ScoreCache
 from .network import Node, Network, Span, FeatureT, Feature, NetworkDescription, OFDSInvalidFeature
 from .properties import (
-    NODES_PROPERTIES_MERGE_CONFIG,
-    SPANS_PROPERTIES_MERGE_CONFIG,
-    PropMergeOp,
-    merge_features_properties,
+    NODES_PROPERTIES_MERGE_PLAN,
+    SPANS_PROPERTIES_MERGE_PLAN,
+    PropMergePlan,
     generate_provenance_data,
+    generate_run_provenance,
 )
 from .qgis_utils import (
     create_qgis_geojson_layer_from_nodes,
     create_qgis_geojson_layer_from_spans,
+    km_to_degrees,
+    scaled_to_latitude,
+    search_rectangle,
 )
 
 logger = logging.getLogger(__name__)
 
+# Comparisons are asked about in bands of this many percent confidence, nearest first
+REVIEW_CONFIDENCE_BAND = 10
+
+# Spans' routes are compared with their longitudes scaled to the middle of bands of
+# this many degrees of latitude, which cos(latitude) barely changes over
+SCALE_LATITUDE_BAND_DEGREES = 0.5
+
+
+class FeatureIdAllocator:
+    """
+    Allocates IDs for the features in a consolidated network, keeping features'
+    original IDs where they don't clash, and numbering new features from 1.
+    """
+
+    _next_feature_id: int
+    _used_feature_ids: Set[str]
+
+    def __init__(self):
+        self._next_feature_id = 1
+        self._used_feature_ids = set()
+
+    def allocate(self) -> str:
+        new_id = str(self._next_feature_id)
+        self._next_feature_id += 1
+        # Skip over any IDs that have been kept from the original networks
+        while new_id in self._used_feature_ids:
+            new_id = str(self._next_feature_id)
+            self._next_feature_id += 1
+        self._used_feature_ids.add(new_id)
+        return new_id
+
+    def keep_or_allocate(self, _id: str) -> str:
+        """Keep a feature's existing ID, or allocate a new one if it's already used."""
+        if _id and _id not in self._used_feature_ids:
+            self._used_feature_ids.add(_id)
+            return _id
+        return self.allocate()
+
+
+def remap_span_node_ids(span: Span, lookup: Dict[str, str]) -> Span:
+    """
+    Copy a Span with its start/end Node IDs updated. Only the start/end objects that
+    change are copied, the rest of the properties are shared with the original.
+    """
+    new_properties = span.properties.copy()
+
+    for k in ("start", "end"):
+        endpoint = new_properties[k]
+
+        # Check in case properties have been loaded as nested JSON string
+        if isinstance(endpoint, str):
+            endpoint = json.loads(endpoint)
+
+        new_id = lookup[endpoint["id"]]
+        if new_id != endpoint["id"]:
+            new_properties[k] = {**endpoint, "id": new_id}
+
+    return Span(
+        span.id,
+        properties=new_properties,
+        featureId=span.featureId,
+        featureGeometry=span.featureGeometry,
+        ofds_network=span.ofds_network,
+    )
+
+
+def remap_spans_node_ids(spans: List[Span], lookup: Dict[str, str]) -> List[Span]:
+    """
+    Update the start/end Node IDs of all spans in a network after the nodes have been
+    consolidated. Spans whose endpoints kept their IDs are reused as they are.
+    """
+    # Index of which spans (by position) start or end at each Node ID
+    endpoint_index: Dict[str, List[int]] = defaultdict(list)
+    for i, span in enumerate(spans):
+        endpoint_index[span.start_id].append(i)
+        endpoint_index[span.end_id].append(i)
+
+    changed: Set[int] = set()
+    for node_id, span_indexes in endpoint_index.items():
+        new_id = lookup.get(node_id)
+        if new_id is None:
+            span = spans[span_indexes[0]]
+            raise OFDSInvalidFeature(f"Error: Span {span.id} has an invalid start/end")
+        if new_id != node_id:
+            changed.update(span_indexes)
+
+    logger.info(f"Remapping start/end Node IDs of {len(changed)}/{len(spans)} spans")
+
+    new_spans = list(spans)
+    for i in changed:
+        new_spans[i] = remap_span_node_ids(spans[i], lookup)
+    return new_spans
+
+
+def span_endpoints_key(span: Span) -> Tuple[str, str]:
+    """Key for the pair of Nodes a span starts and ends at, ignoring direction."""
+    start_id = span.start_id
+    end_id = span.end_id
+    return (start_id, end_id) if start_id <= end_id else (end_id, start_id)
+
+
+class SpanEndpointIndex:
+    """
+    Index of spans by the pair of Nodes they start and end at, in either direction,
+    holding every span between each pair of Nodes.
+    """
+
+    spans_by_endpoints: Dict[Tuple[str, str], List[Span]]
+
+    def __init__(self, spans: Iterable[Span]):
+        self.spans_by_endpoints = defaultdict(list)
+        for span in spans:
+            self.spans_by_endpoints[span_endpoints_key(span)].append(span)
+
+    def get(self, span: Span) -> List[Span]:
+        """All the indexed spans between the same Nodes as the given span."""
+        return self.spans_by_endpoints.get(span_endpoints_key(span), [])
+
+
+def node_spatial_index(nodes: List[Node]) -> Tuple[QgsSpatialIndex, List[QgsRectangle]]:
+    """
+    Spatial index of nodes by their position in the list, plus each node's (point)
+    bounding box.
+    """
+    index = QgsSpatialIndex()
+    rects: List[QgsRectangle] = list()
+    for i, node in enumerate(nodes):
+        point = node.featureGeometry.asPoint()
+        rects.append(QgsRectangle(point, point))
+        index.addFeature(i, rects[i])
+    return index, rects
+
+
+def review_priority(comparison: Comparison) -> Tuple[int, float, float]:
+    """
+    Sort key for the order to ask the user about comparisons: the most confident
+    first, in bands of REVIEW_CONFIDENCE_BAND percent, and the nearest first within
+    each band.
+    """
+    band = int(comparison.confidence // REVIEW_CONFIDENCE_BAND)
+    distance = comparison.distance_km if isinstance(comparison, NodeComparison) else 0.0
+    return -band, distance, -comparison.confidence
+
+
+def bulk_consolidate_above(
+        comparisons_outcomes: Sequence[
+            Tuple[ComparisonT, Optional[ComparisonOutcome[ComparisonT]]]
+        ],
+        threshold: float,
+) -> Tuple[List[int], List[int]]:
+    """
+    Choose which undecided comparisons to consolidate in bulk: those with a confidence
+    of at least threshold, most confident first, since each feature can only be
+    consolidated once. Undecided comparisons of features that are then being
+    consolidated, by an earlier decision or earlier in this batch, are kept apart.
+
+    Returns the positions of the comparisons to consolidate, and of those to keep apart.
+    """
+    consolidated_a: Set[str] = set()
+    consolidated_b: Set[str] = set()
+    for comparison, outcome in comparisons_outcomes:
+        if outcome is not None and outcome.consolidate is not False:
+            consolidated_a.add(comparison.feature_a.id)
+            consolidated_b.add(comparison.feature_b.id)
+
+    candidates = sorted(
+        (
+            i
+            for i, (comparison, outcome) in enumerate(comparisons_outcomes)
+            if outcome is None and comparison.confidence >= threshold
+        ),
+        key=lambda i: -comparisons_outcomes[i][0].confidence,
+    )
+
+    consolidate: List[int] = list()
+    for i in candidates:
+        comparison = comparisons_outcomes[i][0]
+        if (
+                comparison.feature_a.id in consolidated_a
+                or comparison.feature_b.id in consolidated_b
+        ):
+            continue
+        consolidate.append(i)
+        consolidated_a.add(comparison.feature_a.id)
+        consolidated_b.add(comparison.feature_b.id)
+
+    chosen = set(consolidate)
+    keep = [
+        i
+        for i, (comparison, outcome) in enumerate(comparisons_outcomes)
+        if outcome is None
+        and i not in chosen
+        and (
+                comparison.feature_a.id in consolidated_a
+                or comparison.feature_b.id in consolidated_b
+        )
+    ]
+    return consolidate, keep
+
+
+def bulk_keep_below(
+        comparisons_outcomes: Sequence[
+            Tuple[ComparisonT, Optional[ComparisonOutcome[ComparisonT]]]
+        ],
+        threshold: float,
+) -> List[int]:
+    """Positions of the undecided comparisons with a confidence of at most threshold."""
+    return [
+        i
+        for i, (comparison, outcome) in enumerate(comparisons_outcomes)
+        if outcome is None and comparison.confidence <= threshold
+    ]
+
 
-# TODO: sort by diagonal distance
 class AbstractNetworkConsolidator(Generic[FeatureT, ComparisonT], ABC):
     FeatureCls: Type[Feature]
+    FEATURE_TYPE: str
+
+    PROPS_MERGE_PLAN: PropMergePlan
 
-    PROPS_MERGE_CONFIG: List[Tuple[str, PropMergeOp]]
+    network_a: Network
+    network_b: Network
 
     new_ofds_network: NetworkDescription
-    _next_feature_id: int
+    _feature_ids: FeatureIdAllocator
+
+    # Which features have been consolidated with which, shared by the stages of a run
+    ledger: ConsolidationLedger
 
     # Lookup for ID's of nodes/spans after consolidation
     network_a_ids_map: Dict[str, str]
     network_b_ids_map: Dict[str, str]
 
-    def __init__(self):
-        self._next_feature_id = 1
+    # This stage of a previous run, to reuse the comparisons and decisions of features
+    # that haven't changed since
+    previous: Optional[StageRecord]
+    _previous_decisions: Dict[Tuple[str, str], DecisionRecord]
+
+    # Pairs of features (A ID, B ID) compared, and the user's decisions on them
+    compared_pairs: List[Tuple[str, str]]
+    decisions: Dict[Tuple[str, str], DecisionRecord]
+
+    _hashes_a: Optional[Dict[str, str]]
+    _hashes_b: Optional[Dict[str, str]]
+
+    # Scores of features compared in earlier runs, by the features' content hashes
+    score_cache: Optional[ScoreCache]
+
+    # Provenance shared by all the features consolidated in this run
+    run_provenance: Dict[str, Any]
+
+    def __init__(
+            self,
+            previous: Optional[StageRecord] = None,
+            score_cache: Optional[ScoreCache] = None,
+            ledger: Optional[ConsolidationLedger] = None,
+    ):
+        self._feature_ids = FeatureIdAllocator()
+        self.ledger = ledger if ledger is not None else ConsolidationLedger()
         self.network_a_ids_map = dict()
         self.network_b_ids_map = dict()
+        self.previous = previous
+        self._previous_decisions = previous.decisions_by_pair() if previous else dict()
+        self.compared_pairs = list()
+        self.decisions = dict()
+        self._hashes_a = None
+        self._hashes_b = None
+        self.score_cache = score_cache
+        self.run_provenance = dict()
 
     def allocate_new_feature_id(self) -> str:
-        new_id = str(self._next_feature_id)
-        self._next_feature_id += 1
-        return new_id
+        return self._feature_ids.allocate()
 
     @abstractmethod
     def get_comparisons_to_ask_user(self) -> List[ComparisonT]: ...
 
+    @abstractmethod
+    def _network_features(self, network: Network) -> List[Feature]: ...
+
+    @property
+    def hashes_a(self) -> Dict[str, str]:
+        """Content hashes of Network A's features, by ID."""
+        if self._hashes_a is None:
+            self._hashes_a = {
+                f.id: feature_content_hash(f)
+                for f in self._network_features(self.network_a)
+            }
+        return self._hashes_a
+
+    @property
+    def hashes_b(self) -> Dict[str, str]:
+        """Content hashes of Network B's features, by ID."""
+        if self._hashes_b is None:
+            self._hashes_b = {
+                f.id: feature_content_hash(f)
+                for f in self._network_features(self.network_b)
+            }
+        return self._hashes_b
+
+    def _cached_scores(
+            self, feature_a: Feature, feature_b: Feature
+    ) -> Optional[CachedScores]:
+        if self.score_cache is None:
+            return None
+        return self.score_cache.get(
+            self.FEATURE_TYPE, self.hashes_a[feature_a.id], self.hashes_b[feature_b.id]
+        )
+
+    def _cached_scores_many(
+            self, pairs: Iterable[Tuple[Feature, Feature]]
+    ) -> Dict[Tuple[str, str], CachedScores]:
+        """The cached scores of many pairs of features, by their (A ID, B ID)."""
+        if self.score_cache is None:
+            return dict()
+        ids_by_hashes = {
+            (self.hashes_a[a.id], self.hashes_b[b.id]): (a.id, b.id) for a, b in pairs
+        }
+        cached = self.score_cache.get_many(self.FEATURE_TYPE, ids_by_hashes.keys())
+        return {ids_by_hashes[hashes]: scores for hashes, scores in cached.items()}
+
+    def _cache_scores(
+            self, comparison: ComparisonT, distance_km: Optional[float] = None
+    ):
+        if self.score_cache is None:
+            return
+        self.score_cache.put(
+            self.FEATURE_TYPE,
+            self.hashes_a[comparison.feature_a.id],
+            self.hashes_b[comparison.feature_b.id],
+            comparison.scores,
+            distance_km,
+        )
+
+    def add_comparison_outcomes(self, outcomes: Iterable[ComparisonOutcome[ComparisonT]]):
+        """
+        Record the consolidations from the outcomes of comparisons in the ledger, and
+        the decisions, so they can be reused in later runs.
+        """
+        outcomes = list(outcomes)
+        self.ledger.record_outcomes(outcomes)
+
+        for outcome in outcomes:
+            a_id = outcome.comparison.feature_a.id
+            b_id = outcome.comparison.feature_b.id
+            self.decisions[(a_id, b_id)] = DecisionRecord(
+                a_id=a_id,
+                b_id=b_id,
+                a_hash=self.hashes_a.get(a_id, ""),
+                b_hash=self.hashes_b.get(b_id, ""),
+                consolidate=outcome.consolidate is not False,
+                confidence=outcome.comparison.confidence,
+            )
+
+    def previous_outcome(
+            self, comparison: ComparisonT
+    ) -> Optional[ComparisonOutcome[ComparisonT]]:
+        """
+        The outcome of the same comparison in the previous run, if the user made a
+        decision on it and neither feature has changed since.
+        """
+        if not self._previous_decisions:
+            return None
+
+        feature_a = comparison.feature_a
+        feature_b = comparison.feature_b
+        decision = self._previous_decisions.get((feature_a.id, feature_b.id))
+        if (
+                decision is None
+                or decision.a_hash != self.hashes_a.get(feature_a.id)
+                or decision.b_hash != self.hashes_b.get(feature_b.id)
+        ):
+            return None
+
+        return self.restored_outcome(comparison, decision.consolidate)
+
+    def restored_outcome(
+            self, comparison: ComparisonT, consolidate: bool
+    ) -> ComparisonOutcome[ComparisonT]:
+        """The outcome of a decision the user made earlier, e.g. in a previous run."""
+        if not consolidate:
+            return ComparisonOutcome(comparison=comparison, consolidate=False)
+
+        reason = ConsolidationReason(
+            feature_type=self.FEATURE_TYPE,
+            primary=comparison.feature_a,
+            secondary=comparison.feature_b,
+            confidence=comparison.confidence,
+            similar_fields=comparison.get_high_scoring_properties(),
+            manual=True,
+        )
+        return ComparisonOutcome(comparison=comparison, consolidate=reason)
+
+    def stage_record(self) -> StageRecord:
+        """Record of this stage, for reusing in the next run."""
+        return StageRecord(
+            hashes_a=dict(self.hashes_a),
+            hashes_b=dict(self.hashes_b),
+            candidates=list(self.compared_pairs),
+            decisions=list(self.decisions.values()),
+        )
+
     def _merge_features(self, primary: Feature, secondary: Feature, provenance: Dict,
                         new_network: NetworkDescription) -> Feature:
         # Create a new ID for this span
@@ -63,7 +450,7 @@ class AbstractNetworkConsolidator(Generic[FeatureT, ComparisonT], ABC):
         self.network_b_ids_map[secondary.id] = new_id
 
         # Merge properties
-        props = merge_features_properties(self.PROPS_MERGE_CONFIG, primary, secondary)
+        props = self.PROPS_MERGE_PLAN.merge(primary, secondary)
 
         # Add provenance data
         props["provenance"] = provenance
@@ -80,18 +467,18 @@ class NetworkNodesConsolidator(AbstractNetworkConsolidator[Node, NodeComparison]
     """
 
     FeatureCls = Node
+    FEATURE_TYPE = "NODE"
 
-    PROPS_MERGE_CONFIG = NODES_PROPERTIES_MERGE_CONFIG
-
-    network_a: Network
-    network_b: Network
+    PROPS_MERGE_PLAN = NODES_PROPERTIES_MERGE_PLAN
 
     merge_threshold: int
     ask_threshold: int
     match_radius_km: float
 
     user_comparisons: List[NodeComparison]
-    outcomes: List[NodeComparisonOutcome]
+
+    # Comparisons confident enough to auto-merge, found while scoring
+    merge_candidates: List[NodeComparison]
 
     def __init__(
             self,
@@ -100,193 +487,297 @@ class NetworkNodesConsolidator(AbstractNetworkConsolidator[Node, NodeComparison]
             merge_above: int = 100,
             ask_above: int = 0,
             match_radius_km: float = 10.0,
+            previous: Optional[StageRecord] = None,
+            score_cache: Optional[ScoreCache] = None,
+            defer_scoring: bool = False,
     ):
+        """
+        Compares the networks' nodes, unless defer_scoring is set, in which case
+        score_candidates() and finish_scoring() must be called to do it, e.g. in the
+        background.
+        """
 
-        super().__init__()
+        super().__init__(previous, score_cache)
 
         self.network_a = network_a
         self.network_b = network_b
         self.merge_threshold = merge_above
         self.ask_threshold = ask_above
         self.match_radius_km = match_radius_km
-        self.outcomes = list()
         self.user_comparisons = []
+        self.merge_candidates = []
 
         self.new_ofds_network = NetworkDescription(
             id=str(uuid.uuid4()),
             name=f"Consolidated Network of {network_a.ofds_network.name} and {network_b.ofds_network.name}"
         )
+        self.run_provenance = generate_run_provenance(
+            network_a.source_uris() + network_b.source_uris()
+        )
+
+        if not defer_scoring:
+            self._compare_nodes()
+
+    def _network_features(self, network: Network) -> List[Feature]:
+        return network.nodes
+
+    def _compare(self, a_node: Node, b_node: Node) -> NodeComparison:
+        cached = self._cached_scores(a_node, b_node)
+        if cached is not None:
+            return NodeComparison(
+                a_node, b_node, scores=cached.scores, distance_km=cached.distance_km
+            )
 
-        self._compare_nodes()
+        comparison = NodeComparison(a_node, b_node)
+        self._cache_scores(comparison, comparison.distance_km)
+        return comparison
+
+    def _nearby_node_pairs(
+            self, changed_a: Set[str], changed_b: Set[str]
+    ) -> Iterator[Tuple[Node, Node]]:
+        """
+        Pairs of nodes within the match radius's bounding box, where at least one of
+        the nodes is in the given changed IDs, found via spatial indexes.
+        """
+        nodes_a = self.network_a.nodes
+        nodes_b = self.network_b.nodes
+        index_a, rects_a = node_spatial_index(nodes_a)
+        index_b, rects_b = node_spatial_index(nodes_b)
+
+        for i, a_node in enumerate(nodes_a):
+            if a_node.id in changed_a:
+                search = search_rectangle(rects_a[i], self.match_radius_km)
+                for j in index_b.intersects(search):
+                    yield a_node, nodes_b[j]
+
+        for j, b_node in enumerate(nodes_b):
+            if b_node.id in changed_b:
+                search = search_rectangle(rects_b[j], self.match_radius_km)
+                for i in index_a.intersects(search):
+                    # Pairs with a changed A node have been found already
+                    if nodes_a[i].id not in changed_a:
+                        yield nodes_a[i], b_node
+
+    def _node_pairs_to_compare(self) -> Iterator[Tuple[Node, Node]]:
+        """
+        Pairs of nodes that might match. If there's a previous run, pairs of nodes
+        that haven't changed since are only compared if they were compared then, so
+        only the changed nodes' neighbourhoods need searching.
+        """
+        if self.previous is None:
+            # Everything has "changed", so every node in A searches its neighbourhood
+            yield from self._nearby_node_pairs(
+                set(n.id for n in self.network_a.nodes), set()
+            )
+            return
+
+        unchanged_a = self.previous.unchanged_ids_a(self.hashes_a)
+        unchanged_b = self.previous.unchanged_ids_b(self.hashes_b)
+        changed_a = set(self.hashes_a.keys()).difference(unchanged_a)
+        changed_b = set(self.hashes_b.keys()).difference(unchanged_b)
+        logger.info(
+            f"Incremental consolidation: {len(changed_a)} nodes changed in A, "
+            + f"{len(changed_b)} in B"
+        )
+
+        for a_id, b_id in self.previous.candidates:
+            if a_id in unchanged_a and b_id in unchanged_b:
+                yield self.network_a.nodesByNodeId[a_id], self.network_b.nodesByNodeId[b_id]
+
+        yield from self._nearby_node_pairs(changed_a, changed_b)
 
     def _compare_nodes(self):
         """
         Create NodeComparisons, and check for either auto-merging or give to the UI to
         ask the user.
         """
-        user_comparisons = list()
-
-        for a_node in self.network_a.nodes:
-            for b_node in self.network_b.nodes:
-                comparison = NodeComparison(a_node, b_node)
-                if comparison.distance_km > self.match_radius_km:
-                    # No chance of match, just add immediate no-consolidate outcome
-                    self.add_comparison_outcomes(
-                        [
-                            NodeComparisonOutcome(
-                                comparison=comparison, consolidate=False
-                            )
-                        ]
-                    )
+        ask_candidates = list(self.score_candidates())
+        self.finish_scoring()
+        self.user_comparisons = sorted(
+            self.without_consolidated(ask_candidates), key=review_priority
+        )
 
-                elif comparison.confidence > self.merge_threshold:
-                    # Auto-consolidate
-                    similar_fields = comparison.get_high_scoring_properties()
-                    reason = ConsolidationReason(
-                        feature_type="NODE",
-                        primary=comparison.node_a,
-                        secondary=comparison.node_b,
-                        confidence=comparison.confidence,
-                        similar_fields=similar_fields,
-                        manual=False,
-                    )
-                    outcome = NodeComparisonOutcome(
-                        comparison=comparison, consolidate=reason
-                    )
-                    self.add_comparison_outcomes([outcome])
+    def score_candidates(
+            self, feedback: Optional[QgsFeedback] = None
+    ) -> Iterator[NodeComparison]:
+        """
+        Compare nearby nodes, yielding the comparisons to ask the user about as they're
+        found. Comparisons confident enough to auto-merge are kept for finish_scoring.
+        Stops early if the feedback is cancelled.
+        """
+        self.merge_candidates = list()
+        self.compared_pairs = list()
 
-                elif comparison.confidence >= self.ask_threshold:
-                    #   todo: get user pref for which network to keep
-                    user_comparisons.append(comparison)
+        for a_node, b_node in self._node_pairs_to_compare():
+            if feedback is not None and feedback.isCanceled():
+                break
 
-        self.user_comparisons = user_comparisons
+            comparison = self._compare(a_node, b_node)
+            if comparison.distance_km > self.match_radius_km:
+                # No chance of match, so nothing to record
+                continue
 
-    def get_comparisons_to_ask_user(self) -> List[NodeComparison]:
-        return self.user_comparisons
+            if comparison.confidence > self.merge_threshold:
+                self.compared_pairs.append((a_node.id, b_node.id))
+                self.merge_candidates.append(comparison)
 
-    def add_comparison_outcomes(
-            self,
-            outcomes: Iterable[NodeComparisonOutcome],
-    ):
-        self.outcomes.extend(outcomes)
+            elif comparison.confidence >= self.ask_threshold:
+                #   todo: get user pref for which network to keep
+                self.compared_pairs.append((a_node.id, b_node.id))
+                yield comparison
+
+        if self.score_cache is not None:
+            self.score_cache.flush()
 
-    def _gather_nodes_from_outcomes(self, outcomes: List[NodeComparisonOutcome]):
+    def restore_scoring(
+            self, asked: Iterable[ScoredPair], merged: Iterable[ScoredPair]
+    ) -> List[NodeComparison]:
         """
-        This method implements the results of a comparison i.e. consolidating (or not)
-        and creates the consolidated network's Nodes.
+        Restore the comparisons scored earlier, e.g. in a review that's being resumed,
+        instead of calling score_candidates(). Returns the comparisons to ask the user
+        about; finish_scoring() must still be called to auto-consolidate.
         """
 
-        # Index of all nodes
-        nodes_a = {o.comparison.node_a.id: o.comparison.node_a for o in outcomes}
-        nodes_b = {o.comparison.node_b.id: o.comparison.node_b for o in outcomes}
+        def _restore(pair: ScoredPair) -> NodeComparison:
+            return NodeComparison(
+                self.network_a.nodesByNodeId[pair.a_id],
+                self.network_b.nodesByNodeId[pair.b_id],
+                scores=pair.scores,
+                distance_km=pair.distance_km,
+            )
+
+        asked_comparisons = [_restore(p) for p in asked]
+        self.merge_candidates = [_restore(p) for p in merged]
+        self.compared_pairs = [
+            (c.node_a.id, c.node_b.id)
+            for c in self.merge_candidates + asked_comparisons
+        ]
+        return asked_comparisons
+
+    def finish_scoring(
+            self, keep_a: Iterable[str] = (), keep_b: Iterable[str] = ()
+    ) -> List[ConsolidationReason]:
+        """
+        Auto-consolidate the merge candidates, making sure each node is only
+        consolidated once. Nodes in keep_a/keep_b (e.g. ones the user has already
+        decided to consolidate) aren't auto-consolidated.
+        """
+        keep_a = set(keep_a)
+        keep_b = set(keep_b)
+        candidates = [
+            c
+            for c in self.merge_candidates
+            if c.node_a.id not in keep_a and c.node_b.id not in keep_b
+        ]
+
+        reasons: List[ConsolidationReason] = list()
+        for comparison in assign_one_to_one(
+            candidates,
+            key_a=lambda c: c.node_a.id,
+            key_b=lambda c: c.node_b.id,
+            weight=lambda c: c.confidence,
+        ):
+            similar_fields = comparison.get_high_scoring_properties()
+            reason = ConsolidationReason(
+                feature_type=self.FEATURE_TYPE,
+                primary=comparison.node_a,
+                secondary=comparison.node_b,
+                confidence=comparison.confidence,
+                similar_fields=similar_fields,
+                manual=False,
+            )
+            self.ledger.record(reason)
+            reasons.append(reason)
+
+        return reasons
+
+    def without_consolidated(
+            self, comparisons: Iterable[NodeComparison]
+    ) -> List[NodeComparison]:
+        """
+        Nodes that have been auto-consolidated can't be consolidated again, so don't
+        ask the user about them.
+        """
+        return [
+            c
+            for c in comparisons
+            if not (
+                self.ledger.is_consumed_a(self.FEATURE_TYPE, c.node_a.id)
+                or self.ledger.is_consumed_b(self.FEATURE_TYPE, c.node_b.id)
+            )
+        ]
 
-        # Index which nodes from A and B have been consolidated
-        consolidated_ids_a: Set[str] = set(
-            o.comparison.node_a.id
-            for o in outcomes
-            if isinstance(o.consolidate, ConsolidationReason)
-        )
-        consolidated_ids_b: Set[str] = set(
-            o.comparison.node_b.id
-            for o in outcomes
-            if isinstance(o.consolidate, ConsolidationReason)
-        )
+    def get_comparisons_to_ask_user(self) -> List[NodeComparison]:
+        return self.user_comparisons
 
-        # Index which nodes from A and B aren't consolidated, and can be directly output
-        unconsolidated_ids_a: Set[str] = set(nodes_a.keys()).difference(
-            consolidated_ids_a
-        )
-        unconsolidated_ids_b: Set[str] = set(nodes_b.keys()).difference(
-            consolidated_ids_b
-        )
+    def _gather_nodes_from_ledger(self):
+        """
+        This method implements the results of the comparisons recorded in the ledger
+        i.e. consolidating (or not) and creates the consolidated network's Nodes.
+        """
 
         # Output nodes
         nodes: Dict[str, Node]
         nodes = dict()
 
         # Create and gather consolidated nodes
-        for outcome in outcomes:
-            if isinstance(outcome.consolidate, ConsolidationReason):
-                assert isinstance(outcome.consolidate.primary, Node)
-                assert isinstance(outcome.consolidate.secondary, Node)
-
-                provenance_data = generate_provenance_data(outcome.consolidate)
-
-                consolidated_node = self._merge_features(
-                    outcome.consolidate.primary,
-                    outcome.consolidate.secondary,
-                    provenance_data,
-                    self.new_ofds_network,
-                )
-                logger.info(f"Creating consolidated node: {consolidated_node.name}")
-                assert consolidated_node.id not in nodes
-                assert isinstance(consolidated_node, Node)
-                nodes[consolidated_node.id] = consolidated_node
+        for reason in self.ledger.merges_of(self.FEATURE_TYPE):
+            assert isinstance(reason.primary, Node)
+            assert isinstance(reason.secondary, Node)
+
+            provenance_data = generate_provenance_data(reason, self.run_provenance)
+
+            consolidated_node = self._merge_features(
+                reason.primary,
+                reason.secondary,
+                provenance_data,
+                self.new_ofds_network,
+            )
+            logger.info(f"Creating consolidated node: {consolidated_node.name}")
+            assert consolidated_node.id not in nodes
+            assert isinstance(consolidated_node, Node)
+            nodes[consolidated_node.id] = consolidated_node
 
         # Gather unconsolidated nodes from A
-        for _id in unconsolidated_ids_a:
+        for node in self.network_a.nodes:
+            if self.ledger.is_consumed_a(self.FEATURE_TYPE, node.id):
+                continue
             new_id = self.allocate_new_feature_id()
-            self.network_a_ids_map[_id] = new_id
-            nodes[new_id] = nodes_a[_id].with_new_id(new_id, ofds_network=self.new_ofds_network)
+            self.network_a_ids_map[node.id] = new_id
+            nodes[new_id] = node.with_new_id(new_id, ofds_network=self.new_ofds_network)
 
-        # Gather unconsolidated nodes from B, creating new IDs if there's a clash
-        for _id in unconsolidated_ids_b:
+        # Gather unconsolidated nodes from B
+        for node in self.network_b.nodes:
+            if self.ledger.is_consumed_b(self.FEATURE_TYPE, node.id):
+                continue
             new_id = self.allocate_new_feature_id()
-            self.network_b_ids_map[_id] = new_id
-            nodes[new_id] = nodes_b[_id].with_new_id(new_id, ofds_network=self.new_ofds_network)
-
-        return set(nodes.values())
+            self.network_b_ids_map[node.id] = new_id
+            nodes[new_id] = node.with_new_id(new_id, ofds_network=self.new_ofds_network)
 
-    def _remap_span_node_ids(self, span: Span, lookup: Dict[str, str]) -> Span:
-        new_properties = span.properties.copy()
-        p_start = new_properties["start"].copy()
-        p_end = new_properties["end"].copy()
-
-        # Check in case properties have been loaded as nested JSON string
-        if isinstance(p_start, str):
-            p_start = json.loads(p_start)
-
-        if isinstance(p_end, str):
-            p_end = json.loads(p_end)
-
-        try:
-            p_start["id"] = lookup[p_start["id"]]
-            p_end["id"] = lookup[p_end["id"]]
-        except KeyError:
-            raise OFDSInvalidFeature(f"Error: Span {span.id} has an invalid start/end")
-
-        new_properties["start"] = p_start
-        new_properties["end"] = p_end
-
-        new_span = Span(
-            span.id,
-            properties=new_properties,
-            featureId=span.featureId,
-            featureGeometry=span.featureGeometry,
-            ofds_network=self.new_ofds_network,
-        )
-        return new_span
+        return list(nodes.values())
 
     def get_networks_with_consolidated_nodes(self) -> Tuple[Network, Network]:
-        nodes = list(self._gather_nodes_from_outcomes(self.outcomes))
+        nodes = self._gather_nodes_from_ledger()
         qgs_layer, nodes = create_qgis_geojson_layer_from_nodes(nodes)
 
-        # Network A IDs never change, so no remapping needed
+        # Every Node has a new ID in the ID maps, but only the spans whose start/end
+        # IDs actually changed are copied
         new_network_a = Network(
             nodes=nodes,
             nodesLayer=qgs_layer,
-            spans=list(self._remap_span_node_ids(span, lookup=self.network_a_ids_map) for span in self.network_a.spans),
+            spans=remap_spans_node_ids(self.network_a.spans, self.network_a_ids_map),
             spansLayer=self.network_a.spansLayer,
             ofds_network=self.network_a.ofds_network,
+            provenance=self.run_provenance,
         )
 
-        # Network B span start/end IDs may be remapped
         new_network_b = Network(
             nodes=nodes,
             nodesLayer=qgs_layer,
-            spans=list(self._remap_span_node_ids(span, lookup=self.network_b_ids_map) for span in self.network_b.spans),
+            spans=remap_spans_node_ids(self.network_b.spans, self.network_b_ids_map),
             spansLayer=self.network_b.spansLayer,
             ofds_network=self.network_b.ofds_network,
+            provenance=self.run_provenance,
         )
 
         return new_network_a, new_network_b
@@ -294,120 +785,194 @@ class NetworkNodesConsolidator(AbstractNetworkConsolidator[Node, NodeComparison]
 
 class NetworkSpansConsolidator(AbstractNetworkConsolidator[Span, SpanComparison]):
     FeatureCls = Span
+    FEATURE_TYPE = "SPAN"
 
-    PROPS_MERGE_CONFIG = SPANS_PROPERTIES_MERGE_CONFIG
-
-    network_a: Network
-    network_b: Network
+    PROPS_MERGE_PLAN = SPANS_PROPERTIES_MERGE_PLAN
 
     matched_spans_in_a: Set[str]
     matched_spans_in_b: Set[str]
 
-    comparison_outcomes: List[NodeComparisonOutcome]
+    match_distance_km: float
 
-    def __init__(self, network_a: Network, network_b: Network, new_ofds_network: NetworkDescription):
-        super().__init__()
+    def __init__(self, network_a: Network, network_b: Network, new_ofds_network: NetworkDescription,
+                 match_distance_km: float = 0.05, previous: Optional[StageRecord] = None,
+                 score_cache: Optional[ScoreCache] = None,
+                 ledger: Optional[ConsolidationLedger] = None):
+        """
+        Pass the Nodes stage's consolidator's ledger to record the whole run in it.
+        """
+        super().__init__(previous, score_cache, ledger)
 
         self.network_a = network_a
         self.network_b = network_b
+        self.match_distance_km = match_distance_km
         self.matched_spans_in_a = set()
         self.matched_spans_in_b = set()
-        self.comparison_outcomes = list()
         self.new_ofds_network = new_ofds_network
 
-    def get_comparisons_to_ask_user(self) -> List[SpanComparison]:
-        network_a_index: Dict[Tuple[str, str], Span]
-        network_a_index = dict()
+        # Carry on the Nodes stage's run provenance, if this is the same run
+        self.run_provenance = network_a.provenance or generate_run_provenance(
+            network_a.source_uris() + network_b.source_uris()
+        )
 
-        # Build index of lookups from (start, end) to Span for Network A
-        for span_a in self.network_a.spans:
-            network_a_index[(span_a.start_id, span_a.end_id)] = span_a
+    def get_comparisons_to_ask_user(self) -> List[SpanComparison]:
+        # Index of Network A's spans by their start/end Nodes, in either direction
+        network_a_index = SpanEndpointIndex(self.network_a.spans)
 
         matches: List[SpanComparison]
         matches = list()
 
-        # Check Spans in Network B against Network A via the index
+        # Check Spans in Network B against Network A via the index, comparing with
+        # every span between the same Nodes, as parallel spans are common
+        pairs: List[Tuple[Span, Span]] = list()
         for span_b in self.network_b.spans:
-            # See if this span matches one in Network A
-            span_a_lookup = network_a_index.get((span_b.start_id, span_b.end_id))
+            for span_a in network_a_index.get(span_b):
+                pairs.append((span_a, span_b))
+                self.matched_spans_in_a.add(span_a.id)
+                self.matched_spans_in_b.add(span_b.id)
 
-            # If not, check reverse end/start
-            if span_a_lookup is None:
-                span_a_lookup = network_a_index.get((span_b.end_id, span_b.start_id))
+        pairs.extend(self._get_geometric_pairs())
 
-            # Got a match!
-            if span_a_lookup is not None:
-                matches.append(SpanComparison(span_a_lookup, span_b))
-                self.matched_spans_in_a.add(span_a_lookup.id)
-                self.matched_spans_in_b.add(span_b.id)
+        matches = self._compare_all(pairs)
+        matches.sort(key=review_priority)
+
+        self.compared_pairs = [(c.span_a.id, c.span_b.id) for c in matches]
+
+        if self.score_cache is not None:
+            self.score_cache.flush()
 
         return matches
 
-    def _gather_spans_from_outcomes(self, outcomes: List[SpanComparisonOutcome]):
+    def _network_features(self, network: Network) -> List[Feature]:
+        return network.spans
+
+    def _compare_all(self, pairs: List[Tuple[Span, Span]]) -> List[SpanComparison]:
+        """Compare pairs of spans, looking up their cached scores in one batch."""
+        cached = self._cached_scores_many(pairs)
+
+        comparisons: List[SpanComparison] = list()
+        for span_a, span_b in pairs:
+            scores = cached.get((span_a.id, span_b.id))
+            if scores is not None:
+                comparisons.append(SpanComparison(span_a, span_b, scores=scores.scores))
+                continue
+
+            comparison = SpanComparison(span_a, span_b)
+            self._cache_scores(comparison)
+            comparisons.append(comparison)
+        return comparisons
+
+    def _get_geometric_pairs(self) -> List[Tuple[Span, Span]]:
         """
-        This method implements the results of a comparison i.e. consolidating (or not)
-        and creates the consolidated network's Spans.
+        Find spans that weren't matched by their start/end nodes, but follow the same
+        route, i.e. are within match_distance_km of each other (Hausdorff distance).
+
+        Candidates come from a bounding box query on Network A's spatial index, so only
+        nearby spans have their geometries compared.
         """
+        if self.match_distance_km <= 0:
+            return []
 
-        # Index of all spans
-        spans_a = {s.id: s for s in self.network_a.spans}
-        spans_b = {s.id: s for s in self.network_b.spans}
+        pairs: List[Tuple[Span, Span]] = list()
 
-        # Index which nodes from A and B have been consolidated
-        consolidated_ids_a: Set[str] = set(
-            o.comparison.span_a.id
-            for o in outcomes
-            if isinstance(o.consolidate, ConsolidationReason)
-        )
-        consolidated_ids_b: Set[str] = set(
-            o.comparison.span_b.id
-            for o in outcomes
-            if isinstance(o.consolidate, ConsolidationReason)
-        )
+        # Hausdorff distance is measured on lon/lat geometries with their longitudes
+        # scaled to the span's latitude, so it's in degrees of latitude
+        _, max_distance = km_to_degrees(self.match_distance_km)
 
-        # Index which nodes from A and B aren't consolidated, and can be directly output
-        unconsolidated_ids_a: Set[str] = set(spans_a.keys()).difference(
-            consolidated_ids_a
-        )
+        # Network A spans' bounding boxes, and the same grown by match_distance_km
+        bboxes_a: Dict[str, Tuple[QgsRectangle, QgsRectangle]] = dict()
 
-        unconsolidated_ids_b: Set[str] = set(spans_b.keys()).difference(
-            consolidated_ids_b
-        )
+        # Network A spans scaled to each band of latitude they're compared in, so
+        # they're only scaled once however many Network B spans they're near
+        scaled_a: Dict[Tuple[str, int], QgsGeometry] = dict()
+
+        for span_b in self.network_b.spans:
+            if span_b.id in self.matched_spans_in_b:
+                continue
+
+            bbox_b = span_b.featureGeometry.boundingBox()
+            search_b = search_rectangle(bbox_b, self.match_distance_km)
+            band = round(bbox_b.center().y() / SCALE_LATITUDE_BAND_DEGREES)
+            latitude = band * SCALE_LATITUDE_BAND_DEGREES
+            geometry_b: Optional[QgsGeometry] = None
+
+            for feature_id in self.network_a.spansSpacialIndex.intersects(search_b):
+                # The index can include spans from other networks in the same layer
+                span_a = self.network_a.spansByFeatureId.get(feature_id)
+                if span_a is None or span_a.id in self.matched_spans_in_a:
+                    continue
+
+                if span_a.id not in bboxes_a:
+                    bbox_a = span_a.featureGeometry.boundingBox()
+                    bboxes_a[span_a.id] = (
+                        bbox_a,
+                        search_rectangle(bbox_a, self.match_distance_km),
+                    )
+                bbox_a, search_a = bboxes_a[span_a.id]
+
+                # Within the distance of each other, each span's bounding box is inside
+                # the other's grown by the distance, which is much quicker to check
+                if not (search_b.contains(bbox_a) and search_a.contains(bbox_b)):
+                    continue
+
+                geometry_a = scaled_a.get((span_a.id, band))
+                if geometry_a is None:
+                    geometry_a = scaled_to_latitude(span_a.featureGeometry, latitude)
+                    scaled_a[(span_a.id, band)] = geometry_a
+                if geometry_b is None:
+                    geometry_b = scaled_to_latitude(span_b.featureGeometry, latitude)
+
+                distance = geometry_b.hausdorffDistance(geometry_a)
+                if 0 <= distance <= max_distance:
+                    pairs.append((span_a, span_b))
+
+        logger.info(f"Found {len(pairs)} span comparisons by route")
+
+        return pairs
+
+    def _gather_spans_from_ledger(self):
+        """
+        This method implements the results of the comparisons recorded in the ledger
+        i.e. consolidating (or not) and creates the consolidated network's Spans.
+        """
 
         # Output spans
         spans: Dict[str, Span]
         spans = dict()
 
         # Create + Gather consolidated spans
-        for outcome in outcomes:
-            if isinstance(outcome.consolidate, ConsolidationReason):
-                assert isinstance(outcome.consolidate.primary, Span)
-                assert isinstance(outcome.consolidate.secondary, Span)
-
-                provenance_data = generate_provenance_data(outcome.consolidate)
-
-                consolidated_span = self._merge_features(
-                    outcome.consolidate.primary,
-                    outcome.consolidate.secondary,
-                    provenance_data,
-                    self.new_ofds_network,
-                )
-                logger.info(f"Creating consolidated span: {consolidated_span.name}")
-                assert consolidated_span.id not in spans
-                assert isinstance(consolidated_span, Span)
-                spans[consolidated_span.id] = consolidated_span
-
-        # Gather unconsolidated nodes from A
-        for _id in unconsolidated_ids_a:
+        for reason in self.ledger.merges_of(self.FEATURE_TYPE):
+            assert isinstance(reason.primary, Span)
+            assert isinstance(reason.secondary, Span)
+
+            provenance_data = generate_provenance_data(reason, self.run_provenance)
+
+            consolidated_span = self._merge_features(
+                reason.primary,
+                reason.secondary,
+                provenance_data,
+                self.new_ofds_network,
+            )
+            logger.info(f"Creating consolidated span: {consolidated_span.name}")
+            assert consolidated_span.id not in spans
+            assert isinstance(consolidated_span, Span)
+            spans[consolidated_span.id] = consolidated_span
+
+        # Gather unconsolidated spans from A
+        for span in self.network_a.spans:
+            if self.ledger.is_consumed_a(self.FEATURE_TYPE, span.id):
+                continue
             new_id = self.allocate_new_feature_id()
-            spans[new_id] = spans_a[_id].with_new_id(new_id, ofds_network=self.new_ofds_network)
+            spans[new_id] = span.with_new_id(new_id, ofds_network=self.new_ofds_network)
 
-        # Gather unconsolidated nodes from B, creating new IDs if there's a clash
-        for _id in unconsolidated_ids_b:
+        # Gather unconsolidated spans from B, creating new IDs if there's a clash
+        for span in self.network_b.spans:
+            if self.ledger.is_consumed_b(self.FEATURE_TYPE, span.id):
+                continue
             new_id = self.allocate_new_feature_id()
-            spans[new_id] = spans_b[_id].with_new_id(new_id, ofds_network=self.new_ofds_network)
+            spans[new_id] = span.with_new_id(new_id, ofds_network=self.new_ofds_network)
 
-        return set(spans.values())
+        return list(spans.values())
 
     def get_consolidated_network_from_outcomes(
             self,
@@ -420,7 +985,8 @@ class NetworkSpansConsolidator(AbstractNetworkConsolidator[Span, SpanComparison]
 
         Returns the consolidated Network.
         """
-        spans = list(self._gather_spans_from_outcomes(outcomes))
+        self.add_comparison_outcomes(outcomes)
+        spans = self._gather_spans_from_ledger()
 
         spans_layer, new_spans = create_qgis_geojson_layer_from_spans(spans)
 
@@ -431,4 +997,5 @@ class NetworkSpansConsolidator(AbstractNetworkConsolidator[Span, SpanComparison]
             nodesLayer=self.network_a.nodesLayer,
             spansLayer=spans_layer,
             ofds_network=self.new_ofds_network,
+            provenance=self.run_provenance,
         )
\ No newline at end of file
@@ -0,0 +1,141 @@
+import dataclasses
+import datetime
+import json
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from .settings import Settings
+
+logger = logging.getLogger(__name__)
+
+RUN_RECORD_FORMAT_VERSION = 1
+
+
+@dataclass(frozen=True)
+class DecisionRecord:
+    """
+    A user's decision on a comparison, along with the content hashes of the two
+    features when it was made, so it can be reused if neither has changed since.
+    """
+
+    a_id: str
+    b_id: str
+    a_hash: str
+    b_hash: str
+    consolidate: bool
+    confidence: float
+
+    def to_json(self) -> Dict[str, Any]:
+        return dataclasses.asdict(self)
+
+    @classmethod
+    def from_json(cls, obj: Dict[str, Any]) -> "DecisionRecord":
+        return cls(**obj)
+
+
+@dataclass
+class StageRecord:
+    """What happened in one stage (Nodes or Spans) of a consolidation run."""
+
+    # Feature ID -> content hash, for Network A and B
+    hashes_a: Dict[str, str] = field(default_factory=dict)
+    hashes_b: Dict[str, str] = field(default_factory=dict)
+
+    # Pairs of features (A ID, B ID) that were compared
+    candidates: List[Tuple[str, str]] = field(default_factory=list)
+
+    decisions: List[DecisionRecord] = field(default_factory=list)
+
+    def unchanged_ids_a(self, hashes_a: Dict[str, str]) -> set:
+        return set(_id for _id, h in hashes_a.items() if self.hashes_a.get(_id) == h)
+
+    def unchanged_ids_b(self, hashes_b: Dict[str, str]) -> set:
+        return set(_id for _id, h in hashes_b.items() if self.hashes_b.get(_id) == h)
+
+    def decisions_by_pair(self) -> Dict[Tuple[str, str], DecisionRecord]:
+        return {(d.a_id, d.b_id): d for d in self.decisions}
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "hashesA": self.hashes_a,
+            "hashesB": self.hashes_b,
+            "candidates": [list(c) for c in self.candidates],
+            "decisions": [d.to_json() for d in self.decisions],
+        }
+
+    @classmethod
+    def from_json(cls, obj: Dict[str, Any]) -> "StageRecord":
+        return cls(
+            hashes_a=obj.get("hashesA", {}),
+            hashes_b=obj.get("hashesB", {}),
+            candidates=[(a, b) for a, b in obj.get("candidates", [])],
+            decisions=[DecisionRecord.from_json(d) for d in obj.get("decisions", [])],
+        )
+
+
+@dataclass
+class RunRecord:
+    """
+    The inputs and decisions of a consolidation run, saved so that when one of the
+    input networks is updated, the next run only has to re-compare the features that
+    changed, and can reuse the user's decisions on everything else.
+    """
+
+    network_a_id: str
+    network_b_id: str
+    settings: Dict[str, Any]
+    nodes: StageRecord
+    spans: Optional[StageRecord] = None
+    generated_at: str = field(
+        default_factory=lambda: datetime.datetime.now(datetime.timezone.utc).isoformat()
+    )
+
+    def is_compatible(
+            self, network_a_id: str, network_b_id: str, settings: Settings
+    ) -> bool:
+        """
+        Whether this run's decisions can be reused for a new run, i.e. it's for the
+        same networks, with the same settings.
+        """
+        return (
+                self.network_a_id == network_a_id
+                and self.network_b_id == network_b_id
+                and self.settings == dataclasses.asdict(settings)
+        )
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "version": RUN_RECORD_FORMAT_VERSION,
+            "generatedAtTime": self.generated_at,
+            "networkA": self.network_a_id,
+            "networkB": self.network_b_id,
+            "settings": self.settings,
+            "nodes": self.nodes.to_json(),
+            "spans": self.spans.to_json() if self.spans else None,
+        }
+
+    @classmethod
+    def from_json(cls, obj: Dict[str, Any]) -> "RunRecord":
+        if obj.get("version") != RUN_RECORD_FORMAT_VERSION:
+            raise ValueError(f"Unsupported run record version {obj.get('version')}")
+        return cls(
+            network_a_id=obj["networkA"],
+            network_b_id=obj["networkB"],
+            settings=obj["settings"],
+            nodes=StageRecord.from_json(obj["nodes"]),
+            spans=StageRecord.from_json(obj["spans"]) if obj.get("spans") else None,
+            generated_at=obj.get("generatedAtTime", ""),
+        )
+
+
+def write_run_record(path: Union[str, Path], record: RunRecord):
+    with Path(path).open("w", encoding="utf-8") as f:
+        json.dump(record.to_json(), f)
+    logger.info(f"Saved run record to '{path}'")
+
+
+def read_run_record(path: Union[str, Path]) -> RunRecord:
+    with Path(path).open("r", encoding="utf-8") as f:
+        return RunRecord.from_json(json.load(f))
@@ -0,0 +1,176 @@
+import datetime
+import json
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Sequence, Union
+
+from .files import open_text_file
+from .hashing import content_hash, feature_content_hash, provenance_key
+from .network import Feature
+from .qgis_utils import QVariantJSONEncoder, write_geojson_from_features
+
+logger = logging.getLogger(__name__)
+
+DELTA_MANIFEST_FILENAME = "manifest.json"
+
+
+def read_geojson_features(path: Union[str, Path]) -> List[Dict[str, Any]]:
+    """Read the features from a (possibly compressed) GeoJSON file, as plain dicts."""
+    with open_text_file(path, "r") as f:
+        return json.load(f).get("features", [])
+
+
+@dataclass
+class FeatureDelta:
+    """
+    The differences between a previous consolidated output and a new one, for either
+    Nodes or Spans. Features are matched up by the source features they were derived
+    from (see provenance_key), and compared by content hash.
+    """
+
+    added: List[Feature] = field(default_factory=list)
+    changed: List[Feature] = field(default_factory=list)
+    removed: List[Dict[str, Any]] = field(default_factory=list)
+    unchanged_count: int = 0
+
+    # provenance key -> content hash, for the added and changed features
+    hashes: Dict[str, str] = field(default_factory=dict)
+
+    @property
+    def is_empty(self) -> bool:
+        return not (self.added or self.changed or self.removed)
+
+
+def compute_feature_delta(
+    previous_features: Iterable[Dict[str, Any]], features: Sequence[Feature]
+) -> FeatureDelta:
+    delta = FeatureDelta()
+    duplicate_previous: List[Dict[str, Any]] = list()
+
+    previous_by_key: Dict[str, Dict[str, Any]] = dict()
+    previous_hashes: Dict[str, str] = dict()
+    for previous in previous_features:
+        key = provenance_key(previous.get("properties", {}))
+        if key in previous_by_key:
+            # Don't silently lose one of them, report the later one as removed
+            logger.warning(
+                f"Previous output has more than one feature derived from {key}, "
+                + "treating all but the first as removed"
+            )
+            duplicate_previous.append(previous)
+            continue
+        previous_by_key[key] = previous
+        previous_hashes[key] = content_hash(
+            previous.get("properties", {}), previous.get("geometry")
+        )
+
+    seen_keys = set()
+    for feature in features:
+        key = provenance_key(feature.properties)
+        if key in seen_keys:
+            logger.warning(
+                f"More than one feature derived from {key}, treating all but the "
+                + "first as added"
+            )
+            delta.added.append(feature)
+            continue
+        seen_keys.add(key)
+        new_hash = feature_content_hash(feature)
+
+        old_hash = previous_hashes.get(key)
+        if old_hash is None:
+            delta.added.append(feature)
+            delta.hashes[key] = new_hash
+        elif old_hash != new_hash:
+            delta.changed.append(feature)
+            delta.hashes[key] = new_hash
+        else:
+            delta.unchanged_count += 1
+
+    delta.removed = [
+        f for k, f in previous_by_key.items() if k not in seen_keys
+    ] + duplicate_previous
+
+    return delta
+
+
+def write_feature_delta(output_dir: Union[str, Path], name: str, delta: FeatureDelta):
+    """
+    Write the added, changed and removed features to `<name>_added.geojson` etc. in
+    output_dir. Removed features are written as they were in the previous output.
+    """
+    output_dir = Path(output_dir)
+
+    for kind, features in [("added", delta.added), ("changed", delta.changed)]:
+        with Path(output_dir, f"{name}_{kind}.geojson").open("w", encoding="utf-8") as f:
+            write_geojson_from_features(f, features)
+
+    with Path(output_dir, f"{name}_removed.geojson").open("w", encoding="utf-8") as f:
+        json.dump(
+            {"type": "FeatureCollection", "features": delta.removed},
+            f,
+            cls=QVariantJSONEncoder,
+        )
+
+
+def _delta_manifest_entry(delta: FeatureDelta) -> Dict[str, Any]:
+    return {
+        "counts": {
+            "added": len(delta.added),
+            "changed": len(delta.changed),
+            "removed": len(delta.removed),
+            "unchanged": delta.unchanged_count,
+        },
+        "added": {provenance_key(f.properties): f.id for f in delta.added},
+        "changed": {provenance_key(f.properties): f.id for f in delta.changed},
+        "removed": {
+            provenance_key(f.get("properties", {})): f.get("properties", {}).get("id")
+            for f in delta.removed
+        },
+        "hashes": delta.hashes,
+    }
+
+
+def export_delta(
+    output_dir: Union[str, Path],
+    previous_nodes_path: Union[str, Path],
+    previous_spans_path: Union[str, Path],
+    nodes: Sequence[Feature],
+    spans: Sequence[Feature],
+) -> Dict[str, Any]:
+    """
+    Compare a new consolidated network with the previous consolidated output files,
+    and write only the added, changed and removed Nodes/Spans, plus a manifest
+    describing them, to output_dir.
+
+    Returns the manifest.
+    """
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    nodes_delta = compute_feature_delta(read_geojson_features(previous_nodes_path), nodes)
+    spans_delta = compute_feature_delta(read_geojson_features(previous_spans_path), spans)
+
+    write_feature_delta(output_dir, "nodes", nodes_delta)
+    write_feature_delta(output_dir, "spans", spans_delta)
+
+    manifest = {
+        "generatedAtTime": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "previous": {
+            "nodes": Path(previous_nodes_path).name,
+            "spans": Path(previous_spans_path).name,
+        },
+        "nodes": _delta_manifest_entry(nodes_delta),
+        "spans": _delta_manifest_entry(spans_delta),
+    }
+
+    with Path(output_dir, DELTA_MANIFEST_FILENAME).open("w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+
+    logger.info(
+        f"Wrote delta to '{output_dir}': nodes {manifest['nodes']['counts']}, "
+        + f"spans {manifest['spans']['counts']}"
+    )
+
+    return manifest
@@ -1,2 +1,10 @@
 class ModelInvalidState(Exception):
     pass
+
+
+class ExportError(Exception):
+    pass
+
+
+class UnsupportedCompression(Exception):
+    pass
@@ -0,0 +1,358 @@
+import json
+import logging
+from enum import Enum
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, List, Optional, Sequence, Type, Union
+
+from PyQt5.QtCore import QVariant
+from qgis.core import (
+    QgsCoordinateReferenceSystem,
+    QgsCoordinateTransformContext,
+    QgsFeature,
+    QgsFeedback,
+    QgsField,
+    QgsFields,
+    QgsGeometry,
+    QgsVectorFileWriter,
+    QgsWkbTypes,
+)
+
+from .exceptions import ExportError
+from .files import open_text_file, zstd_available
+from .network import Feature, Network, Node, Span
+from .qgis_utils import (
+    QVariantJSONEncoder,
+    geometry_to_geojson,
+    iter_with_feedback,
+    write_geojson_from_features,
+)
+
+logger = logging.getLogger(__name__)
+
+# OFDS GeoJSON is always WGS84 lon/lat
+OUTPUT_CRS = QgsCoordinateReferenceSystem("EPSG:4326")
+
+# Number of features handed to the OGR writer at a time
+EXPORT_BATCH_SIZE = 10000
+
+
+class ExportFormat(str, Enum):
+    """File formats the consolidated Nodes/Spans can be saved as."""
+
+    GEOJSON = "GEOJSON"
+    GEOJSON_GZIP = "GEOJSON_GZIP"
+    GEOJSON_ZSTD = "GEOJSON_ZSTD"
+    GEOPACKAGE = "GEOPACKAGE"
+    FLATGEOBUF = "FLATGEOBUF"
+
+    @property
+    def file_extension(self) -> str:
+        return EXPORT_FORMAT_OPTIONS[self]["file_extension"]
+
+    @property
+    def is_geojson(self) -> bool:
+        return EXPORT_FORMAT_OPTIONS[self]["driver"] is None
+
+    @property
+    def is_available(self) -> bool:
+        """zstd compression depends on an optional python package"""
+        return self != ExportFormat.GEOJSON_ZSTD or zstd_available()
+
+    @property
+    def name_filter(self) -> str:
+        """Filter string for use in a QFileDialog"""
+        options = EXPORT_FORMAT_OPTIONS[self]
+        return f"{options['label']} (*.{options['file_extension']})"
+
+
+EXPORT_FORMAT_OPTIONS: Dict[ExportFormat, Dict[str, Any]] = {
+    ExportFormat.GEOJSON: {
+        "label": "GeoJSON",
+        "file_extension": "geojson",
+        "driver": None,
+        "layer_options": [],
+    },
+    # Compressed GeoJSON is written as a stream, compressing as it goes
+    ExportFormat.GEOJSON_GZIP: {
+        "label": "GeoJSON (gzip)",
+        "file_extension": "geojson.gz",
+        "driver": None,
+        "layer_options": [],
+    },
+    ExportFormat.GEOJSON_ZSTD: {
+        "label": "GeoJSON (zstd)",
+        "file_extension": "geojson.zst",
+        "driver": None,
+        "layer_options": [],
+    },
+    # GeoPackage layers get an R-tree spatial index, and QGIS wraps writes to them in
+    # an OGR transaction, so batches are committed in bulk rather than per-feature.
+    ExportFormat.GEOPACKAGE: {
+        "label": "GeoPackage",
+        "file_extension": "gpkg",
+        "driver": "GPKG",
+        "layer_options": ["SPATIAL_INDEX=YES"],
+    },
+    # FlatGeobuf's spatial index is a packed Hilbert R-tree, built when the file is
+    # closed.
+    ExportFormat.FLATGEOBUF: {
+        "label": "FlatGeobuf",
+        "file_extension": "fgb",
+        "driver": "FlatGeobuf",
+        "layer_options": ["SPATIAL_INDEX=YES"],
+    },
+}
+
+# Field types that can't be stored directly in a GeoPackage/FlatGeobuf column, and are
+# written as JSON text instead.
+JSON_FIELD_TYPES = {QVariant.Type.Map, QVariant.Type.List, QVariant.Type.StringList}
+
+
+def _export_fields(cls: Type[Feature], features: Sequence[Feature]) -> QgsFields:
+    """
+    The OFDS schema fields for the Node/Span class, plus any other properties found on
+    the features. Nested properties are stored as JSON text columns.
+    """
+    fields = QgsFields()
+
+    for field in cls.get_qgs_fields():  # type: ignore[attr-defined]
+        if field.type() in JSON_FIELD_TYPES:
+            fields.append(QgsField(name=field.name(), type=QVariant.Type.String))
+        else:
+            fields.append(field)
+
+    names = set(fields.names())
+    for feature in features:
+        for k, v in feature.properties.items():
+            if k in names or v is None:
+                continue
+            names.add(k)
+            if isinstance(v, bool):
+                fields.append(QgsField(name=k, type=QVariant.Type.Bool))
+            elif isinstance(v, int):
+                fields.append(QgsField(name=k, type=QVariant.Type.LongLong))
+            elif isinstance(v, float):
+                fields.append(QgsField(name=k, type=QVariant.Type.Double))
+            else:
+                fields.append(QgsField(name=k, type=QVariant.Type.String))
+
+    return fields
+
+
+def _export_attribute(value: Any) -> Any:
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=QVariantJSONEncoder)
+    return value
+
+
+def _add_features(writer: QgsVectorFileWriter, batch: List[QgsFeature], path):
+    if batch and not writer.addFeatures(batch):
+        raise ExportError(f"Couldn't write to '{path}': {writer.errorMessage()}")
+
+
+def write_ogr_file_from_features(
+    path: Union[str, Path],
+    features: Sequence[Feature],
+    cls: Type[Feature],
+    export_format: ExportFormat,
+    feedback: Optional[QgsFeedback] = None,
+):
+    """
+    Write features to a single-layer GeoPackage or FlatGeobuf file, with a spatial
+    index, handing them to the writer in batches.
+    """
+    options = EXPORT_FORMAT_OPTIONS[export_format]
+    if options["driver"] is None:
+        raise ExportError(f"{export_format} can't be written with OGR")
+
+    fields = _export_fields(cls, features)
+    field_names = fields.names()
+
+    wkb_types = set(f.featureGeometry.wkbType() for f in features)
+    if len(wkb_types) == 1:
+        wkb_type = wkb_types.pop()
+        convert_to_multi = False
+    elif len(wkb_types) > 1:
+        # e.g. a mix of LineStrings and MultiLineStrings
+        wkb_type = QgsWkbTypes.multiType(features[0].featureGeometry.wkbType())
+        convert_to_multi = True
+    elif cls is Node:
+        wkb_type, convert_to_multi = QgsWkbTypes.Type.Point, False
+    else:
+        wkb_type, convert_to_multi = QgsWkbTypes.Type.LineString, False
+
+    save_options = QgsVectorFileWriter.SaveVectorOptions()
+    save_options.driverName = options["driver"]
+    save_options.layerName = f"{cls.__name__.lower()}s"
+    save_options.fileEncoding = "UTF-8"
+    save_options.layerOptions = options["layer_options"]
+
+    writer = QgsVectorFileWriter.create(
+        str(path),
+        fields,
+        wkb_type,
+        OUTPUT_CRS,
+        QgsCoordinateTransformContext(),
+        save_options,
+    )
+
+    try:
+        if writer.hasError() != QgsVectorFileWriter.WriterError.NoError:
+            raise ExportError(f"Couldn't create '{path}': {writer.errorMessage()}")
+
+        batch: List[QgsFeature] = list()
+
+        for feature in iter_with_feedback(features, feedback):
+            qgs_feature = QgsFeature(fields)
+            if convert_to_multi:
+                geometry = QgsGeometry(feature.featureGeometry)
+                geometry.convertToMultiType()
+                qgs_feature.setGeometry(geometry)
+            else:
+                qgs_feature.setGeometry(feature.featureGeometry)
+            qgs_feature.setAttributes(
+                [_export_attribute(feature.properties.get(k)) for k in field_names]
+            )
+            batch.append(qgs_feature)
+
+            if len(batch) >= EXPORT_BATCH_SIZE:
+                _add_features(writer, batch, path)
+                batch = list()
+
+        _add_features(writer, batch, path)
+
+        logger.info(f"Wrote {len(features)} {save_options.layerName} to '{path}'")
+
+    finally:
+        # Deleting the writer flushes and closes the file, which also builds the
+        # spatial index.
+        del writer
+
+
+def write_features_file(
+    path: Union[str, Path],
+    features: Sequence[Feature],
+    cls: Type[Feature],
+    export_format: ExportFormat,
+    feedback: Optional[QgsFeedback] = None,
+    shared_metadata: Optional[Dict[str, Any]] = None,
+):
+    """
+    Save Nodes or Spans to a file in the given format.
+
+    shared_metadata is written once per file instead of on every feature, which only
+    GeoJSON supports; the other formats always write it on every feature.
+    """
+    if export_format.is_geojson:
+        with open_text_file(path, "w") as f:
+            write_geojson_from_features(
+                f, features, feedback=feedback, shared_metadata=shared_metadata
+            )
+    else:
+        write_ogr_file_from_features(path, features, cls, export_format, feedback)
+
+
+# Properties that only belong in the GeoJSON format, or that are written once at the top
+# level of an OFDS JSON package rather than on each Node/Span.
+PACKAGE_EXCLUDED_PROPERTIES = {"featureType", "network"}
+
+
+def _encode_package_feature(
+    encoder: json.JSONEncoder,
+    properties: Dict[str, Any],
+    geometry_key: str,
+    geometry_json: str,
+) -> str:
+    """
+    Encode an OFDS JSON Node/Span object, with its geometry added as geometry_key
+    (replacing any property of that name).
+    """
+    # Write the members one by one, so the already-encoded geometry can be added
+    members = [
+        f"{encoder.encode(key)}: {encoder.encode(value)}"
+        for key, value in properties.items()
+        if key != geometry_key
+    ]
+    members.append(f"{encoder.encode(geometry_key)}: {geometry_json}")
+    return "{" + ", ".join(members) + "}"
+
+
+def _package_node_properties(node: Node) -> Dict[str, Any]:
+    return {
+        k: v for k, v in node.properties.items() if k not in PACKAGE_EXCLUDED_PROPERTIES
+    }
+
+
+def _package_span_properties(span: Span) -> Dict[str, Any]:
+    props = {
+        k: v for k, v in span.properties.items() if k not in PACKAGE_EXCLUDED_PROPERTIES
+    }
+    # In the JSON format, start/end are Node ids rather than embedded Node objects
+    props["start"] = span.start_id
+    props["end"] = span.end_id
+    return props
+
+
+def _write_package_features(
+    fh: IO[str],
+    encoder: json.JSONEncoder,
+    features: Iterable[Feature],
+    geometry_key: str,
+    precision: Optional[int],
+):
+    for i, feature in enumerate(features):
+        if i > 0:
+            fh.write(",\n")
+        if isinstance(feature, Span):
+            props = _package_span_properties(feature)
+        else:
+            props = _package_node_properties(feature)  # type: ignore[arg-type]
+        fh.write(
+            _encode_package_feature(
+                encoder,
+                props,
+                geometry_key,
+                geometry_to_geojson(feature.featureGeometry, precision),
+            )
+        )
+
+
+def write_ofds_json_package(
+    fh: IO[str],
+    network: Network,
+    precision: Optional[int] = None,
+    feedback: Optional[QgsFeedback] = None,
+):
+    """
+    Write a Network as an OFDS JSON package, i.e. `{"networks": [{..., "nodes": [...],
+    "spans": [...]}]}`. Nodes and Spans are streamed out one at a time, and the
+    network's metadata is written once at the top instead of on every feature.
+    """
+    encoder = QVariantJSONEncoder()
+
+    network_json = encoder.encode(network.ofds_network.to_network_object())
+
+    fh.write('{"networks": [')
+    # Leave the network object open, to add the nodes and spans to it
+    fh.write(network_json[:-1])
+
+    fh.write(', "nodes": [\n')
+    nodes = iter_with_feedback(network.nodes, feedback, (0, 50))
+    _write_package_features(fh, encoder, nodes, "location", precision)
+
+    fh.write('\n], "spans": [\n')
+    spans = iter_with_feedback(network.spans, feedback, (50, 100))
+    _write_package_features(fh, encoder, spans, "route", precision)
+
+    fh.write("\n]}]}\n")
+
+
+def write_ofds_json_package_file(
+    path: Union[str, Path],
+    network: Network,
+    precision: Optional[int] = None,
+    feedback: Optional[QgsFeedback] = None,
+):
+    """Write an OFDS JSON package file, compressed if the path ends in .gz/.zst"""
+    with open_text_file(path, "w") as f:
+        write_ofds_json_package(f, network, precision, feedback)
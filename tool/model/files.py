@@ -0,0 +1,71 @@
+import gzip
+import logging
+from pathlib import Path
+from typing import IO, Union
+
+from .exceptions import UnsupportedCompression
+
+logger = logging.getLogger(__name__)
+
+# Level 6 is gzip's usual trade-off, 9 is much slower for very little gain
+GZIP_COMPRESS_LEVEL = 6
+
+
+def compression_for_path(path: Union[str, Path]) -> Union[str, None]:
+    """The compression to use for a file, based on its suffix, or None."""
+    suffix = Path(path).suffix.lower()
+    if suffix == ".gz":
+        return "gzip"
+    if suffix == ".zst":
+        return "zstd"
+    return None
+
+
+def zstd_available() -> bool:
+    try:
+        _zstd_module()
+        return True
+    except UnsupportedCompression:
+        return False
+
+
+def _zstd_module():
+    """
+    zstd isn't in the standard library (before Python 3.14), so is only supported if
+    the zstandard package is installed alongside QGIS.
+    """
+    try:
+        from compression import zstd  # type: ignore[import-not-found]
+
+        return zstd
+    except ImportError:
+        pass
+
+    try:
+        import zstandard  # type: ignore[import-not-found]
+
+        return zstandard
+    except ImportError:
+        raise UnsupportedCompression(
+            "Reading/writing .zst files needs the 'zstandard' python package"
+        ) from None
+
+
+def open_text_file(path: Union[str, Path], mode: str = "r") -> IO[str]:
+    """
+    Open a UTF-8 text file for reading ("r") or writing ("w"), transparently
+    (de)compressing gzip (.gz) or zstd (.zst) files as a stream.
+    """
+    assert mode in ("r", "w")
+
+    compression = compression_for_path(path)
+
+    if compression == "gzip":
+        return gzip.open(  # type: ignore[return-value]
+            path, mode + "t", encoding="utf-8", compresslevel=GZIP_COMPRESS_LEVEL
+        )
+
+    if compression == "zstd":
+        return _zstd_module().open(path, mode + "t", encoding="utf-8")
+
+    return Path(path).open(mode, encoding="utf-8")
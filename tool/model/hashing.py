@@ -0,0 +1,112 @@
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+
+from PyQt5.QtCore import QVariant
+
+from .network import Feature
+from .qgis_utils import QVariantJSONEncoder, geometry_to_geojson
+
+# Coordinates are rounded before hashing, so that re-writing a file at a different
+# precision doesn't make every feature look changed. 7 decimal places is ~1cm.
+HASH_COORDINATE_PRECISION = 7
+
+# Properties that change every time the tool is run, even if the feature hasn't:
+# - "id" is allocated afresh in each consolidated output
+# - "network" has a new id for each consolidated network
+HASH_EXCLUDED_PROPERTIES = {"id", "network"}
+
+
+def canonical_json(obj: Any) -> str:
+    """JSON encoding that's always the same for equal objects, for hashing."""
+    return json.dumps(
+        obj,
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+        cls=QVariantJSONEncoder,
+    )
+
+
+def _round_coordinates(coords: Any, precision: int) -> Any:
+    if isinstance(coords, list):
+        return [_round_coordinates(c, precision) for c in coords]
+    return round(float(coords), precision)
+
+
+def canonical_geometry(geometry: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """A GeoJSON geometry object with its coordinates rounded for hashing."""
+    if geometry is None:
+        return None
+    return {
+        "type": geometry.get("type"),
+        "coordinates": _round_coordinates(
+            geometry.get("coordinates", []), HASH_COORDINATE_PRECISION
+        ),
+    }
+
+
+def _is_null(value: Any) -> bool:
+    return value is None or (isinstance(value, QVariant) and value.isNull())
+
+
+def _hashable_properties(properties: Dict[str, Any]) -> Dict[str, Any]:
+    # Null and missing properties are treated the same, as loading a GeoJSON file into
+    # QGIS fills in missing properties with nulls
+    props = {
+        k: v
+        for k, v in properties.items()
+        if k not in HASH_EXCLUDED_PROPERTIES and not _is_null(v)
+    }
+
+    # Span start/end Node ids are reallocated too, so only hash the rest of the Node
+    for k in ("start", "end"):
+        if isinstance(props.get(k), dict):
+            props[k] = {kk: vv for kk, vv in props[k].items() if kk != "id"}
+
+    # Provenance timestamps are when the tool was run, not when the feature changed
+    if isinstance(props.get("provenance"), dict):
+        props["provenance"] = {
+            k: v for k, v in props["provenance"].items() if k != "generatedAtTime"
+        }
+
+    return props
+
+
+def content_hash(properties: Dict[str, Any], geometry: Optional[Dict[str, Any]]) -> str:
+    """
+    Hash of a GeoJSON feature's properties and geometry, ignoring the parts that change
+    between runs of the tool.
+    """
+    content = canonical_json(
+        [_hashable_properties(properties), canonical_geometry(geometry)]
+    )
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def feature_content_hash(feature: Feature) -> str:
+    geometry = json.loads(
+        geometry_to_geojson(feature.featureGeometry, HASH_COORDINATE_PRECISION)
+    )
+    return content_hash(feature.properties, geometry)
+
+
+def provenance_key(properties: Dict[str, Any]) -> str:
+    """
+    A key that identifies the same consolidated feature across runs of the tool, from
+    the networks and ids of the source features it was derived from, as features
+    from different networks can have the same id. Falls back to the feature's id if
+    it has no provenance.
+    """
+    provenance = properties.get("provenance")
+    derived_from: Optional[List[str]] = None
+    networks: Optional[List[str]] = None
+    if isinstance(provenance, dict):
+        derived_from = provenance.get("wasDerivedFrom")
+        networks = provenance.get("derivedFromNetworks")
+
+    if derived_from and networks and len(networks) == len(derived_from):
+        return canonical_json([list(pair) for pair in zip(networks, derived_from)])
+    if derived_from:
+        return canonical_json(list(derived_from))
+    return canonical_json([properties.get("id")])
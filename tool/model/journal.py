@@ -0,0 +1,232 @@
+import hashlib
+import json
+import logging
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+from .hashing import feature_content_hash
+from .network import Network
+
+logger = logging.getLogger(__name__)
+
+REVIEW_JOURNAL_FORMAT_VERSION = 1
+
+REVIEW_JOURNALS_DIRNAME = "ofds_review_journals"
+
+STAGE_NODES = "nodes"
+STAGE_SPANS = "spans"
+
+
+def network_fingerprint(network: Network) -> str:
+    """
+    A hash of the content of all a network's nodes and spans, to check that a review
+    is being resumed on the same input features it was started on.
+    """
+    digest = hashlib.sha256()
+    for features in (network.nodes, network.spans):
+        for _id, content in sorted(
+                (f.id, feature_content_hash(f)) for f in features
+        ):
+            digest.update(f"{_id}:{content}\n".encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def review_journal_path(
+        directory: Union[str, Path], network_a_id: str, network_b_id: str
+) -> Path:
+    """Where the journal of reviewing a pair of networks is kept."""
+    key = hashlib.sha256(f"{network_a_id}\n{network_b_id}".encode("utf-8"))
+    return Path(directory, f"{key.hexdigest()[:32]}.jsonl")
+
+
+class ScoredPair(NamedTuple):
+    """The scores of a comparison, so it can be restored without re-scoring."""
+
+    a_id: str
+    b_id: str
+    scores: Dict[str, float]
+    distance_km: Optional[float]
+
+    def to_json(self) -> List[Any]:
+        return [self.a_id, self.b_id, self.scores, self.distance_km]
+
+    @classmethod
+    def from_json(cls, obj: List[Any]) -> "ScoredPair":
+        a_id, b_id, scores, distance_km = obj
+        return cls(a_id, b_id, scores, distance_km)
+
+
+@dataclass(frozen=True)
+class JournalHeader:
+    """What's being reviewed: a journal can only be resumed if this hasn't changed."""
+
+    network_a_id: str
+    network_b_id: str
+    settings: Dict[str, Any]
+    fingerprint_a: str
+    fingerprint_b: str
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "type": "header",
+            "version": REVIEW_JOURNAL_FORMAT_VERSION,
+            "networkA": self.network_a_id,
+            "networkB": self.network_b_id,
+            "settings": self.settings,
+            "fingerprintA": self.fingerprint_a,
+            "fingerprintB": self.fingerprint_b,
+        }
+
+    @classmethod
+    def from_json(cls, obj: Dict[str, Any]) -> "JournalHeader":
+        if obj.get("type") != "header":
+            raise ValueError("Review journal doesn't start with a header")
+        if obj.get("version") != REVIEW_JOURNAL_FORMAT_VERSION:
+            raise ValueError(f"Unsupported review journal version {obj.get('version')}")
+        return cls(
+            network_a_id=obj["networkA"],
+            network_b_id=obj["networkB"],
+            settings=obj["settings"],
+            fingerprint_a=obj["fingerprintA"],
+            fingerprint_b=obj["fingerprintB"],
+        )
+
+
+@dataclass
+class JournalStage:
+    """What was recorded about one stage (Nodes or Spans) of a review."""
+
+    # Comparisons to ask the user about, and ones to auto-consolidate. None until all
+    # the comparisons have been scored.
+    asked: Optional[List[ScoredPair]] = None
+    merged: List[ScoredPair] = field(default_factory=list)
+
+    # The user's latest decision on each pair of features (A ID, B ID)
+    decisions: Dict[Tuple[str, str], bool] = field(default_factory=dict)
+
+    finished: bool = False
+
+
+@dataclass
+class JournalContents:
+    header: JournalHeader
+    stages: Dict[str, JournalStage]
+
+    def stage(self, stage: str) -> JournalStage:
+        return self.stages.setdefault(stage, JournalStage())
+
+
+class ReviewJournal:
+    """
+    Append-only record of a review in progress, one JSON object per line, so that
+    a review can be resumed where it was left off after QGIS is closed.
+
+    Lines are buffered, call flush() once a decision (or a batch of decisions) is
+    complete.
+    """
+
+    path: Path
+    _file: IO[str]
+
+    def __init__(self, path: Union[str, Path], header: JournalHeader, resume: bool):
+        """
+        Start a new journal at path, or if resume is set, append to the existing one
+        (which must have the same header).
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if resume:
+            # Drop any incomplete last line, left if QGIS was closed while writing it
+            with self.path.open("rb+") as f:
+                content = f.read()
+                f.truncate(content.rfind(b"\n") + 1)
+        self._file = self.path.open("a" if resume else "w", encoding="utf-8")
+        if not resume:
+            self._write(header.to_json())
+            self.flush()
+
+    def _write(self, obj: Dict[str, Any]):
+        self._file.write(json.dumps(obj, separators=(",", ":")) + "\n")
+
+    def record_comparisons(
+            self, stage: str, asked: Iterable[ScoredPair], merged: Iterable[ScoredPair]
+    ):
+        self._write(
+            {
+                "type": "comparisons",
+                "stage": stage,
+                "asked": [p.to_json() for p in asked],
+                "merged": [p.to_json() for p in merged],
+            }
+        )
+        self.flush()
+
+    def record_decision(self, stage: str, a_id: str, b_id: str, consolidate: bool):
+        self._write(
+            {
+                "type": "decision",
+                "stage": stage,
+                "a": a_id,
+                "b": b_id,
+                "consolidate": consolidate,
+            }
+        )
+
+    def record_finished(self, stage: str):
+        self._write({"type": "finished", "stage": stage})
+        self.flush()
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def open_review_journal(
+        path: Union[str, Path], header: JournalHeader, resume: bool = False
+) -> Optional[ReviewJournal]:
+    """
+    Open a review journal, or return None if it can't be written, since it's only a
+    safety net.
+    """
+    try:
+        return ReviewJournal(path, header, resume)
+    except OSError as e:
+        logger.warning(f"Can't write review journal '{path}', not journaling: {e}")
+        return None
+
+
+def read_review_journal(path: Union[str, Path]) -> JournalContents:
+    with Path(path).open("r", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+
+    if not lines:
+        raise ValueError("Review journal is empty")
+    header = JournalHeader.from_json(json.loads(lines[0]))
+    contents = JournalContents(header=header, stages={})
+
+    for n, line in enumerate(lines[1:], start=2):
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError:
+            if n == len(lines):
+                # QGIS was closed part way through writing the last line
+                logger.warning("Ignoring incomplete last line of review journal")
+                break
+            raise
+
+        stage = contents.stage(obj["stage"])
+        if obj["type"] == "comparisons":
+            stage.asked = [ScoredPair.from_json(p) for p in obj["asked"]]
+            stage.merged = [ScoredPair.from_json(p) for p in obj["merged"]]
+        elif obj["type"] == "decision":
+            stage.decisions[(obj["a"], obj["b"])] = obj["consolidate"]
+        elif obj["type"] == "finished":
+            stage.finished = True
+        else:
+            raise ValueError(f"Unknown review journal line type {obj['type']}")
+
+    return contents
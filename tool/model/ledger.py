@@ -0,0 +1,88 @@
+import logging
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .comparison import ComparisonOutcome, ConsolidationReason
+
+logger = logging.getLogger(__name__)
+
+
+class ConsolidationLedger:
+    """
+    Records which pairs of features have been consolidated as outcomes come in, and
+    which features from Network A and B they consumed, so the consolidated network can
+    be gathered without going back over every comparison outcome.
+
+    One ledger is shared by the Nodes and Spans stages of a run, so features are
+    looked up by their type as well as their ID.
+
+    A feature can only be consolidated once, so if a later outcome tries to
+    consolidate an already consumed feature, the first consolidation wins.
+    """
+
+    merges: List[ConsolidationReason]
+
+    # Lookups from the (feature type, ID) of features in Network A/B to their
+    # consolidation
+    consumed_a: Dict[Tuple[str, str], ConsolidationReason]
+    consumed_b: Dict[Tuple[str, str], ConsolidationReason]
+
+    def __init__(self):
+        self.merges = list()
+        self.consumed_a = dict()
+        self.consumed_b = dict()
+
+    def __len__(self) -> int:
+        return len(self.merges)
+
+    def merges_of(self, feature_type: str) -> List[ConsolidationReason]:
+        return [reason for reason in self.merges if reason.feature_type == feature_type]
+
+    def record(self, reason: ConsolidationReason) -> bool:
+        """
+        Record a consolidation, returning False if it was ignored because one of the
+        features had already been consolidated.
+        """
+        a_id = reason.primary.id
+        b_id = reason.secondary.id
+
+        for a_or_b, _id, consumed in [
+            ("A", a_id, self.consumed_a),
+            ("B", b_id, self.consumed_b),
+        ]:
+            key = (reason.feature_type, _id)
+            if key in consumed:
+                existing = consumed[key]
+                logger.warning(
+                    f"{reason.feature_type} {_id} in Network {a_or_b} is already "
+                    + f"consolidated ({existing.primary.id} + {existing.secondary.id}),"
+                    + " ignoring consolidation with "
+                    + f"{b_id if a_or_b == 'A' else a_id}"
+                )
+                return False
+
+        self.merges.append(reason)
+        self.consumed_a[(reason.feature_type, a_id)] = reason
+        self.consumed_b[(reason.feature_type, b_id)] = reason
+        return True
+
+    def record_outcomes(self, outcomes: Iterable[ComparisonOutcome]):
+        """Record the consolidations from comparison outcomes, ignoring the rest."""
+        for outcome in outcomes:
+            if isinstance(outcome.consolidate, ConsolidationReason):
+                self.record(outcome.consolidate)
+
+    def is_consumed_a(self, feature_type: str, _id: str) -> bool:
+        return (feature_type, _id) in self.consumed_a
+
+    def is_consumed_b(self, feature_type: str, _id: str) -> bool:
+        return (feature_type, _id) in self.consumed_b
+
+    def consolidation_for_a(
+            self, feature_type: str, _id: str
+    ) -> Optional[ConsolidationReason]:
+        return self.consumed_a.get((feature_type, _id))
+
+    def consolidation_for_b(
+            self, feature_type: str, _id: str
+    ) -> Optional[ConsolidationReason]:
+        return self.consumed_b.get((feature_type, _id))
@@ -0,0 +1,149 @@
+import bisect
+import math
+import weakref
+from typing import TYPE_CHECKING, Dict, List, Sequence, Tuple
+
+from qgis.core import QgsGeometry
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+from .qgis_utils import KM_PER_DEGREE
+
+if TYPE_CHECKING:
+    from .network import Span
+
+# How many evenly spaced points lines are resampled to before they're compared
+LINE_PROXIMITY_SAMPLES = 64
+
+# Lines further apart than this on average score 0
+LINE_PROXIMITY_MAX_KM = 1.0
+
+# (xs, ys) arrays of a resampled line, either numpy arrays or lists
+ResampledLine = Tuple[Sequence[float], Sequence[float]]
+
+
+def _line_vertices(geometry: QgsGeometry) -> Tuple[List[float], List[float]]:
+    """All the vertices of a (Multi)LineString, with the parts joined up in order."""
+    xs: List[float] = list()
+    ys: List[float] = list()
+    for part in geometry.constParts():
+        xs.extend(part.xVector())
+        ys.extend(part.yVector())
+    return xs, ys
+
+
+def _resample_numpy(xs: List[float], ys: List[float], n: int) -> ResampledLine:
+    x = np.asarray(xs, dtype=float)
+    y = np.asarray(ys, dtype=float)
+    distance_along = np.concatenate(([0.0], np.cumsum(np.hypot(np.diff(x), np.diff(y)))))
+    samples = np.linspace(0.0, distance_along[-1], n)
+    return np.interp(samples, distance_along, x), np.interp(samples, distance_along, y)
+
+
+def _resample_python(xs: List[float], ys: List[float], n: int) -> ResampledLine:
+    distance_along = [0.0]
+    for i in range(1, len(xs)):
+        distance_along.append(
+            distance_along[-1] + math.hypot(xs[i] - xs[i - 1], ys[i] - ys[i - 1])
+        )
+    total = distance_along[-1]
+
+    rx: List[float] = list()
+    ry: List[float] = list()
+    for k in range(n):
+        d = total * k / (n - 1)
+        i = min(max(bisect.bisect_right(distance_along, d), 1), len(xs) - 1)
+        segment = distance_along[i] - distance_along[i - 1]
+        t = (d - distance_along[i - 1]) / segment if segment > 0 else 0.0
+        rx.append(xs[i - 1] + (xs[i] - xs[i - 1]) * t)
+        ry.append(ys[i - 1] + (ys[i] - ys[i - 1]) * t)
+    return rx, ry
+
+
+def resample_line(geometry: QgsGeometry, n: int = LINE_PROXIMITY_SAMPLES) -> ResampledLine:
+    """
+    Resample a line to n points evenly spaced along its length, so that lines with
+    different numbers of vertices can be compared point by point.
+    """
+    xs, ys = _line_vertices(geometry)
+    if len(xs) == 1:
+        xs, ys = xs * 2, ys * 2
+    if np is not None:
+        return _resample_numpy(xs, ys, n)
+    return _resample_python(xs, ys, n)
+
+
+def _mean_offset_numpy(a: ResampledLine, b: ResampledLine, kx: float, ky: float) -> float:
+    ax, ay = a
+    bx, by = b
+    forwards = np.mean(np.hypot((ax - bx) * kx, (ay - by) * ky))
+    backwards = np.mean(np.hypot((ax - bx[::-1]) * kx, (ay - by[::-1]) * ky))
+    return float(min(forwards, backwards))
+
+
+def _mean_offset_python(a: ResampledLine, b: ResampledLine, kx: float, ky: float) -> float:
+    ax, ay = a
+    bx, by = b
+
+    def mean_offset(bx, by):
+        return sum(
+            math.hypot((x1 - x2) * kx, (y1 - y2) * ky)
+            for x1, y1, x2, y2 in zip(ax, ay, bx, by)
+        ) / len(ax)
+
+    return min(mean_offset(bx, by), mean_offset(bx[::-1], by[::-1]))
+
+
+def mean_offset_km(a: ResampledLine, b: ResampledLine) -> float:
+    """
+    Average distance in km between corresponding points of two resampled lon/lat
+    lines, in whichever direction makes them closest, as span direction doesn't matter.
+    """
+    latitude = (a[1][0] + a[1][-1] + b[1][0] + b[1][-1]) / 4
+    ky = KM_PER_DEGREE
+    kx = KM_PER_DEGREE * math.cos(math.radians(latitude))
+
+    if np is not None:
+        return _mean_offset_numpy(a, b, kx, ky)
+    return _mean_offset_python(a, b, kx, ky)
+
+
+def line_proximity_score(a: ResampledLine, b: ResampledLine) -> float:
+    """Score from 1 for the same route, down to 0 at LINE_PROXIMITY_MAX_KM apart."""
+    return max(0.0, 1 - mean_offset_km(a, b) / LINE_PROXIMITY_MAX_KM)
+
+
+class ResampledLineCache:
+    """
+    Resampled lines for Spans, so that each Span is only resampled once, however many
+    comparisons it's in. Entries are dropped when their Span is garbage collected.
+
+    Spans are keyed by identity rather than equality, as Spans from different
+    networks can have the same IDs but different geometries.
+    """
+
+    n_samples: int
+    _lines: Dict[int, ResampledLine]
+
+    def __init__(self, n_samples: int = LINE_PROXIMITY_SAMPLES):
+        self.n_samples = n_samples
+        self._lines = dict()
+
+    def get(self, span: "Span") -> ResampledLine:
+        key = id(span)
+        line = self._lines.get(key)
+        if line is None:
+            line = resample_line(span.featureGeometry, self.n_samples)
+            self._lines[key] = line
+            # Drop the entry before the Span's id can be reused by another object
+            weakref.finalize(span, self._lines.pop, key, None)
+        return line
+
+    def clear(self):
+        self._lines.clear()
+
+
+RESAMPLED_LINES = ResampledLineCache()
@@ -0,0 +1,327 @@
+import logging
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Type
+
+from .assignment import assign_one_to_one
+from .comparison import NodeComparison, SpanComparison
+from .consolidation import (
+    FeatureIdAllocator,
+    node_spatial_index,
+    remap_spans_node_ids,
+    span_endpoints_key,
+)
+from .network import FeatureT, Network, NetworkDescription, Node, Span
+from .properties import (
+    NODES_PROPERTIES_MERGE_PLAN,
+    SPANS_PROPERTIES_MERGE_PLAN,
+    PropMergePlan,
+    generate_cluster_provenance_data,
+    generate_run_provenance,
+)
+from .qgis_utils import (
+    create_qgis_geojson_layer_from_nodes,
+    create_qgis_geojson_layer_from_spans,
+    search_rectangle,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class _NetworkClusters:
+    """
+    Union-find over features from many networks, where each cluster can hold at most
+    one feature from each network.
+    """
+
+    parent: List[int]
+    networks: List[Set[int]]
+    confidence: List[Optional[float]]
+
+    def __init__(self, feature_networks: Sequence[int]):
+        self.parent = list(range(len(feature_networks)))
+        self.networks = [{n} for n in feature_networks]
+        self.confidence = [None] * len(feature_networks)
+
+    def find(self, i: int) -> int:
+        root = i
+        while self.parent[root] != root:
+            root = self.parent[root]
+        # Path compression
+        while self.parent[i] != root:
+            self.parent[i], i = root, self.parent[i]
+        return root
+
+    def union(self, i: int, j: int, confidence: float) -> bool:
+        """
+        Join the clusters of features i and j, returning False if they're already in
+        the same cluster, or joining them would put two features from one network
+        together.
+        """
+        root_i = self.find(i)
+        root_j = self.find(j)
+        if root_i == root_j or not self.networks[root_i].isdisjoint(
+            self.networks[root_j]
+        ):
+            return False
+
+        self.parent[root_j] = root_i
+        self.networks[root_i] |= self.networks[root_j]
+        self.confidence[root_i] = min(
+            c
+            for c in [self.confidence[root_i], self.confidence[root_j], confidence]
+            if c is not None
+        )
+        return True
+
+    def clusters(self) -> List[List[int]]:
+        groups: Dict[int, List[int]] = defaultdict(list)
+        for i in range(len(self.parent)):
+            groups[self.find(i)].append(i)
+        return list(groups.values())
+
+
+class MultiNetworkConsolidator:
+    """
+    Consolidates any number of networks in one pass, rather than chaining pairwise
+    consolidations.
+
+    Candidate Node matches across all the networks are found with one shared spatial
+    index, and Nodes above the merge threshold are clustered with union-find, so each
+    consolidated Node has at most one Node from each network. Spans from different
+    networks between the same pair of consolidated Nodes are then paired up one-to-one
+    by similarity, and pairs above the merge threshold are merged the same way.
+
+    Unlike the pairwise tool, everything is consolidated automatically, without asking
+    the user.
+    """
+
+    networks: List[Network]
+
+    merge_threshold: int
+    match_radius_km: float
+
+    new_ofds_network: NetworkDescription
+
+    # Provenance shared by all the features consolidated in this run
+    run_provenance: Dict[str, Any]
+
+    # Lookups from each input network's Node IDs to the consolidated Node IDs
+    node_ids_maps: List[Dict[str, str]]
+
+    def __init__(
+            self,
+            networks: Sequence[Network],
+            merge_above: int = 100,
+            match_radius_km: float = 10.0,
+    ):
+        if len(networks) < 2:
+            raise ValueError("At least two networks are needed to consolidate")
+
+        self.networks = list(networks)
+        self.merge_threshold = merge_above
+        self.match_radius_km = match_radius_km
+        self.node_ids_maps = [dict() for _ in self.networks]
+
+        names = ", ".join(n.ofds_network.name for n in self.networks)
+        self.new_ofds_network = NetworkDescription(
+            id=str(uuid.uuid4()), name=f"Consolidated Network of {names}"
+        )
+        self.run_provenance = generate_run_provenance(
+            [uri for network in self.networks for uri in network.source_uris()]
+        )
+
+    def _node_match_candidates(
+            self, nodes: List[Tuple[int, Node]]
+    ) -> List[Tuple[float, int, int]]:
+        """
+        Find pairs of Nodes from different networks that are close enough to compare,
+        and similar enough to merge. Returns (confidence, i, j) for positions in nodes.
+        """
+        index, rects = node_spatial_index([node for _, node in nodes])
+
+        candidates: List[Tuple[float, int, int]] = list()
+        for i, (network_i, node_i) in enumerate(nodes):
+            for j in index.intersects(search_rectangle(rects[i], self.match_radius_km)):
+                # Compare each pair once, and never within the same network
+                network_j, node_j = nodes[j]
+                if j <= i or network_i == network_j:
+                    continue
+
+                comparison = NodeComparison(node_i, node_j)
+                if comparison.distance_km > self.match_radius_km:
+                    continue
+                if comparison.confidence > self.merge_threshold:
+                    candidates.append((comparison.confidence, i, j))
+
+        logger.info(f"Found {len(candidates)} Node merge candidates")
+        return candidates
+
+    def _merge_cluster(
+            self,
+            cls: Type[FeatureT],
+            plan: PropMergePlan,
+            features: List[FeatureT],
+            confidence: Optional[float],
+            new_id: str,
+    ) -> FeatureT:
+        """Merge a cluster of features, with the first one as the primary."""
+        primary = features[0]
+        merged = primary
+        for other in features[1:]:
+            props = plan.merge(merged, other)
+            merged = cls(
+                "", props, primary.featureId, primary.featureGeometry, self.new_ofds_network
+            )
+
+        merged.properties["provenance"] = generate_cluster_provenance_data(
+            features, confidence, self.run_provenance
+        )
+        return merged.with_new_id(new_id, ofds_network=self.new_ofds_network)
+
+    def _consolidate_nodes(self) -> List[Node]:
+        nodes: List[Tuple[int, Node]] = [
+            (k, node) for k, network in enumerate(self.networks) for node in network.nodes
+        ]
+
+        clusters = _NetworkClusters([k for k, _ in nodes])
+        # Take the most confident matches first
+        for confidence, i, j in sorted(self._node_match_candidates(nodes), reverse=True):
+            clusters.union(i, j, confidence)
+
+        node_ids = FeatureIdAllocator()
+        new_nodes: List[Node] = list()
+        merged_clusters: List[List[int]] = list()
+
+        # Unconsolidated nodes keep their IDs, so go first to reserve them
+        for cluster in clusters.clusters():
+            if len(cluster) > 1:
+                merged_clusters.append(cluster)
+                continue
+            k, node = nodes[cluster[0]]
+            new_id = node_ids.keep_or_allocate(node.id)
+            self.node_ids_maps[k][node.id] = new_id
+            new_nodes.append(node.with_new_id(new_id, ofds_network=self.new_ofds_network))
+
+        for cluster in merged_clusters:
+            new_id = node_ids.allocate()
+            for i in cluster:
+                k, node = nodes[i]
+                self.node_ids_maps[k][node.id] = new_id
+            new_nodes.append(
+                self._merge_cluster(
+                    Node,
+                    NODES_PROPERTIES_MERGE_PLAN,
+                    [nodes[i][1] for i in cluster],
+                    clusters.confidence[clusters.find(cluster[0])],
+                    new_id,
+                )
+            )
+
+        logger.info(
+            f"Consolidated {len(nodes)} Nodes into {len(new_nodes)}, "
+            + f"{len(merged_clusters)} of them merged"
+        )
+        return new_nodes
+
+    def _span_match_candidates(
+            self, spans: List[Tuple[int, Span]]
+    ) -> List[Tuple[float, int, int]]:
+        """
+        Pair up Spans from different networks between the same consolidated Nodes,
+        which are similar enough to merge. Each network's parallel Spans are matched
+        one-to-one with another network's, rather than by the order they're listed.
+        Returns (confidence, i, j) for positions in spans.
+        """
+        candidates: List[Tuple[float, int, int]] = list()
+        for i, (network_i, span_i) in enumerate(spans):
+            for j in range(i + 1, len(spans)):
+                network_j, span_j = spans[j]
+                if network_i == network_j:
+                    continue
+                comparison = SpanComparison(span_i, span_j)
+                if comparison.confidence > self.merge_threshold:
+                    candidates.append((comparison.confidence, i, j))
+
+        # Pair each network with each other network separately, as a Span can be
+        # matched once per other network
+        by_networks: Dict[Tuple[int, int], List[Tuple[float, int, int]]] = (
+            defaultdict(list)
+        )
+        for candidate in candidates:
+            _, i, j = candidate
+            by_networks[(spans[i][0], spans[j][0])].append(candidate)
+
+        return [
+            match
+            for pairs in by_networks.values()
+            for match in assign_one_to_one(
+                pairs,
+                key_a=lambda c: c[1],
+                key_b=lambda c: c[2],
+                weight=lambda c: c[0],
+            )
+        ]
+
+    def _consolidate_spans(self) -> List[Span]:
+        # Spans grouped by their (unordered) consolidated start/end Nodes, then network
+        groups: Dict[Tuple[str, str], List[List[Span]]] = defaultdict(
+            lambda: [list() for _ in self.networks]
+        )
+        for k, network in enumerate(self.networks):
+            for span in remap_spans_node_ids(network.spans, self.node_ids_maps[k]):
+                groups[span_endpoints_key(span)][k].append(span)
+
+        span_ids = FeatureIdAllocator()
+        new_spans: List[Span] = list()
+
+        for spans_by_network in groups.values():
+            spans: List[Tuple[int, Span]] = [
+                (k, span) for k, network_spans in enumerate(spans_by_network)
+                for span in network_spans
+            ]
+
+            clusters = _NetworkClusters([k for k, _ in spans])
+            # Take the most confident matches first
+            for confidence, i, j in sorted(
+                    self._span_match_candidates(spans), reverse=True
+            ):
+                clusters.union(i, j, confidence)
+
+            for cluster in clusters.clusters():
+                if len(cluster) == 1:
+                    new_spans.append(
+                        spans[cluster[0]][1].with_new_id(
+                            span_ids.allocate(), ofds_network=self.new_ofds_network
+                        )
+                    )
+                    continue
+
+                new_spans.append(
+                    self._merge_cluster(
+                        Span,
+                        SPANS_PROPERTIES_MERGE_PLAN,
+                        [spans[i][1] for i in cluster],
+                        clusters.confidence[clusters.find(cluster[0])],
+                        span_ids.allocate(),
+                    )
+                )
+
+        return new_spans
+
+    def get_consolidated_network(self) -> Network:
+        """Consolidate all the networks, returning the consolidated Network."""
+        nodes = self._consolidate_nodes()
+        nodes_layer, nodes = create_qgis_geojson_layer_from_nodes(nodes)
+
+        spans = self._consolidate_spans()
+        spans_layer, spans = create_qgis_geojson_layer_from_spans(spans)
+
+        return Network(
+            nodes=nodes,
+            nodesLayer=nodes_layer,
+            spans=spans,
+            spansLayer=spans_layer,
+            ofds_network=self.new_ofds_network,
+            provenance=self.run_provenance,
+        )
@@ -1,8 +1,10 @@
+import copy
 import json
 import logging
 from abc import ABC, abstractmethod
 from dataclasses import dataclass
 from enum import Enum
+from functools import lru_cache
 from typing import Any, Dict, List, TypeVar, cast, Optional
 
 from PyQt5.QtCore import QVariant
@@ -32,6 +34,13 @@ class NetworkDescription:
             name=network.get("name", f"Unnamed Network <{network['id']}>")
         )
 
+    def shared_network_object(self) -> Dict[str, Any]:
+        """
+        The network object, shared by every feature in the network rather than copied
+        onto each of them, so it's read-only.
+        """
+        return _shared_network_object(self)
+
     def to_network_object(self) -> Dict[str, Any]:
         return {
             "id": self.id,
@@ -49,16 +58,83 @@ class NetworkDescription:
         }
 
 
+class ReadOnlyDict(dict):
+    """
+    A dict that can't be modified, for objects shared between many features. Copies
+    of it (copy.copy, copy.deepcopy, dict(...)) are ordinary dicts.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Shared object can't be modified, copy it first")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only  # type: ignore[assignment]
+    clear = pop = popitem = setdefault = update = _read_only  # type: ignore[assignment]
+
+    def __copy__(self) -> Dict[str, Any]:
+        return dict(self)
+
+    def __deepcopy__(self, memo) -> Dict[str, Any]:
+        return copy.deepcopy(dict(self), memo)
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class ReadOnlyList(list):
+    """A list that can't be modified, see ReadOnlyDict."""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Shared object can't be modified, copy it first")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only  # type: ignore
+    append = extend = insert = remove = pop = clear = _read_only  # type: ignore
+    sort = reverse = _read_only  # type: ignore
+
+    def __copy__(self) -> List[Any]:
+        return list(self)
+
+    def __deepcopy__(self, memo) -> List[Any]:
+        return copy.deepcopy(list(self), memo)
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+def read_only(value: Any) -> Any:
+    """A read-only version of a JSON-like value, recursively."""
+    if isinstance(value, dict):
+        return ReadOnlyDict((k, read_only(v)) for k, v in value.items())
+    if isinstance(value, list):
+        return ReadOnlyList(read_only(v) for v in value)
+    return value
+
+
+# Only a handful of networks are ever open at once
+@lru_cache(maxsize=64)
+def _shared_network_object(network: NetworkDescription) -> Dict[str, Any]:
+    return read_only(network.to_network_object())
+
+
 NESTED_PROPERTIES = [
+    "address",
+    "capacityDetails",
+    "countries",
+    "deployment",
+    "deploymentDetails",
     "end",
+    "fibreTypeDetails",
     "internationalConnections",
     "location",
     "network",
     "networkProviders",
     "phase",
     "physicalInfrastructureProvider",
+    "provenance",
     "start",
     "supplier",
+    "technologies",
+    "transmissionMedium",
+    "type",
 ]
 
 
@@ -90,11 +166,17 @@ class Feature(ABC):
 
     def with_new_id(self, new_id: str, ofds_network: Optional[NetworkDescription] = None):
         """Return a new Feature as a copy of the current Feature but with a new ID"""
-        # TODO: Update provenance somehow to reflect ID change?
         new_props = self.properties.copy()
         new_props["id"] = new_id
+        # Keep track of the original ID and network, so the feature can be traced back
+        # to its source
+        if "provenance" not in new_props and self.id:
+            new_props["provenance"] = {
+                "wasDerivedFrom": [self.id],
+                "derivedFromNetworks": [self.ofds_network.id],
+            }
         if ofds_network is not None:
-            new_props["network"] = ofds_network.to_network_object()
+            new_props["network"] = ofds_network.shared_network_object()
         return type(self)(_id=new_id, featureId=self.featureId, featureGeometry=self.featureGeometry,
                           properties=new_props,
                           ofds_network=self.ofds_network)
@@ -114,7 +196,12 @@ class Feature(ABC):
                         f"Dropping non-null QVariant attribute: {cls.__name__} {attributes.get('name', attributes.get('id'))} {attribute} : {value.typeName()} = {value}"
                     )
 
-            if attribute in NESTED_PROPERTIES and isinstance(value, str):
+            # Nested objects/arrays may be stored as JSON text, e.g. in a GeoPackage
+            if (
+                attribute in NESTED_PROPERTIES
+                and isinstance(value, str)
+                and value[:1] in ("{", "[")
+            ):
                 properties[attribute] = json.loads(value)
             else:
                 properties[attribute] = value
@@ -128,6 +215,10 @@ class Feature(ABC):
         ofds_id = properties["id"]
         ofds_network = NetworkDescription.from_network_object(properties["network"])
 
+        # Features of the same network all have the same network object, so share one
+        if properties["network"] == ofds_network.shared_network_object():
+            properties["network"] = ofds_network.shared_network_object()
+
         return cls(
             _id=ofds_id,
             properties=properties,
@@ -451,6 +542,9 @@ class Network:
 
     ofds_network: NetworkDescription
 
+    # Provenance shared by every feature in the network, e.g. when it was consolidated
+    provenance: Optional[Dict[str, Any]]
+
     @classmethod
     def from_qgs_vectorlayers(
             cls, nodesLayer: QgsVectorLayer, spansLayer: QgsVectorLayer, network_id: str,
@@ -475,6 +569,7 @@ class Network:
             spans: List[Span],
             spansLayer: QgsVectorLayer,
             ofds_network: NetworkDescription,
+            provenance: Optional[Dict[str, Any]] = None,
     ):
         self.nodesLayer = nodesLayer
         self.spansLayer = spansLayer
@@ -483,6 +578,7 @@ class Network:
         self.spans = spans
 
         self.ofds_network = ofds_network
+        self.provenance = provenance
 
         self.nodesByFeatureId = {n.featureId: n for n in self.nodes}
         self.spansByFeatureId = {s.featureId: s for s in self.spans}
@@ -492,3 +588,17 @@ class Network:
 
         self.nodesSpacialIndex = QgsSpatialIndex(self.nodesLayer.getFeatures())
         self.spansSpacialIndex = QgsSpatialIndex(self.spansLayer.getFeatures())
+
+    def source_uris(self) -> List[str]:
+        """Where the network's layers were loaded from, without any credentials."""
+        return [self.nodesLayer.publicSource(), self.spansLayer.publicSource()]
+
+    def shared_metadata(self) -> Dict[str, Any]:
+        """
+        Properties shared by all of the network's features, which writers can write
+        once for the whole file instead of on every feature.
+        """
+        shared: Dict[str, Any] = {"network": self.ofds_network.shared_network_object()}
+        if self.provenance:
+            shared["provenance"] = self.provenance
+        return shared
@@ -1,8 +1,9 @@
 import logging
 import datetime
 
-from pprint import pprint
-from typing import Dict, Any, List, Tuple
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, Any, Optional, Sequence, Tuple
 from enum import Enum
 
 from .network import Feature
@@ -55,9 +56,7 @@ SPANS_PROPERTIES_MERGE_CONFIG = [
     ("countries", PropMergeOp.MERGE_ARRAY),
     ("capacity", PropMergeOp.SUM_NUMBER),
     ("networkProviders", PropMergeOp.CONCAT_ARRAY),
-    ("deploymentDetails", PropMergeOp.KEEP_OR_COPY),
     ("deploymentDetails/description", PropMergeOp.CONCAT_DESCRIPTION),
-    ("capacityDetails", PropMergeOp.KEEP_OR_COPY),
     ("capacityDetails/description", PropMergeOp.CONCAT_DESCRIPTION),
     ("fibreTypeDetails", PropMergeOp.KEEP_OR_COPY),
     ("fibreTypeDetails/description", PropMergeOp.CONCAT_DESCRIPTION),
@@ -86,59 +85,189 @@ def set_prop(props: Dict[str, Any], k: str, v: Any) -> Dict[str, Any]:
     return props
 
 
+# Returned by a merge function when the property should be left as it is
+_UNCHANGED = object()
+
+PropGetter = Callable[[Dict[str, Any]], Any]
+PropSetter = Callable[[Dict[str, Any], Any], None]
+PropMergeFn = Callable[[Any, Any], Any]
+
+
+def _compile_getter(k: str) -> PropGetter:
+    """Prebound equivalent of get_prop(props, k), splitting the path only once."""
+    parts = k.split("/")
+    if len(parts) == 1:
+        return lambda props: props.get(k)
+
+    *parents, leaf = parts
+
+    def getter(props: Dict[str, Any]) -> Any:
+        for part in parents:
+            props = props.get(part) or {}
+        return props.get(leaf)
+
+    return getter
+
+
+def _compile_setter(k: str) -> PropSetter:
+    """
+    Prebound equivalent of set_prop(props, k, v), splitting the path only once.
+
+    Nested objects are copied before they're changed, as the merged properties are a
+    shallow copy of the primary feature's, and changing them in place would change the
+    original feature too.
+    """
+    parts = k.split("/")
+    if len(parts) == 1:
+
+        def set_top_level(props: Dict[str, Any], v: Any):
+            props[k] = v
+
+        return set_top_level
+
+    *parents, leaf = parts
+
+    def setter(props: Dict[str, Any], v: Any):
+        for part in parents:
+            props[part] = dict(props.get(part) or {})
+            props = props[part]
+        props[leaf] = v
+
+    return setter
+
+
+def _merge_keep_or_copy(prop_a: Any, prop_b: Any) -> Any:
+    # Copy over properties that exist in B but not A
+    return _UNCHANGED if prop_a else prop_b
+
+
+def _merge_concat_array(prop_a: Any, prop_b: Any) -> Any:
+    return [*(prop_a or []), *(prop_b or [])]
+
+
+def _merge_merge_array(prop_a: Any, prop_b: Any) -> Any:
+    return list(set().union(prop_a or []).union(prop_b or []))
+
+
+def _merge_sum_number(prop_a: Any, prop_b: Any) -> Any:
+    return (prop_a or 0) + (prop_b or 0)
+
+
+def _merge_concat_description(prop_a: Any, prop_b: Any) -> Any:
+    if prop_a is None or prop_b is None:
+        return _UNCHANGED
+    # Go via set to remove duplicate strings
+    return ", ".join(set([s for s in [prop_a, prop_b] if s]))
+
+
+PROP_MERGE_FUNCTIONS: Dict[PropMergeOp, PropMergeFn] = {
+    PropMergeOp.KEEP_OR_COPY: _merge_keep_or_copy,
+    PropMergeOp.CONCAT_ARRAY: _merge_concat_array,
+    PropMergeOp.MERGE_ARRAY: _merge_merge_array,
+    PropMergeOp.SUM_NUMBER: _merge_sum_number,
+    PropMergeOp.CONCAT_DESCRIPTION: _merge_concat_description,
+}
+
+
+@dataclass(frozen=True)
+class PropMergeStep:
+    key: str
+    op: PropMergeOp
+    get: PropGetter
+    set: PropSetter
+    merge: PropMergeFn
+
+
+class PropMergePlan:
+    """
+    A properties merge config compiled into a flat list of steps, with the getter,
+    setter and merge function for each property bound up front, so merging two
+    features doesn't have to interpret the config every time.
+    """
+
+    steps: Tuple[PropMergeStep, ...]
+
+    def __init__(self, props_config: Sequence[Tuple[str, PropMergeOp]]):
+        steps = list()
+        seen = set()
+        for k, op in props_config:
+            if (k, op) in seen:
+                logger.debug(f"Skipping duplicate property merge config for {k}")
+                continue
+            seen.add((k, op))
+
+            if op not in PROP_MERGE_FUNCTIONS:
+                raise Exception(f"Unknown PropMergeOp {op}")
+
+            steps.append(
+                PropMergeStep(
+                    key=k,
+                    op=op,
+                    get=_compile_getter(k),
+                    set=_compile_setter(k),
+                    merge=PROP_MERGE_FUNCTIONS[op],
+                )
+            )
+        self.steps = tuple(steps)
+
+    def merge(self, primary: Feature, secondary: Feature) -> Dict[str, Any]:
+        primary_props = primary.properties
+        secondary_props = secondary.properties
+        props = primary_props.copy()
+
+        for step in self.steps:
+            prop_a = step.get(primary_props)
+            prop_b = step.get(secondary_props)
+
+            if not prop_a and not prop_b:
+                continue
+
+            value = step.merge(prop_a, prop_b)
+            if value is not _UNCHANGED:
+                step.set(props, value)
+
+        return props
+
+
+@lru_cache(maxsize=None)
+def _compile_merge_plan(props_config: Tuple[Tuple[str, PropMergeOp], ...]):
+    return PropMergePlan(props_config)
+
+
+def compile_merge_plan(props_config: Sequence[Tuple[str, PropMergeOp]]) -> PropMergePlan:
+    """Compile a properties merge config, reusing the plan if it's been seen before."""
+    return _compile_merge_plan(tuple(props_config))
+
+
+NODES_PROPERTIES_MERGE_PLAN = compile_merge_plan(NODES_PROPERTIES_MERGE_CONFIG)
+SPANS_PROPERTIES_MERGE_PLAN = compile_merge_plan(SPANS_PROPERTIES_MERGE_CONFIG)
+
+
 def merge_features_properties(
-    props_config: List[Tuple[str, PropMergeOp]], primary: Feature, secondary: Feature
+    props_config: Sequence[Tuple[str, PropMergeOp]],
+    primary: Feature,
+    secondary: Feature,
 ) -> Dict[str, Any]:
-    props = primary.properties.copy()
-
-    for k, op in props_config:
-        prop_a = get_prop(primary.properties, k)
-        prop_b = get_prop(secondary.properties, k)
-
-        if not prop_a and not prop_b:
-            continue
-
-        # Copy over properties that exist in B but not A
-        if op == PropMergeOp.KEEP_OR_COPY:
-            if prop_a:
-                set_prop(props, k, prop_a)
-            elif prop_b:
-                set_prop(props, k, prop_b)
-
-        # Concat array properties
-        elif op == PropMergeOp.CONCAT_ARRAY:
-            new_array = list()
-            new_array.extend(prop_a or [])
-            new_array.extend(prop_b or [])
-            set_prop(props, k, new_array)
-
-        # Merge array properties
-        elif op == PropMergeOp.MERGE_ARRAY:
-            new_array = list(set().union(prop_a or []).union(prop_b or []))
-            set_prop(props, k, new_array)
-
-        # Sum properties
-        elif op == PropMergeOp.SUM_NUMBER:
-            if prop_a is not None or prop_b is not None:
-                set_prop(props, k, (prop_a or 0) + (prop_b or 0))
-
-        # Concat (with a comma) string properties
-        elif op == PropMergeOp.CONCAT_DESCRIPTION:
-            if prop_a is not None and prop_b is not None:
-                # Go via set to remove duplicate strings
-                strs = list(set([s for s in [prop_a, prop_b] if s]))
-                set_prop(props, k, ", ".join(strs))
-
-        else:
-            raise Exception(f"Unknown PropMergeOp {op}")
-
-    if "networkProviders" not in props:
-        pprint(props)
+    return compile_merge_plan(props_config).merge(primary, secondary)
 
-    return props
+
+def _now_isoformat() -> str:
+    return datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc).isoformat()
+
+
+def generate_run_provenance(sources: Sequence[str] = ()) -> Dict[str, Any]:
+    """
+    Provenance shared by every feature consolidated in one run of the tool, i.e. when
+    it was run and the files it was run on. Features' provenance reuses the same
+    objects rather than copying them, and writers can write it once per file.
+    """
+    prov: Dict[str, Any] = {"generatedAtTime": _now_isoformat()}
+    if sources:
+        prov["hadPrimarySource"] = list(dict.fromkeys(sources))
+    return prov
 
 
-def generate_provenance_data(consolidation_reason):
+def generate_provenance_data(consolidation_reason, run_provenance=None):
     """
     Additional metadata about the origin of a consolidated feature.
     Property names are in line with PROV-O vocab where applicable, and
@@ -148,10 +277,37 @@ def generate_provenance_data(consolidation_reason):
     secondary_id = consolidation_reason.secondary.get("id")
     prov = {
         "wasDerivedFrom": [primary_id, secondary_id], # TODO: include filenames here
-        "generatedAtTime": datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc).isoformat(),
+        "derivedFromNetworks": [
+            consolidation_reason.primary.ofds_network.id,
+            consolidation_reason.secondary.ofds_network.id,
+        ],
+        "generatedAtTime": (
+            run_provenance["generatedAtTime"] if run_provenance else _now_isoformat()
+        ),
         "confidence": consolidation_reason.confidence,
         "similarFields": consolidation_reason.similar_fields,
         "manual": consolidation_reason.manual,
     }
 
-    return prov
\ No newline at end of file
+    return prov
+
+
+def generate_cluster_provenance_data(
+    features: Sequence[Feature],
+    confidence: Optional[float],
+    run_provenance: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
+    """
+    Provenance for a feature consolidated from a cluster of features from more than
+    two networks, in the same format as generate_provenance_data.
+    """
+    return {
+        "wasDerivedFrom": [f.id for f in features],
+        "derivedFromNetworks": [f.ofds_network.id for f in features],
+        "generatedAtTime": (
+            run_provenance["generatedAtTime"] if run_provenance else _now_isoformat()
+        ),
+        "confidence": confidence,
+        "similarFields": [],
+        "manual": False,
+    }
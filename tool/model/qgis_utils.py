@@ -1,16 +1,38 @@
-from typing import IO, Any, List, Sequence, Tuple, Dict, Type, TypeVar
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 
 import json
 import logging
+import math
+import shutil
 import tempfile
+from pathlib import Path
 
 from PyQt5.QtCore import QVariant
+from PyQt5.QtGui import QTransform
 
 from qgis.core import (
+    QgsFeedback,
+    QgsGeometry,
+    QgsRectangle,
     QgsVectorLayer,
     QgsProject,
+    QgsWkbTypes,
 )
 
+from .files import compression_for_path, open_text_file
 from .network import Feature, Node, Span
 
 logger = logging.getLogger(__name__)
@@ -19,6 +41,13 @@ logger = logging.getLogger(__name__)
 NODES_LAYER_NAME = "_ofds_consolidated_nodes"
 SPANS_LAYER_NAME = "_ofds_consolidated_spans"
 
+# How many features to write between progress updates/checks for cancellation
+FEEDBACK_INTERVAL = 1000
+
+# Slightly less than the length of a degree of latitude, so that distances converted
+# to degrees err on the side of being too big
+KM_PER_DEGREE = 110.0
+
 
 class QVariantJSONEncoder(json.JSONEncoder):
     """Extended JSON Decoder with support for QVariant"""
@@ -35,28 +64,235 @@ def _delete_layers_with_name(project: QgsProject, name: str):
         project.removeMapLayers([layer.id() for layer in project.mapLayersByName(name)])
 
 
-def write_geojson_from_features(fh: IO[str], features: Sequence[Feature]):
-    geojson_features = list()
+def _delete_file_with_layer(layer: QgsVectorLayer, path: str):
+    """
+    Delete the temporary file behind a layer once the layer has been unloaded. The
+    layer's destroyed signal comes after its data provider has closed the file.
+    """
+
+    def delete():
+        try:
+            Path(path).unlink()
+        except OSError as e:
+            logger.warning(f"Couldn't delete temporary file '{path}': {e}")
+
+    layer.destroyed.connect(delete)
+
+
+def km_to_degrees(distance_km: float, latitude: float = 0.0) -> Tuple[float, float]:
+    """
+    Approximate a distance in km as (longitude, latitude) degrees at the given latitude,
+    for searching lon/lat data.
+    """
+    dy = distance_km / KM_PER_DEGREE
+    dx = dy / max(math.cos(math.radians(latitude)), 0.01)
+    return dx, dy
+
+
+def scaled_to_latitude(geometry: QgsGeometry, latitude: float) -> QgsGeometry:
+    """
+    A copy of a lon/lat geometry with its longitudes scaled by cos(latitude), so that
+    distances measured on it are in degrees of latitude, i.e. the same in every
+    direction, near that latitude.
+    """
+    scaled = QgsGeometry(geometry)
+    scaled.transform(QTransform.fromScale(math.cos(math.radians(latitude)), 1.0))
+    return scaled
+
+
+def search_rectangle(rect: QgsRectangle, distance_km: float) -> QgsRectangle:
+    """A lon/lat rectangle containing everything within distance_km of rect."""
+    dx, dy = km_to_degrees(
+        distance_km, max(abs(rect.yMinimum()), abs(rect.yMaximum()))
+    )
+    return QgsRectangle(
+        rect.xMinimum() - dx,
+        rect.yMinimum() - dy,
+        rect.xMaximum() + dx,
+        rect.yMaximum() + dy,
+    )
+
+
+def _format_coordinates(
+    xs: Iterable[float], ys: Iterable[float], precision: Optional[int]
+) -> str:
+    """Format x/y vertex arrays as a GeoJSON array of positions."""
+    if precision is None:
+        return ",".join(f"[{x!r},{y!r}]" for x, y in zip(xs, ys))
+    return ",".join(
+        f"[{round(x, precision)!r},{round(y, precision)!r}]" for x, y in zip(xs, ys)
+    )
+
+
+def geometry_to_geojson(geometry: QgsGeometry, precision: Optional[int] = None) -> str:
+    """
+    Encode a geometry as a GeoJSON geometry object string, reading the coordinates
+    directly from the vertex data rather than round-tripping through asJson().
+
+    Coordinates are rounded to `precision` decimal places, or written at full float
+    precision if it's None. 2D (Multi)Points and (Multi)LineStrings take the fast path,
+    anything else falls back to QGIS's own GeoJSON export.
+    """
+    if geometry.isNull():
+        return "null"
+
+    wkb_type = geometry.wkbType()
+    flat_type = QgsWkbTypes.flatType(wkb_type)
+
+    # Z/M geometries have a different wkbType from their flat type
+    if wkb_type == flat_type:
+        if flat_type == QgsWkbTypes.Type.Point:
+            point = geometry.constGet()
+            coords = _format_coordinates([point.x()], [point.y()], precision)
+            return '{"type":"Point","coordinates":' + coords + "}"
+
+        if flat_type == QgsWkbTypes.Type.LineString:
+            line = geometry.constGet()
+            coords = _format_coordinates(line.xVector(), line.yVector(), precision)
+            return '{"type":"LineString","coordinates":[' + coords + "]}"
 
-    for feat in features:
-        geojson_feat = {
-            "type": "Feature",
-            "properties": feat.properties.copy(),
-            "geometry": json.loads(feat.featureGeometry.asJson()),
-        }
-        geojson_features.append(geojson_feat)
+        if flat_type == QgsWkbTypes.Type.MultiPoint:
+            coords = ",".join(
+                _format_coordinates([p.x()], [p.y()], precision)
+                for p in geometry.constParts()
+            )
+            return '{"type":"MultiPoint","coordinates":[' + coords + "]}"
 
-    geojson_obj: Dict[str, Any] = {
-        "type": "FeatureCollection",
-        "features": geojson_features,
-    }
+        if flat_type == QgsWkbTypes.Type.MultiLineString:
+            coords = ",".join(
+                "[" + _format_coordinates(p.xVector(), p.yVector(), precision) + "]"
+                for p in geometry.constParts()
+            )
+            return '{"type":"MultiLineString","coordinates":[' + coords + "]}"
 
-    json.dump(obj=geojson_obj, fp=fh, cls=QVariantJSONEncoder, indent=4)
+    # asJson() already returns a GeoJSON string, so write it out as-is
+    return geometry.asJson(17 if precision is None else precision)
 
 
 FeatureT = TypeVar("FeatureT", bound=Feature)
 
 
+def iter_with_feedback(
+    features: Sequence[FeatureT],
+    feedback: Optional[QgsFeedback],
+    progress_range: Tuple[float, float] = (0.0, 100.0),
+) -> Iterator[FeatureT]:
+    """
+    Iterate over features, reporting progress to the feedback object (if any) as a
+    percentage within progress_range, and stopping early if it's been cancelled.
+    """
+    if feedback is None:
+        yield from features
+        return
+
+    start, end = progress_range
+    total = max(len(features), 1)
+
+    for i, feature in enumerate(features):
+        if i % FEEDBACK_INTERVAL == 0:
+            if feedback.isCanceled():
+                return
+            feedback.setProgress(start + (end - start) * i / total)
+        yield feature
+
+    feedback.setProgress(end)
+
+
+def without_shared_properties(
+    properties: Dict[str, Any], shared: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    A feature's properties without the ones that are the same as the shared ones. For
+    an object property (e.g. provenance), only the members that match are removed.
+    """
+    props = dict(properties)
+    for k, shared_value in shared.items():
+        value = props.get(k)
+        if value is shared_value or value == shared_value:
+            del props[k]
+        elif isinstance(value, dict) and isinstance(shared_value, dict):
+            props[k] = {
+                kk: vv
+                for kk, vv in value.items()
+                if kk not in shared_value or shared_value[kk] != vv
+            }
+    return props
+
+
+def write_geojson_from_features(
+    fh: IO[str],
+    features: Sequence[Feature],
+    precision: Optional[int] = None,
+    feedback: Optional[QgsFeedback] = None,
+    shared_metadata: Optional[Dict[str, Any]] = None,
+):
+    """
+    Write features to a GeoJSON FeatureCollection, streaming one feature at a time
+    rather than building the whole collection in memory first.
+
+    If shared_metadata is given (e.g. the network object), it's written once as
+    members of the FeatureCollection, and left out of each feature's properties.
+    """
+    encoder = QVariantJSONEncoder()
+
+    fh.write('{"type": "FeatureCollection", ')
+    for k, v in (shared_metadata or {}).items():
+        fh.write(f"{json.dumps(k)}: {encoder.encode(v)}, ")
+    fh.write('"features": [\n')
+
+    for i, feat in enumerate(iter_with_feedback(features, feedback)):
+        if i > 0:
+            fh.write(",\n")
+        fh.write('{"type": "Feature", "properties": ')
+        if shared_metadata:
+            fh.write(
+                encoder.encode(without_shared_properties(feat.properties, shared_metadata))
+            )
+        else:
+            fh.write(encoder.encode(feat.properties))
+        fh.write(', "geometry": ')
+        fh.write(geometry_to_geojson(feat.featureGeometry, precision))
+        fh.write("}")
+
+    fh.write("\n]}\n")
+
+
+def load_geojson_layer(path: Union[str, Path], layer_name: str) -> QgsVectorLayer:
+    """
+    Load a GeoJSON file as a vector layer, including gzip (.gz) and zstd (.zst)
+    compressed GeoJSON.
+    """
+    compression = compression_for_path(path)
+
+    if compression == "gzip":
+        # GDAL can read gzip files directly, streaming them through its virtual
+        # filesystem.
+        uri = "/vsigzip/" + Path(path).as_posix()
+
+    elif compression == "zstd":
+        # GDAL has no zstd virtual filesystem, so decompress to a temporary file first
+        with open_text_file(path, "r") as src, tempfile.NamedTemporaryFile(
+            mode="w", suffix=f"{layer_name}.geojson", delete=False, encoding="utf-8"
+        ) as dst:
+            shutil.copyfileobj(src, dst)
+        layer = QgsVectorLayer("GeoJSON:" + dst.name, layer_name, "ogr")
+        _delete_file_with_layer(layer, dst.name)
+        return layer
+
+    else:
+        uri = Path(path).as_posix()
+
+    return QgsVectorLayer("GeoJSON:" + uri, layer_name, "ogr")
+
+
+def geojson_layer_name(path: Union[str, Path]) -> str:
+    """A layer name for a GeoJSON file, without its (compressed) extensions."""
+    path = Path(path)
+    if compression_for_path(path) is not None:
+        path = path.with_suffix("")
+    return path.stem
+
+
 def create_qgis_geojson_layer_from_features(
     features: Sequence[FeatureT], layer_name: str, cls: Type[FeatureT]
 ) -> Tuple[QgsVectorLayer, Sequence[FeatureT]]:
@@ -73,6 +309,7 @@ def create_qgis_geojson_layer_from_features(
         write_geojson_from_features(f, features)
 
     layer = QgsVectorLayer("GeoJSON:" + geojson_path, layer_name, "ogr")
+    _delete_file_with_layer(layer, geojson_path)
 
     # Create new nodes referencing the new layer's featureIds & featureGeometry
     new_features = list(cls.from_qgis_feature(f) for f in list(layer.getFeatures()))
@@ -0,0 +1,187 @@
+import json
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Bump this whenever the way comparisons are scored changes, so that scores cached by
+# older versions of the tool aren't reused
+SCORING_VERSION = 1
+
+SCORE_CACHE_FILENAME = "ofds_score_cache.sqlite"
+
+# Look up this many features' scores per query, within SQLite's limit on parameters
+_LOOKUP_BATCH_SIZE = 500
+
+# Keep at most this many scores (roughly 100MB) on disk, dropping the least recently
+# written when the cache is opened
+MAX_CACHED_SCORES = 200_000
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS scores (
+    kind TEXT NOT NULL,
+    hash_a TEXT NOT NULL,
+    hash_b TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    distance_km REAL,
+    scores TEXT NOT NULL,
+    PRIMARY KEY (kind, hash_a, hash_b, version)
+)
+"""
+
+
+class CachedScores(NamedTuple):
+    scores: Dict[str, float]
+    distance_km: Optional[float]
+
+
+class ScoreCache:
+    """
+    On-disk cache of comparison scores, keyed by the content hashes of the two
+    features compared.
+
+    The per-property scores don't depend on the weights or thresholds, so runs on the
+    same inputs with different settings only need to recalculate the totals.
+    """
+
+    connection: sqlite3.Connection
+
+    # Scoring runs in a background task while the UI thread also uses the cache, so
+    # all use of the connection and pending scores is serialised
+    _lock: threading.RLock
+
+    # Scores added since the last flush, written in one transaction
+    _pending: List[Tuple[str, str, str, int, Optional[float], str]]
+
+    hits: int
+    misses: int
+
+    def __init__(self, path: Union[str, Path] = ":memory:"):
+        self._lock = threading.RLock()
+        self.connection = sqlite3.connect(str(path), check_same_thread=False)
+        self.connection.execute(_CREATE_TABLE)
+        self.connection.commit()
+        self._pending = list()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, kind: str, hash_a: str, hash_b: str) -> Optional[CachedScores]:
+        with self._lock:
+            row = self.connection.execute(
+                "SELECT scores, distance_km FROM scores "
+                + "WHERE kind = ? AND hash_a = ? AND hash_b = ? AND version = ?",
+                (kind, hash_a, hash_b, SCORING_VERSION),
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+        return CachedScores(scores=json.loads(row[0]), distance_km=row[1])
+
+    def get_many(
+            self, kind: str, pairs: Iterable[Tuple[str, str]]
+    ) -> Dict[Tuple[str, str], CachedScores]:
+        """
+        Look up the scores of many pairs of features (hash A, hash B) at once, returning
+        those that are cached.
+        """
+        wanted = set(pairs)
+        found: Dict[Tuple[str, str], CachedScores] = dict()
+
+        hashes_a = sorted(set(hash_a for hash_a, _ in wanted))
+        with self._lock:
+            for start in range(0, len(hashes_a), _LOOKUP_BATCH_SIZE):
+                batch = hashes_a[start:start + _LOOKUP_BATCH_SIZE]
+                rows = self.connection.execute(
+                    "SELECT hash_a, hash_b, scores, distance_km FROM scores "
+                    + "WHERE kind = ? AND version = ? "
+                    + f"AND hash_a IN ({', '.join('?' * len(batch))})",
+                    (kind, SCORING_VERSION, *batch),
+                ).fetchall()
+                for hash_a, hash_b, scores, distance_km in rows:
+                    if (hash_a, hash_b) in wanted:
+                        found[(hash_a, hash_b)] = CachedScores(
+                            scores=json.loads(scores), distance_km=distance_km
+                        )
+
+            self.hits += len(found)
+            self.misses += len(wanted) - len(found)
+        return found
+
+    def put(
+            self,
+            kind: str,
+            hash_a: str,
+            hash_b: str,
+            scores: Dict[str, float],
+            distance_km: Optional[float] = None,
+    ):
+        row = (kind, hash_a, hash_b, SCORING_VERSION, distance_km, json.dumps(scores))
+        with self._lock:
+            self._pending.append(row)
+
+    def flush(self):
+        """Write the scores added since the last flush to disk."""
+        with self._lock:
+            if not self._pending:
+                return
+            with self.connection:
+                self.connection.executemany(
+                    "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?, ?, ?)",
+                    self._pending,
+                )
+            logger.info(
+                f"Cached {len(self._pending)} comparison scores "
+                + f"({self.hits} hits, {self.misses} misses)"
+            )
+            self._pending = list()
+
+    def prune(self, max_scores: int = MAX_CACHED_SCORES):
+        """
+        Drop scores from older scoring versions, which can never be used again, and the
+        least recently written scores beyond max_scores. Replacing a score gives it a
+        new rowid, so rowid order is the order scores were last written.
+        """
+        with self._lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM scores WHERE version != ?", (SCORING_VERSION,)
+            )
+            (count,) = self.connection.execute("SELECT COUNT(*) FROM scores").fetchone()
+            if count > max_scores:
+                self.connection.execute(
+                    "DELETE FROM scores WHERE rowid IN "
+                    + "(SELECT rowid FROM scores ORDER BY rowid LIMIT ?)",
+                    (count - max_scores,),
+                )
+                logger.info(f"Pruned {count - max_scores} cached comparison scores")
+
+    def clear(self):
+        with self._lock:
+            self._pending = list()
+            with self.connection:
+                self.connection.execute("DELETE FROM scores")
+
+    def close(self):
+        with self._lock:
+            self.flush()
+            self.connection.close()
+
+
+def open_score_cache(path: Union[str, Path]) -> ScoreCache:
+    """
+    Open the score cache at path, falling back to an in-memory cache if the file can't
+    be used, since the cache is only an optimisation.
+    """
+    try:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        cache = ScoreCache(path)
+        cache.prune()
+        return cache
+    except (OSError, sqlite3.Error) as e:
+        logger.warning(f"Can't open score cache '{path}', not persisting scores: {e}")
+        return ScoreCache()
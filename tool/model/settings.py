@@ -8,3 +8,7 @@ class Settings:
     nodes_ask_threshold: int
 
     nodes_match_radius_km: float
+
+    # Spans that don't share start/end nodes are still compared if their routes are
+    # within this distance of each other
+    spans_match_distance_km: float = 0.05
@@ -0,0 +1,270 @@
+import logging
+import os
+import time
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    Union,
+)
+
+from PyQt5.QtCore import pyqtSignal
+from qgis.core import QgsFeedback, QgsTask, QgsVectorLayer, QgsVectorLayerFeatureSource
+
+from .comparison import NodeComparison
+from .consolidation import NetworkNodesConsolidator
+from .export import ExportFormat, write_features_file
+from .network import Feature, Network, Node, Span
+
+logger = logging.getLogger(__name__)
+
+# How often to hand comparisons found by a ScoreNodesTask to the UI, in seconds
+SCORING_BATCH_INTERVAL = 0.25
+
+
+def partial_file_path(path: Path) -> Path:
+    """
+    Where to write a file before renaming it into place, next to the final file (so the
+    rename is atomic) and keeping its suffix (so the format can still be detected).
+    """
+    return path.with_name(f".partial-{path.name}")
+
+
+class SaveFeaturesTask(QgsTask):
+    """
+    Background task to save Nodes or Spans to a file. The file is written to a
+    temporary path and only renamed to the final path once it's complete, so a
+    cancelled or failed save never leaves a half-written file behind.
+    """
+
+    path: Path
+    features: Sequence[Feature]
+    cls: Type[Feature]
+    export_format: ExportFormat
+    shared_metadata: Optional[Dict[str, Any]]
+
+    feedback: QgsFeedback
+    error: Optional[Exception]
+
+    def __init__(
+        self,
+        path: Union[str, Path],
+        features: Sequence[Feature],
+        cls: Type[Feature],
+        export_format: ExportFormat,
+        shared_metadata: Optional[Dict[str, Any]] = None,
+    ):
+        super().__init__(
+            f"Saving {cls.__name__}s to {Path(path).name}", QgsTask.Flag.CanCancel
+        )
+        self.path = Path(path)
+        self.features = features
+        self.cls = cls
+        self.export_format = export_format
+        self.shared_metadata = shared_metadata
+        self.error = None
+
+        self.feedback = QgsFeedback()
+        self.feedback.progressChanged.connect(self.setProgress)
+
+    def run(self) -> bool:
+        partial_path = partial_file_path(self.path)
+        try:
+            write_features_file(
+                partial_path,
+                self.features,
+                self.cls,
+                self.export_format,
+                feedback=self.feedback,
+                shared_metadata=self.shared_metadata,
+            )
+            if self.feedback.isCanceled():
+                partial_path.unlink(missing_ok=True)
+                return False
+
+            os.replace(partial_path, self.path)
+            return True
+
+        except Exception as e:
+            logger.error(f"Error saving '{self.path}'", exc_info=e)
+            self.error = e
+            partial_path.unlink(missing_ok=True)
+            return False
+
+    def cancel(self):
+        self.feedback.cancel()
+        super().cancel()
+
+
+class SaveNetworkTask(QgsTask):
+    """
+    Background task to save both the Nodes and Spans of a Network, each in their own
+    sub-task so they're written in parallel.
+
+    on_finished is called on the main thread, with True if both files were saved.
+    """
+
+    paths: List[Path]
+    on_finished: Optional[Callable[[bool, "SaveNetworkTask"], None]]
+
+    def __init__(
+        self,
+        network: Network,
+        nodes_path: Union[str, Path],
+        spans_path: Union[str, Path],
+        export_format: ExportFormat,
+        on_finished: Optional[Callable[[bool, "SaveNetworkTask"], None]] = None,
+        shared_metadata: Optional[Dict[str, Any]] = None,
+    ):
+        super().__init__("Saving consolidated network", QgsTask.Flag.CanCancel)
+        self.paths = [Path(nodes_path), Path(spans_path)]
+        self.on_finished = on_finished
+
+        self.subtasks = [
+            SaveFeaturesTask(
+                nodes_path, network.nodes, Node, export_format, shared_metadata
+            ),
+            SaveFeaturesTask(
+                spans_path, network.spans, Span, export_format, shared_metadata
+            ),
+        ]
+        for subtask in self.subtasks:
+            self.addSubTask(
+                subtask, [], QgsTask.SubTaskDependency.ParentDependsOnSubTask
+            )
+
+    @property
+    def errors(self) -> List[Exception]:
+        return [t.error for t in self.subtasks if t.error is not None]
+
+    def run(self) -> bool:
+        # The sub-tasks do the work, and this only runs once they've all succeeded
+        return True
+
+    def finished(self, result: bool):
+        if self.on_finished is not None:
+            self.on_finished(result, self)
+
+
+class ScoreNodesTask(QgsTask):
+    """
+    Background task to compare the nodes of a NetworkNodesConsolidator created with
+    defer_scoring. The comparisons to ask the user about are sent to the main thread
+    in batches with comparisonsScored as they're found, so the user can start on them
+    before every pair has been scored.
+
+    on_finished is called on the main thread, with True if every pair was scored. It
+    should call the consolidator's finish_scoring.
+    """
+
+    comparisonsScored = pyqtSignal(list)
+
+    consolidator: NetworkNodesConsolidator
+    on_finished: Optional[Callable[[bool, "ScoreNodesTask"], None]]
+
+    feedback: QgsFeedback
+    error: Optional[Exception]
+
+    def __init__(
+        self,
+        consolidator: NetworkNodesConsolidator,
+        on_finished: Optional[Callable[[bool, "ScoreNodesTask"], None]] = None,
+    ):
+        super().__init__("Comparing nodes", QgsTask.Flag.CanCancel)
+        self.consolidator = consolidator
+        self.on_finished = on_finished
+        self.error = None
+        self.feedback = QgsFeedback()
+
+    def run(self) -> bool:
+        batch: List[NodeComparison] = list()
+        last_sent = time.monotonic()
+        try:
+            for comparison in self.consolidator.score_candidates(self.feedback):
+                batch.append(comparison)
+                if time.monotonic() - last_sent >= SCORING_BATCH_INTERVAL:
+                    self.comparisonsScored.emit(batch)
+                    batch = list()
+                    last_sent = time.monotonic()
+
+            if batch:
+                self.comparisonsScored.emit(batch)
+
+            return not self.feedback.isCanceled()
+
+        except Exception as e:
+            logger.error("Error comparing nodes", exc_info=e)
+            self.error = e
+            return False
+
+    def cancel(self):
+        self.feedback.cancel()
+        super().cancel()
+
+    def finished(self, result: bool):
+        if self.on_finished is not None:
+            self.on_finished(result, self)
+
+
+class DiscoverNetworksTask(QgsTask):
+    """
+    Background task to find the networks (id, name) in the selected nodes and spans
+    layers of Network A and B. Layers mustn't be used off the main thread, so their
+    features are read through feature sources made when the task is created.
+
+    generation identifies the layer selection the task is for, so that results for a
+    selection that's changed since can be ignored. on_finished is called on the main
+    thread, with True if all the features were read.
+    """
+
+    generation: int
+    networks: Tuple[Set[Tuple[str, str]], Set[Tuple[str, str]]]
+    on_finished: Optional[Callable[[bool, "DiscoverNetworksTask"], None]]
+
+    def __init__(
+        self,
+        generation: int,
+        nodes_layers: Tuple[Optional[QgsVectorLayer], Optional[QgsVectorLayer]],
+        spans_layers: Tuple[Optional[QgsVectorLayer], Optional[QgsVectorLayer]],
+        on_finished: Optional[Callable[[bool, "DiscoverNetworksTask"], None]] = None,
+    ):
+        super().__init__("Finding networks", QgsTask.Flag.CanCancel)
+        self.generation = generation
+        self.on_finished = on_finished
+        self.networks = (set(), set())
+
+        # For Network A and B, the feature class and source of each selected layer
+        self._sources = [
+            [
+                (cls, QgsVectorLayerFeatureSource(layer))
+                for cls, layer in ((Node, nodes_layer), (Span, spans_layer))
+                if layer is not None
+            ]
+            for nodes_layer, spans_layer in zip(nodes_layers, spans_layers)
+        ]
+
+    def run(self) -> bool:
+        for sources, networks in zip(self._sources, self.networks):
+            for cls, source in sources:
+                for qgs_feature in source.getFeatures():
+                    if self.isCanceled():
+                        return False
+                    try:
+                        feature = cls.from_qgis_feature(qgs_feature)
+                        networks.add(
+                            (feature.ofds_network.id, feature.ofds_network.name)
+                        )
+                    except Exception as e:
+                        logger.error("Error when processing feature", exc_info=e)
+        return True
+
+    def finished(self, result: bool):
+        if self.on_finished is not None:
+            self.on_finished(result, self)
@@ -1,6 +1,6 @@
 import logging
 
-from PyQt5.QtCore import QThread
+from PyQt5.QtCore import QThread, QTimer
 from PyQt5.QtWidgets import QDialog
 from qgis.core import (
     QgsProject,
@@ -9,12 +9,16 @@ from qgis.core import (
 from ..gui import Ui_OFDSDedupToolDialog
 
 from .control import ToolController
-from .viewmodel.state import ToolState
+from .viewmodel.state import ToolLayerSelectState, ToolState
 from .view import ToolView
 
 
 logger = logging.getLogger(__name__)
 
+# Changes to the selected layers come in bursts, e.g. while the drop-downs are being
+# populated, so wait this long for them to settle before finding the layers' networks
+LAYER_SELECT_DEBOUNCE_MS = 200
+
 
 class OFDSDedupToolDialog(QDialog):
     """
@@ -45,25 +49,40 @@ class OFDSDedupToolDialog(QDialog):
 
         # Connect UI signals to slots on this class
         self.ui.startButton.clicked.connect(self.onStartButtonClicked)
-        self.ui.nodesComboBoxA.currentIndexChanged.connect(self.onLayerSelectComboBoxUpdate)
-        self.ui.spansComboBoxA.currentIndexChanged.connect(self.onLayerSelectComboBoxUpdate)
-        self.ui.nodesComboBoxB.currentIndexChanged.connect(self.onLayerSelectComboBoxUpdate)
-        self.ui.spansComboBoxB.currentIndexChanged.connect(self.onLayerSelectComboBoxUpdate)
+        self.ui.addLayersButton.clicked.connect(self.onAddLayersButtonClicked)
+
+        self.layerSelectTimer = QTimer(self)
+        self.layerSelectTimer.setSingleShot(True)
+        self.layerSelectTimer.setInterval(LAYER_SELECT_DEBOUNCE_MS)
+        self.layerSelectTimer.timeout.connect(self.onLayerSelectComboBoxUpdate)
+        self.ui.nodesComboBoxA.currentIndexChanged.connect(self.onLayerSelectComboBoxChanged)
+        self.ui.spansComboBoxA.currentIndexChanged.connect(self.onLayerSelectComboBoxChanged)
+        self.ui.nodesComboBoxB.currentIndexChanged.connect(self.onLayerSelectComboBoxChanged)
+        self.ui.spansComboBoxB.currentIndexChanged.connect(self.onLayerSelectComboBoxChanged)
 
         self.ui.sameNodesButton.clicked.connect(self.onSameNodeButtonClicked)
         self.ui.notSameNodesButton.clicked.connect(self.onNotSameNodeButtonClicked)
         self.ui.nextNodesButton.clicked.connect(self.onNextNodesButtonClicked)
         self.ui.prevNodesButton.clicked.connect(self.onPrevNodesButtonClicked)
+        self.ui.acceptAboveNodesButton.clicked.connect(self.onConsolidateAboveClicked)
+        self.ui.rejectBelowNodesButton.clicked.connect(self.onKeepBelowClicked)
         self.ui.finishedNodesButton.clicked.connect(self.onFinishedNodesButtonClicked)
 
         self.ui.spansSameButton.clicked.connect(self.onSameSpanButtonClicked)
         self.ui.spansNotSameButton.clicked.connect(self.onNotSameSpanButtonClicked)
         self.ui.spansNextButton.clicked.connect(self.onNextSpansButtonClicked)
         self.ui.spansPrevButton.clicked.connect(self.onPrevSpansButtonClicked)
+        self.ui.spansAcceptAboveButton.clicked.connect(self.onConsolidateAboveClicked)
+        self.ui.spansRejectBelowButton.clicked.connect(self.onKeepBelowClicked)
         self.ui.spansFinishedButton.clicked.connect(self.onFinishedSpansButtonClicked)
 
         self.ui.outputSaveNodes.clicked.connect(self.onSaveNodesButtonClicked)
         self.ui.outputSaveSpans.clicked.connect(self.onSaveSpansButtonClicked)
+        self.ui.outputSavePackage.clicked.connect(self.onSavePackageButtonClicked)
+        self.ui.outputSaveAll.clicked.connect(self.onSaveAllButtonClicked)
+        self.ui.outputSaveDelta.clicked.connect(self.onSaveDeltaButtonClicked)
+        self.ui.outputSaveRun.clicked.connect(self.onSaveRunButtonClicked)
+        self.ui.loadRunButton.clicked.connect(self.onLoadRunButtonClicked)
 
     def reset(self, project: QgsProject):
         """
@@ -71,6 +90,9 @@ class OFDSDedupToolDialog(QDialog):
         """
         self.project = project
 
+        # Drop any pending layer selection update, it's for the previous state
+        self.layerSelectTimer.stop()
+
         # Setup View/Controller
         self.controller = ToolController(self.project, self.ui)
         self.view = ToolView(self.project, self.ui)
@@ -79,15 +101,38 @@ class OFDSDedupToolDialog(QDialog):
         self.set_state(self.controller.onInit())
 
     def set_state(self, state: ToolState):
+        previous = getattr(self, "state", None)
+        if previous is not None and previous is not state:
+            previous.close()
         self.state = state
         logger.debug(f"STATE = {self.state}")
+        state.onUpdated = self.onStateUpdated
+        self.updateView()
+
+    def onStateUpdated(self):
+        """The current state changed by itself, e.g. background work added to it."""
+        self.updateView()
+
+    def updateView(self):
         self.view.update(self.state)
+        # Don't start until the networks in the newly selected layers are known
+        if self.layerSelectTimer.isActive():
+            self.ui.startButton.setEnabled(False)
 
     def onStartButtonClicked(self):
         logger.debug("Start button clicked")
+        self.layerSelectTimer.stop()
         self.set_state(self.controller.onStartButton(self.state))
 
+    def onLayerSelectComboBoxChanged(self):
+        # (Re)start the timer, so a burst of changes only causes one update
+        self.layerSelectTimer.start()
+        self.ui.startButton.setEnabled(False)
+
     def onLayerSelectComboBoxUpdate(self):
+        # The timer can still fire after the layers have been chosen
+        if not isinstance(self.state, ToolLayerSelectState):
+            return
         logger.debug("Layer select combo box updated")
         self.set_state(self.controller.onLayerSelectComboBoxUpdate(self.state))
 
@@ -125,12 +170,37 @@ class OFDSDedupToolDialog(QDialog):
     def onFinishedSpansButtonClicked(self):
         self.set_state(self.controller.onFinishedButton(self.state))
 
+    # Both comparisons
+    def onConsolidateAboveClicked(self):
+        self.set_state(self.controller.onConsolidateAboveButton(self.state))
+
+    def onKeepBelowClicked(self):
+        self.set_state(self.controller.onKeepBelowButton(self.state))
+
     def onSaveNodesButtonClicked(self):
         self.set_state(self.controller.onSaveNodesButton(self.state))
 
     def onSaveSpansButtonClicked(self):
         self.set_state(self.controller.onSaveSpansButton(self.state))
 
+    def onSaveAllButtonClicked(self):
+        self.set_state(self.controller.onSaveAllButton(self.state))
+
+    def onSavePackageButtonClicked(self):
+        self.set_state(self.controller.onSavePackageButton(self.state))
+
+    def onSaveDeltaButtonClicked(self):
+        self.set_state(self.controller.onSaveDeltaButton(self.state))
+
+    def onSaveRunButtonClicked(self):
+        self.set_state(self.controller.onSaveRunButton(self.state))
+
+    def onAddLayersButtonClicked(self):
+        self.set_state(self.controller.onAddLayersButton(self.state))
+
+    def onLoadRunButtonClicked(self):
+        self.set_state(self.controller.onLoadRunButton(self.state))
+
 
 class Worker(QThread):
     """Background thread for processing data without freezing the UI."""
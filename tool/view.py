@@ -1,7 +1,11 @@
 import logging
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import List, Optional, Tuple, Union, Set
+from typing import Dict, List, Optional, Tuple, Union, Set
+from pathlib import Path
 
+from PyQt5.QtCore import QTimer
+from PyQt5.QtGui import QColor
 from PyQt5.QtWidgets import (
     QTextEdit,
     QPushButton,
@@ -16,9 +20,11 @@ from qgis.core import (
     QgsVectorLayer,
     QgsProject,
     QgsCoordinateTransform,
+    QgsGeometry,
+    QgsRectangle,
     QgsWkbTypes,
 )
-from qgis.gui import QgsMapCanvas
+from qgis.gui import QgsMapCanvas, QgsRubberBand
 
 from .helpers import EPSG3857, getOpenStreetMapLayer
 from .model.comparison import (
@@ -45,6 +51,14 @@ logger = logging.getLogger(__name__)
 # e.g. 1:25,000 would be 25000
 MINIMAP_SCALE_RATIO = 100000  # 1:100,000
 
+# Colour of the overlay highlighting the feature being compared on the minimaps
+HIGHLIGHT_COLOR = QColor(255, 0, 255, 200)
+
+# How many rendered comparisons to keep for the info panel, and how many comparisons
+# either side of the current one to render ahead of time
+INFO_PANEL_CACHE_SIZE = 64
+INFO_PANEL_PREFETCH_DISTANCE = 3
+
 DISPLAY_NODE_PROPERTIES = [
     "id",
     "name",
@@ -121,6 +135,8 @@ class MiniMapView:
         spansLayer: QgsVectorLayer
         featureId: Optional[int]
         featureType: Optional[FeatureType]
+        # The feature's geometry, in the layer's CRS, for highlighting it with an overlay
+        featureGeometry: Optional[QgsGeometry] = None
 
     @dataclass(frozen=True)
     class Layers:
@@ -131,16 +147,93 @@ class MiniMapView:
     layers: Optional[Layers]
     backgroundLayer: QgsMapLayer
 
+    # Whether to highlight features with a rubber band overlay, and zoom to their
+    # (cached) extents directly, rather than selecting and zooming via the layers
+    overlay: bool
+    rubberBand: QgsRubberBand
+
+    # Transforms from each layer's CRS to the display CRS, and features' bounding
+    # boxes in the display CRS, by (type, QGIS feature ID). Only the bounding boxes
+    # are cached, since the extents they're shown at depend on the canvas size.
+    _transforms: Dict[FeatureType, QgsCoordinateTransform]
+    _bboxes: Dict[Tuple[FeatureType, int], QgsRectangle]
+
     def __init__(
             self,
             mapCanvas: QgsMapCanvas,
             backgroundLayer: QgsMapLayer,
+            overlay: bool = True,
     ):
         self.mapCanvas = mapCanvas
         self.backgroundLayer = backgroundLayer
         self.mapCanvas.enableAntiAliasing(True)
         self.mapCanvas.setDestinationCrs(self.DISPLAY_CRS)
 
+        self.overlay = overlay
+        self.rubberBand = QgsRubberBand(self.mapCanvas)
+        self.rubberBand.setColor(HIGHLIGHT_COLOR)
+        self.rubberBand.setWidth(3)
+        self.rubberBand.setIcon(QgsRubberBand.ICON_CIRCLE)
+        self.rubberBand.setIconSize(12)
+
+        self._transforms = dict()
+        self._bboxes = dict()
+
+    def _featureExtent(
+            self, featureType: FeatureType, featureId: int, geometry: QgsGeometry
+    ) -> QgsRectangle:
+        """The extent to show a feature at, in the display CRS."""
+        key = (featureType, featureId)
+        bbox = self._bboxes.get(key)
+        if bbox is None:
+            bbox = self._transforms[featureType].transformBoundingBox(
+                geometry.boundingBox()
+            )
+            self._bboxes[key] = bbox
+
+        if featureType == FeatureType.NODE:
+            # Show nodes at a fixed scale, i.e. the canvas width on screen in metres
+            # times the scale ratio
+            centre = bbox.center()
+            metres_per_pixel = (
+                    MINIMAP_SCALE_RATIO * 0.0254 / self.mapCanvas.mapSettings().outputDpi()
+            )
+            half_width = self.mapCanvas.width() * metres_per_pixel / 2
+            half_height = self.mapCanvas.height() * metres_per_pixel / 2
+            extent = QgsRectangle(
+                centre.x() - half_width,
+                centre.y() - half_height,
+                centre.x() + half_width,
+                centre.y() + half_height,
+            )
+        else:
+            # Leave a margin around spans
+            extent = QgsRectangle(bbox)
+            extent.scale(1.2)
+
+        return extent
+
+    def _highlight(self, state: State):
+        """Show the feature with an overlay, setting the extent and rendering once."""
+        assert self.layers is not None
+        if state.featureType == FeatureType.NODE:
+            layer = self.layers.nodesLayer
+            geometryType = QgsWkbTypes.GeometryType.PointGeometry
+        elif state.featureType == FeatureType.SPAN:
+            layer = self.layers.spansLayer
+            geometryType = QgsWkbTypes.GeometryType.LineGeometry
+        else:
+            raise InvalidViewState
+
+        assert state.featureGeometry is not None and state.featureId is not None
+        self.rubberBand.reset(geometryType)
+        self.rubberBand.setToGeometry(state.featureGeometry, layer)
+
+        self.mapCanvas.setExtent(
+            self._featureExtent(state.featureType, state.featureId, state.featureGeometry)
+        )
+        self.mapCanvas.refresh()
+
     def zoomToEverything(self):
         if not self.layers:
             raise InvalidViewState("Can't display map without layers set")
@@ -159,6 +252,9 @@ class MiniMapView:
             # Nothing to display, so display nothing
             logger.debug("RESET MAP")
             self.layers = None
+            self._transforms = dict()
+            self._bboxes = dict()
+            self.rubberBand.reset()
             self.mapCanvas.setLayers([])
             self.mapCanvas.refresh()
             return
@@ -173,6 +269,16 @@ class MiniMapView:
                 [self.layers.nodesLayer, self.layers.spansLayer, self.backgroundLayer]
             )
             logger.info(f"MiniMap has new {self.mapCanvas.layers()=}")
+            self._transforms = {
+                featureType: QgsCoordinateTransform(
+                    layer.crs(), self.DISPLAY_CRS, QgsProject.instance()
+                )
+                for featureType, layer in (
+                    (FeatureType.NODE, self.layers.nodesLayer),
+                    (FeatureType.SPAN, self.layers.spansLayer),
+                )
+            }
+            self._bboxes = dict()
             self.zoomToEverything()
 
         # Check to make sure the layers haven't change for some reason
@@ -184,6 +290,15 @@ class MiniMapView:
             raise InvalidViewState("Unexpected Layer change")
 
         # Zoom the map to and hilight the relevent feature
+        if (
+                self.overlay
+                and state.featureType is not None
+                and state.featureId is not None
+                and state.featureGeometry is not None
+        ):
+            self._highlight(state)
+            return
+
         if state.featureType is not None and state.featureId is not None:
             if state.featureType == FeatureType.NODE:
                 self.mapCanvas.zoomToFeatureIds(
@@ -201,6 +316,7 @@ class MiniMapView:
             else:
                 raise InvalidViewState
         else:
+            self.rubberBand.reset()
             self.zoomToEverything()
 
         # We need to "refresh" to rerender the map after changing it
@@ -210,8 +326,72 @@ class MiniMapView:
 class InfoPanelView:
     infoPanel: QTextEdit
 
+    # Most recently rendered HTML, by comparison
+    _htmlCache: "OrderedDict[Tuple, str]"
+
+    # Comparisons to render ahead of time, when the UI is idle
+    _prefetchQueue: List[Union[NodeComparison, SpanComparison]]
+    _prefetchScheduled: bool
+
     def __init__(self, infoPanel: QTextEdit):
         self.infoPanel = infoPanel
+        self._htmlCache = OrderedDict()
+        self._prefetchQueue = list()
+        self._prefetchScheduled = False
+
+    @staticmethod
+    def _cacheKey(comparison: Union[NodeComparison, SpanComparison]) -> Tuple:
+        feature_a, feature_b = comparison.features
+        return (
+            feature_a.featureType,
+            feature_a.id,
+            feature_a.featureId,
+            feature_b.id,
+            feature_b.featureId,
+        )
+
+    def render(self, comparison: Union[NodeComparison, SpanComparison]) -> str:
+        """The info panel HTML for a comparison, from the cache if it's been rendered."""
+        key = self._cacheKey(comparison)
+        html = self._htmlCache.get(key)
+        if html is not None:
+            self._htmlCache.move_to_end(key)
+            return html
+
+        if isinstance(comparison, NodeComparison):
+            html = self.render_node_comparison_info_html(comparison)
+        elif isinstance(comparison, SpanComparison):
+            html = self.render_span_comparison_info(comparison)
+        else:
+            raise InvalidViewState
+
+        self._htmlCache[key] = html
+        if len(self._htmlCache) > INFO_PANEL_CACHE_SIZE:
+            self._htmlCache.popitem(last=False)
+        return html
+
+    def prefetch(self, comparisons: List[Union[NodeComparison, SpanComparison]]):
+        """
+        Render comparisons the user is likely to go to next, one per turn of the event
+        loop, so it doesn't hold up handling their input. Replaces any comparisons still
+        waiting from an earlier prefetch.
+        """
+        self._prefetchQueue = list(comparisons)
+        if self._prefetchQueue and not self._prefetchScheduled:
+            self._prefetchScheduled = True
+            QTimer.singleShot(0, self._prefetchNext)
+
+    def _prefetchNext(self):
+        self._prefetchScheduled = False
+        while self._prefetchQueue:
+            comparison = self._prefetchQueue.pop(0)
+            if self._cacheKey(comparison) not in self._htmlCache:
+                self.render(comparison)
+                break
+
+        if self._prefetchQueue:
+            self._prefetchScheduled = True
+            QTimer.singleShot(0, self._prefetchNext)
 
     def render_node_comparison_info_html(self, comparison: NodeComparison) -> str:
         """
@@ -340,10 +520,18 @@ class InfoPanelView:
         low_score_rows = [row for row in all_score_rows if
                           row[0] not in hi_score_props and row[3] > 0 and row not in missing_data_rows]
 
+        if comparison.scores.get("nodes") == 1:
+            match_reason = "These spans start and end at the same nodes."
+        else:
+            match_reason = (
+                "These spans follow a similar route, "
+                + "but don't start and end at the same nodes."
+            )
+
         info_html = f"""
         <h2>Overall Confidence: {int(comparison.confidence)}%</h2>
 
-        <p>These spans start and end at the same nodes.</p>
+        <p>{match_reason}</p>
 
         <h2>Confidence score details</h2>
         """
@@ -422,19 +610,14 @@ class InfoPanelView:
             # No feature to display, e.g. still selecting layers
             self.infoPanel.setHtml("")
             self.infoPanel.setEnabled(False)
+            self._prefetchQueue = list()
+            self._htmlCache.clear()
             return
 
         # Display feature info
 
         self.infoPanel.setEnabled(True)
-        if isinstance(comparison, NodeComparison):
-            self.infoPanel.setHtml(self.render_node_comparison_info_html(comparison))
-
-        elif isinstance(comparison, SpanComparison):
-            self.infoPanel.setHtml(self.render_span_comparison_info(comparison))
-
-        else:
-            raise InvalidViewState
+        self.infoPanel.setHtml(self.render(comparison))
 
 
 #
@@ -451,6 +634,8 @@ class LayerSelectView:
     spansComboBoxes: Tuple[QComboBox, QComboBox]
     networksComboBoxes: Tuple[QComboBox, QComboBox]
     startButton: QWidget
+    loadRunButton: QPushButton
+    addLayersButton: QPushButton
 
     _previous_networks: Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]
     _previous_layers_ids: Set[str]
@@ -461,11 +646,15 @@ class LayerSelectView:
             spansComboBoxes: Tuple[QComboBox, QComboBox],
             networksComboBoxes: Tuple[QComboBox, QComboBox],
             startButton: QWidget,
+            loadRunButton: QPushButton,
+            addLayersButton: QPushButton,
     ):
         self.nodesComboBoxes = nodesComboBoxes
         self.spansComboBoxes = spansComboBoxes
         self.networksComboBoxes = networksComboBoxes
         self.startButton = startButton
+        self.loadRunButton = loadRunButton
+        self.addLayersButton = addLayersButton
         self._previous_networks = ([], [])
         self._previous_layers_ids = set()
 
@@ -545,6 +734,11 @@ class LayerSelectView:
 
             self._previous_networks = (state.selectableNetworksA.copy(), state.selectableNetworksB.copy())
 
+            if state.previousRunPath:
+                self.loadRunButton.setText(f"Previous Run: {Path(state.previousRunPath).name}")
+            else:
+                self.loadRunButton.setText("Load Previous Run...")
+
         else:
             enable_layer_select = False
             self.networksComboBoxes[0].setEnabled(False)
@@ -559,7 +753,11 @@ class LayerSelectView:
         for widget in self.spansComboBoxes:
             widget.setEnabled(enable_layer_select)
 
-        self.startButton.setEnabled(enable_layer_select)
+        # Don't start until the networks in the selected layers have been found
+        discovering = isinstance(state, ToolLayerSelectState) and state.discovering
+        self.startButton.setEnabled(enable_layer_select and not discovering)
+        self.loadRunButton.setEnabled(enable_layer_select)
+        self.addLayersButton.setEnabled(enable_layer_select)
 
 
 
@@ -616,8 +814,16 @@ class ComparisonView:
         Update UI when we are currently comparing a pair of features.
         """
         if state.currentComparison is None:
+            # e.g. nothing found yet by background scoring, so show the whole networks
             for i in [0, 1]:
-                self.mapViews[i].zoomToEverything()
+                self.mapViews[i].update(
+                    MiniMapView.State(
+                        nodesLayer=state.networks[i].nodesLayer,
+                        spansLayer=state.networks[i].spansLayer,
+                        featureId=None,
+                        featureType=None,
+                    )
+                )
         else:
             for i in [0, 1]:
                 self.mapViews[i].update(
@@ -626,13 +832,23 @@ class ComparisonView:
                         spansLayer=state.networks[i].spansLayer,
                         featureId=state.currentComparison.features[i].featureId,
                         featureType=state.currentComparison.features[i].featureType,
+                        featureGeometry=state.currentComparison.features[i].featureGeometry,
                     )
                 )
 
         self.infoPanelView.update(state.currentComparison)
+        self.infoPanelView.prefetch(
+            state.comparisonsAround(INFO_PANEL_PREFETCH_DISTANCE)
+        )
 
         outcome = state.currentOutcome
-        if outcome is None:
+        if state.currentComparison is None:
+            self.sameButton.setEnabled(False)
+            self.sameButton.setStyleSheet("background-color: white;")
+            self.notSameButton.setEnabled(False)
+            self.notSameButton.setStyleSheet("background-color: white;")
+
+        elif outcome is None:
             self.sameButton.setEnabled(True)
             self.sameButton.setStyleSheet("background-color: white;")
             self.notSameButton.setEnabled(True)
@@ -650,13 +866,18 @@ class ComparisonView:
             self.notSameButton.setEnabled(False)
             self.notSameButton.setStyleSheet("background-color: yellow;")
 
-        self.nextButton.setEnabled(True)
-        self.prevButton.setEnabled(True)
+        self.nextButton.setEnabled(state.nTotal > 0)
+        self.prevButton.setEnabled(state.nTotal > 0)
 
+        scoring = isinstance(state, ToolNodeComparisonState) and state.scoring
         self.progressLabel.setText(
-            f"Node Comparison {state.current + 1} of {state.nTotal}"
-            if state.state == ToolStateEnum.COMPARING_NODES
-            else f"Span Comparison {state.current + 1} of {state.nTotal}"
+            (
+                f"Node Comparison {state.current + 1} of {state.nTotal}"
+                if state.state == ToolStateEnum.COMPARING_NODES
+                else f"Span Comparison {state.current + 1} of {state.nTotal}"
+            )
+            + f" ({state.nConsolidated} same, {state.nRejected} not same)"
+            + (" - still comparing..." if scoring else "")
         )
         self.progressBar.setEnabled(True)
         self.progressBar.setMinimum(0)
@@ -664,7 +885,7 @@ class ComparisonView:
         self.progressBar.setValue(state.nCompared)
         self.progressBar.setFormat("%v of %m compared")
 
-        self.finishButton.setEnabled(True)
+        self.finishButton.setEnabled(not scoring)
 
     def _updateNotComparing(self):
         """
@@ -743,6 +964,8 @@ class ToolView:
             spansComboBoxes=(ui.spansComboBoxA, ui.spansComboBoxB),
             networksComboBoxes=(ui.networkComboBoxA, ui.networkComboBoxB),
             startButton=ui.startButton,
+            loadRunButton=ui.loadRunButton,
+            addLayersButton=ui.addLayersButton,
         )
 
         self.nodeComparisonView = ComparisonView(
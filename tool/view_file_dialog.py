@@ -1,19 +1,32 @@
 import logging
 
 from pathlib import Path
-from typing import Sequence, Union
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type, Union
 from PyQt5.QtWidgets import QFileDialog, QDialog
 from PyQt5 import QtCore
 
-from .model.qgis_utils import write_geojson_from_features
+from .model.decisions import RunRecord, read_run_record, write_run_record
+from .model.delta import export_delta
+from .model.export import (
+    ExportFormat,
+    write_features_file,
+    write_ofds_json_package_file,
+)
+from .model.files import zstd_available
 
-from .model.network import Feature
+from .model.network import Feature, Network
 
 
 logger = logging.getLogger(__name__)
 
 
-def save_file_dialog(file_extension: str) -> Union[str, None]:
+def _exec_save_dialog(
+    name_filters: List[str], default_suffix: str
+) -> Union[Tuple[str, str], None]:
+    """
+    Show a file save dialog, returning the chosen path and name filter, or None if the
+    user cancelled.
+    """
     options = QFileDialog.Options()
     # options |= QFileDialog.DontUseNativeDialog
     options |= QFileDialog.DontUseCustomDirectoryIcons
@@ -27,20 +40,156 @@ def save_file_dialog(file_extension: str) -> Union[str, None]:
 
     dialog.setAcceptMode(QFileDialog.AcceptSave)
 
-    dialog.setDefaultSuffix(file_extension)
-    dialog.setNameFilters([f"{file_extension} (*.{file_extension})"])
+    dialog.setDefaultSuffix(default_suffix)
+    dialog.setNameFilters(name_filters)
 
     if dialog.exec_() == QDialog.Accepted:
         path = dialog.selectedFiles()[0]  # returns a list
-        return path
+        return path, dialog.selectedNameFilter()
     else:
         return None
 
 
-def save_geojson_file_dialog(features: Sequence[Feature]):
-    logger.info("Opening File Save Dialog for GeoJSON")
-    file_path = save_file_dialog(file_extension="geojson")
-    logger.info(f"Saving GeoJSON to '{file_path}'")
+def _with_extension(path: str, file_extension: str) -> str:
+    """
+    The dialog's default suffix doesn't follow the chosen file type, so fix it up here,
+    allowing for double extensions like ".geojson.gz".
+    """
+    if path.endswith(f".{file_extension}"):
+        return path
+    return f"{Path(path).with_suffix('')}.{file_extension}"
+
+
+def save_file_dialog(file_extension: str) -> Union[str, None]:
+    result = _exec_save_dialog(
+        [f"{file_extension} (*.{file_extension})"], default_suffix=file_extension
+    )
+    return result[0] if result else None
+
+
+def save_export_file_dialog() -> Union[Tuple[str, ExportFormat], None]:
+    """
+    Ask the user where to save, letting them pick the file format via the file type
+    dropdown. Returns the path and format, or None if cancelled.
+    """
+    formats = {f.name_filter: f for f in ExportFormat if f.is_available}
+    result = _exec_save_dialog(
+        list(formats.keys()), default_suffix=ExportFormat.GEOJSON.file_extension
+    )
+    if result is None:
+        return None
+
+    path, name_filter = result
+    export_format = formats.get(name_filter, ExportFormat.GEOJSON)
+
+    return _with_extension(path, export_format.file_extension), export_format
+
+
+def save_network_files_dialog() -> Union[Tuple[Path, Path, ExportFormat], None]:
+    """
+    Ask the user for a file name and format to save both Nodes and Spans as, returning
+    the paths for each, e.g. "network.gpkg" becomes "network_nodes.gpkg" and
+    "network_spans.gpkg".
+    """
+    logger.info("Opening File Save Dialog for Nodes and Spans")
+    result = save_export_file_dialog()
+    if result is None:
+        return None
+
+    file_path, export_format = result
+    extension = export_format.file_extension
+    stem = Path(file_path[: -len(extension) - 1])
+    return (
+        stem.with_name(f"{stem.name}_nodes.{extension}"),
+        stem.with_name(f"{stem.name}_spans.{extension}"),
+        export_format,
+    )
+
+
+def save_features_file_dialog(
+    features: Sequence[Feature],
+    cls: Type[Feature],
+    shared_metadata: Optional[Dict[str, Any]] = None,
+):
+    logger.info(f"Opening File Save Dialog for {cls.__name__}s")
+    result = save_export_file_dialog()
+    if result:
+        file_path, export_format = result
+        logger.info(f"Saving {export_format.name} to '{file_path}'")
+        write_features_file(
+            file_path, features, cls, export_format, shared_metadata=shared_metadata
+        )
+
+
+def save_ofds_json_package_file_dialog(network: Network):
+    logger.info("Opening File Save Dialog for OFDS JSON")
+    extensions = {"OFDS JSON (*.json)": "json", "OFDS JSON (gzip) (*.json.gz)": "json.gz"}
+    result = _exec_save_dialog(list(extensions.keys()), default_suffix="json")
+    if result:
+        path, name_filter = result
+        file_path = _with_extension(path, extensions.get(name_filter, "json"))
+        logger.info(f"Saving OFDS JSON to '{file_path}'")
+        write_ofds_json_package_file(file_path, network)
+
+
+def _open_geojson_file_dialog(caption: str) -> Union[str, None]:
+    name_filter = "GeoJSON (*.geojson *.geojson.gz *.geojson.zst *.json)"
+    path, _ = QFileDialog.getOpenFileName(None, caption, "", name_filter)
+    return path or None
+
+
+def export_delta_dialog(network: Network):
+    """
+    Ask the user for the previously exported Nodes and Spans GeoJSON files, and a
+    directory to write the differences between those and this network to.
+    """
+    logger.info("Opening File Dialogs for Delta Export")
+    previous_nodes_path = _open_geojson_file_dialog("Previous consolidated Nodes")
+    if previous_nodes_path is None:
+        return
+    previous_spans_path = _open_geojson_file_dialog("Previous consolidated Spans")
+    if previous_spans_path is None:
+        return
+
+    output_dir = QFileDialog.getExistingDirectory(None, "Delta output folder")
+    if not output_dir:
+        return
+
+    logger.info(f"Exporting delta to '{output_dir}'")
+    export_delta(
+        output_dir,
+        previous_nodes_path=previous_nodes_path,
+        previous_spans_path=previous_spans_path,
+        nodes=network.nodes,
+        spans=network.spans,
+    )
+
+
+def save_run_record_file_dialog(record: RunRecord):
+    logger.info("Opening File Save Dialog for Run Record")
+    file_path = save_file_dialog("json")
     if file_path:
-        with Path(file_path).open("w", encoding="utf-8") as f:
-            write_geojson_from_features(f, features)
+        write_run_record(_with_extension(file_path, "json"), record)
+
+
+def open_geojson_files_dialog() -> List[str]:
+    """Ask the user for GeoJSON files to load, which may be gzip or zstd compressed."""
+    logger.info("Opening File Dialog for GeoJSON layers")
+    extensions = ["*.geojson", "*.json", "*.geojson.gz", "*.json.gz"]
+    if zstd_available():
+        extensions += ["*.geojson.zst", "*.json.zst"]
+    paths, _ = QFileDialog.getOpenFileNames(
+        None, "Add layers", "", f"GeoJSON ({' '.join(extensions)})"
+    )
+    return paths
+
+
+def open_run_record_file_dialog() -> Optional[Tuple[str, RunRecord]]:
+    """Ask the user for a previously saved run, returning its path and record."""
+    logger.info("Opening File Dialog for Run Record")
+    path, _ = QFileDialog.getOpenFileName(
+        None, "Previous consolidation run", "", "Run Record (*.json)"
+    )
+    if not path:
+        return None
+    return path, read_run_record(path)
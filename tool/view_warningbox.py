@@ -1,8 +1,15 @@
-from typing import Literal
+from pathlib import Path
+from typing import List, Literal, Optional
+
+from PyQt5.QtWidgets import QInputDialog, QMessageBox
+from qgis.core import Qgis
+from qgis.gui import QgisInterface
+from qgis.utils import iface
 
-from PyQt5.QtWidgets import QMessageBox
 from .model.network import Feature, Node, Span
 
+iface: QgisInterface
+
 
 def show_multi_consolidation_warning(
     a_or_b: str,
@@ -50,6 +57,18 @@ def show_node_incomplete_consolidation_warning() -> bool:
     return show_warningbox(title, info_text, icon=QMessageBox.Icon.Warning)
 
 
+def show_shared_metadata_warning() -> bool:
+    title = "Warning: Network metadata written once per file"
+    info_text = (
+        "The network object will be written once per file, instead of on every "
+        + "feature. The features won't be valid OFDS on their own, and the files "
+        + "can't be loaded back into this tool as input layers.\n\n"
+        + "Are you sure you wish to save them like this?"
+    )
+
+    return show_warningbox(title, info_text, icon=QMessageBox.Icon.Warning)
+
+
 def show_warningbox(
     title: str, info_text: str, icon: QMessageBox.Icon = QMessageBox.Icon.Question
 ) -> bool:
@@ -83,3 +102,39 @@ def show_warningbox(
     msg.exec_()
 
     return user_says_ok
+
+
+def ask_confidence_threshold(title: str, label: str, default: float) -> Optional[float]:
+    """
+    Ask the user for a confidence percentage, e.g. for deciding many comparisons at
+    once. Returns None if the user cancels.
+    """
+    threshold, ok = QInputDialog.getDouble(
+        None, title, label, default, 0.0, 100.0, 1
+    )
+    return threshold if ok else None
+
+
+def show_save_finished_message(success: bool, paths: List[Path], errors: List[Exception]):
+    """
+    Show a non-blocking message in the QGIS message bar once a background save has
+    finished (or failed).
+    """
+    if success:
+        iface.messageBar().pushMessage(
+            "OFDS Consolidation Tool",
+            "Saved " + ", ".join(str(p) for p in paths),
+            level=Qgis.MessageLevel.Success,
+        )
+    elif errors:
+        iface.messageBar().pushMessage(
+            "OFDS Consolidation Tool",
+            "Saving failed: " + "; ".join(str(e) for e in errors),
+            level=Qgis.MessageLevel.Critical,
+        )
+    else:
+        iface.messageBar().pushMessage(
+            "OFDS Consolidation Tool",
+            "Saving was cancelled",
+            level=Qgis.MessageLevel.Warning,
+        )
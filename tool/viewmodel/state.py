@@ -1,9 +1,27 @@
+import dataclasses
+import heapq
 import logging
 from abc import abstractmethod
+from bisect import bisect_left
+from collections import defaultdict
 from enum import Enum
-from typing import ClassVar, Generic, List, Type, Union, Tuple, cast, Optional
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    ClassVar,
+    Dict,
+    Generic,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Type,
+    Union,
+    cast,
+)
 
-from qgis.core import QgsVectorLayer
+from qgis.core import QgsApplication, QgsProject, QgsVectorLayer
 
 from ..model.comparison import (
     ComparisonOutcome,
@@ -18,13 +36,45 @@ from ..model.consolidation import (
     NetworkNodesConsolidator,
     NetworkSpansConsolidator,
     AbstractNetworkConsolidator,
+    bulk_consolidate_above,
+    bulk_keep_below,
+    review_priority,
+)
+from ..model.decisions import RunRecord, StageRecord
+from ..model.journal import (
+    REVIEW_JOURNALS_DIRNAME,
+    STAGE_NODES,
+    STAGE_SPANS,
+    JournalContents,
+    JournalHeader,
+    JournalStage,
+    ReviewJournal,
+    ScoredPair,
+    network_fingerprint,
+    open_review_journal,
+    read_review_journal,
+    review_journal_path,
 )
+from ..model.ledger import ConsolidationLedger
 from ..model.network import Network, Node, Span, FeatureT, NetworkDescription
+from ..model.qgis_utils import geojson_layer_name, load_geojson_layer
+from ..model.score_cache import SCORE_CACHE_FILENAME, ScoreCache, open_score_cache
 from ..model.settings import Settings
-from ..view_file_dialog import save_geojson_file_dialog
+from ..model.tasks import DiscoverNetworksTask, SaveNetworkTask, ScoreNodesTask
+from ..view_file_dialog import (
+    export_delta_dialog,
+    open_geojson_files_dialog,
+    open_run_record_file_dialog,
+    save_run_record_file_dialog,
+    save_features_file_dialog,
+    save_network_files_dialog,
+    save_ofds_json_package_file_dialog,
+)
 from ..view_warningbox import (
     show_node_incomplete_consolidation_warning,
     show_multi_consolidation_warning,
+    show_save_finished_message,
+    show_shared_metadata_warning,
     show_warningbox,
 )
 
@@ -35,6 +85,44 @@ class ToolInvalidState(Exception):
     pass
 
 
+_score_cache: Optional[ScoreCache] = None
+
+# Saves running in the background. Their tasks are kept here rather than by the state
+# that started them, so they aren't garbage collected if it's replaced mid-save, e.g.
+# by the tool being reset.
+_running_save_tasks: Set[SaveNetworkTask] = set()
+
+
+def get_score_cache() -> ScoreCache:
+    """
+    The comparison score cache, kept in the QGIS profile directory so it's shared
+    between runs and QGIS sessions.
+    """
+    global _score_cache
+    if _score_cache is None:
+        path = Path(QgsApplication.qgisSettingsDirPath(), SCORE_CACHE_FILENAME)
+        _score_cache = open_score_cache(path)
+    return _score_cache
+
+
+def get_review_journal_path(network_a_id: str, network_b_id: str) -> Path:
+    """
+    Where the review of a pair of networks is journaled, in the QGIS profile directory
+    so it can be resumed in a later QGIS session.
+    """
+    directory = Path(QgsApplication.qgisSettingsDirPath(), REVIEW_JOURNALS_DIRNAME)
+    return review_journal_path(directory, network_a_id, network_b_id)
+
+
+def scored_pair(comparison: NodeComparison) -> ScoredPair:
+    return ScoredPair(
+        comparison.feature_a.id,
+        comparison.feature_b.id,
+        comparison.scores,
+        comparison.distance_km,
+    )
+
+
 class ToolStateEnum(str, Enum):
     """
     Each state represents one of the stages in the tool flow.
@@ -49,6 +137,20 @@ class ToolStateEnum(str, Enum):
 class AbstractToolState:
     state: ClassVar[ToolStateEnum]
 
+    # Called when the state changes other than in response to the UI, e.g. when
+    # background work finishes, so the view can be updated
+    onUpdated: Optional[Callable[[], None]] = None
+
+    def _notifyUpdated(self):
+        if self.onUpdated is not None:
+            self.onUpdated()
+
+    def close(self):
+        """
+        Called when this state has been replaced by another, to stop any background
+        work and release anything it holds open.
+        """
+
 
 class ToolLayerSelectState(AbstractToolState):
     state = ToolStateEnum.READY_FOR_SELECTION
@@ -60,44 +162,186 @@ class ToolLayerSelectState(AbstractToolState):
     # to prevent spamming update events.
     _is_populating_layers: bool
 
+    # A previous run of the same networks, to reuse its decisions
+    previousRun: Optional[RunRecord]
+    previousRunPath: Optional[str]
+
+    # The networks in the selected layers are found in the background. Each new
+    # selection of layers is a new generation, so that results from tasks for an older
+    # selection can be dropped. Keep references to the tasks until they've finished,
+    # so they aren't garbage collected.
+    discoveryGeneration: int
+    discoveryTasks: List[DiscoverNetworksTask]
+    _discoveryLayerIds: Optional[Tuple[Optional[str], ...]]
+
     def __init__(self, selectableLayers: List[QgsVectorLayer]):
         self.selectableLayers = selectableLayers
         self.selectableNetworksA = []
         self.selectableNetworksB = []
         self._is_populating_layers = False
+        self.previousRun = None
+        self.previousRunPath = None
+        self.discoveryGeneration = 0
+        self.discoveryTasks = []
+        self._discoveryLayerIds = None
+
+    @property
+    def discovering(self) -> bool:
+        """Whether the networks in the current selection of layers are being found."""
+        return any(
+            task.generation == self.discoveryGeneration for task in self.discoveryTasks
+        )
+
+    def addLayersFromFiles(self, project: QgsProject) -> "ToolLayerSelectState":
+        """Add GeoJSON files chosen by the user, which may be compressed, as layers."""
+        for path in open_geojson_files_dialog():
+            layer = load_geojson_layer(path, geojson_layer_name(path))
+            if not layer.isValid():
+                logger.warning(f"Can't load '{path}' as a layer")
+                show_warningbox(
+                    "Can't add layer", f"'{path}' isn't a valid GeoJSON file."
+                )
+                continue
+            project.addMapLayer(layer)
+            self.selectableLayers.append(layer)
+        return self
+
+    def loadPreviousRun(self) -> "ToolLayerSelectState":
+        result = open_run_record_file_dialog()
+        if result is not None:
+            self.previousRunPath, self.previousRun = result
+        return self
 
     def __str__(self) -> str:
         return f"<ToolLayerSelectState n_layers={len(self.selectableLayers)}>"
 
+    def startComparing(
+            self, networks: Tuple[Network, Network], settings: Settings
+    ) -> "ToolState":
+        """
+        Start comparing the networks' nodes. If a review of the same networks with the
+        same settings was left unfinished, the user can resume it where they left off.
+        """
+        header = JournalHeader(
+            network_a_id=networks[0].ofds_network.id,
+            network_b_id=networks[1].ofds_network.id,
+            settings=dataclasses.asdict(settings),
+            fingerprint_a=network_fingerprint(networks[0]),
+            fingerprint_b=network_fingerprint(networks[1]),
+        )
+        path = get_review_journal_path(header.network_a_id, header.network_b_id)
+
+        restored: Optional[JournalContents] = None
+        if path.exists():
+            try:
+                contents = read_review_journal(path)
+            except (OSError, ValueError, KeyError) as e:
+                logger.warning(f"Can't read review journal '{path}', ignoring it: {e}")
+            else:
+                restored_nodes = contents.stage(STAGE_NODES)
+                if restored_nodes.finished and restored_nodes.asked is None:
+                    # The nodes weren't all compared, and the ones that were aren't
+                    # in the journal, so the review carries on from comparing nodes
+                    logger.warning(
+                        "Review journal has no node comparisons, comparing them again"
+                    )
+                    restored_nodes.finished = False
+                    contents.stage(STAGE_SPANS).finished = False
+
+                if contents.header != header:
+                    logger.info(
+                        "Review journal is for different inputs or settings, "
+                        + "starting a new review"
+                    )
+                elif show_warningbox(
+                        "Resume review?",
+                        (
+                            "These networks have already been reviewed with the same "
+                            + "settings. Click OK to go straight to saving the "
+                            + "results, or Cancel to start again."
+                        )
+                        if contents.stage(STAGE_SPANS).finished
+                        else (
+                            "These networks were being reviewed with the same "
+                            + "settings, but the review wasn't finished. Click OK to "
+                            + "carry on where you left off, or Cancel to start again."
+                        ),
+                ):
+                    restored = contents
+
+        journal = open_review_journal(path, header, resume=restored is not None)
+
+        nodes_state = ToolNodeComparisonState(
+            networks=networks,
+            settings=settings,
+            previous_run=self.previousRun,
+            journal=journal,
+            restored=restored,
+        )
+        if restored is None or not restored.stage(STAGE_NODES).finished:
+            return nodes_state
+
+        # The nodes were compared in the review being resumed, so go straight on
+        spans_state = nodes_state.toSpanComparison()
+        nodes_state.close()
+        if (
+                isinstance(spans_state, ToolSpanComparisonState)
+                and restored.stage(STAGE_SPANS).finished
+        ):
+            return spans_state.finish()
+        return spans_state
+
     def update_networks_list(self, nodes_layers: Tuple[Optional[QgsVectorLayer], Optional[QgsVectorLayer]],
                              spans_layers: Tuple[Optional[QgsVectorLayer], Optional[QgsVectorLayer]]) -> "ToolLayerSelectState":
-        networks_a = set()
-        networks_b = set()
-
-        for nodes_layer, spans_layer, layers_networks in [(nodes_layers[0], spans_layers[0], networks_a),
-                                                          (nodes_layers[1], spans_layers[1], networks_b)]:
-            # Get networks from Nodes
-            if nodes_layer is not None:
-                for feature in list(nodes_layer.getFeatures()):
-                    try:
-                        node = Node.from_qgis_feature(feature)
-                        layers_networks.add((node.ofds_network.id, node.ofds_network.name))
-                    except Exception as e:
-                        logger.error("Error when processing feature", exc_info=e)
-
-            # Get networks from Spans
-            if spans_layer is not None:
-                for feature in list(spans_layer.getFeatures()):
-                    try:
-                        span = Span.from_qgis_feature(feature)
-                        layers_networks.add((span.ofds_network.id, span.ofds_network.name))
-                    except Exception as e:
-                        logger.error("Error when processing feature", exc_info=e)
-
-        self.selectableNetworksA = list(networks_a)
-        self.selectableNetworksB = list(networks_b)
+        """
+        Find the networks in the selected layers in the background, unless they've
+        already been found (or are being found) for the same layers. Any search for
+        a previous selection is cancelled.
+        """
+        layer_ids = tuple(
+            layer.id() if layer is not None else None
+            for layer in nodes_layers + spans_layers
+        )
+        if layer_ids == self._discoveryLayerIds:
+            return self
+        self._discoveryLayerIds = layer_ids
+
+        for task in self.discoveryTasks:
+            task.cancel()
+
+        self.discoveryGeneration += 1
+        task = DiscoverNetworksTask(
+            self.discoveryGeneration,
+            nodes_layers,
+            spans_layers,
+            on_finished=self._onNetworksDiscovered,
+        )
+        self.discoveryTasks.append(task)
+        QgsApplication.taskManager().addTask(task)
         return self
 
+    def close(self):
+        # Drop the results of any searches still running
+        for task in self.discoveryTasks:
+            task.cancel()
+        self.discoveryGeneration += 1
+
+    def _onNetworksDiscovered(self, success: bool, task: DiscoverNetworksTask):
+        if task in self.discoveryTasks:
+            self.discoveryTasks.remove(task)
+
+        if task.generation != self.discoveryGeneration:
+            # The selection has changed since, so these results are stale
+            return
+
+        if success:
+            self.selectableNetworksA = list(task.networks[0])
+            self.selectableNetworksB = list(task.networks[1])
+        else:
+            # Search again next time the selection is updated
+            self._discoveryLayerIds = None
+        self._notifyUpdated()
+
 
 class AbstractToolComparisonState(Generic[FeatureT, ComparisonT], AbstractToolState):
     ComparisonOutcomeCls: Type[ComparisonOutcome[ComparisonT]]
@@ -114,23 +358,182 @@ class AbstractToolComparisonState(Generic[FeatureT, ComparisonT], AbstractToolSt
         Tuple[ComparisonT, Union[None, ComparisonOutcome[ComparisonT]]]
     ]
 
+    # Indexes of the comparisons each feature is in, by feature ID, so the other
+    # comparisons with a feature can be found without searching them all
+    comparisonsByFeatureA: Dict[str, List[int]]
+    comparisonsByFeatureB: Dict[str, List[int]]
+
+    # Number of comparisons decided as Same/Not Same, kept up to date by _setOutcome
+    nConsolidated: int
+    nRejected: int
+
     # Keep track of which pair we're looking at now
     current: int
 
+    # Which stage this is in the review journal
+    JOURNAL_STAGE: ClassVar[str]
+
+    # Journal of the decisions made, so the review can be resumed if it's interrupted
+    journal: Optional[ReviewJournal]
+
+    # Decisions from the journal of a review that's being resumed
+    restoredDecisions: Dict[Tuple[str, str], bool]
+
     def __init__(
             self,
             networks: Tuple[Network, Network],
             consolidator: AbstractNetworkConsolidator[FeatureT, ComparisonT],
             settings: Settings,
+            journal: Optional[ReviewJournal] = None,
+            restored: Optional[JournalStage] = None,
     ):
         self.settings = settings
         self.networks = networks
         self.consolidator = consolidator
-        self.comparisons_outcomes = [
-            (comparison, None)
-            for comparison in self.consolidator.get_comparisons_to_ask_user()
-        ]
         self.current = 0
+        self.journal = journal
+        self.restoredDecisions = restored.decisions if restored else dict()
+        self._setComparisons(
+            [
+                (comparison, self._initialOutcome(comparison))
+                for comparison in self.consolidator.get_comparisons_to_ask_user()
+            ]
+        )
+        self._flushJournal()
+
+    def _initialOutcome(
+            self, comparison: ComparisonT
+    ) -> Union[None, ComparisonOutcome[ComparisonT]]:
+        """
+        The decision already made on a comparison: in the review being resumed, or in
+        a previous run, where the features haven't changed since.
+        """
+        key = (comparison.feature_a.id, comparison.feature_b.id)
+        if key in self.restoredDecisions:
+            return self.consolidator.restored_outcome(
+                comparison, self.restoredDecisions[key]
+            )
+
+        outcome = self.consolidator.previous_outcome(comparison)
+        if outcome is not None:
+            self._journalOutcome(outcome)
+        return outcome
+
+    def _journalOutcome(self, outcome: ComparisonOutcome[ComparisonT]):
+        if self.journal is not None:
+            self.journal.record_decision(
+                self.JOURNAL_STAGE,
+                outcome.comparison.feature_a.id,
+                outcome.comparison.feature_b.id,
+                outcome.consolidate is not False,
+            )
+
+    def _flushJournal(self):
+        if self.journal is not None:
+            self.journal.flush()
+
+    def close(self):
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+
+    def _setComparisons(
+            self,
+            comparisons_outcomes: List[
+                Tuple[ComparisonT, Union[None, ComparisonOutcome[ComparisonT]]]
+            ],
+    ):
+        """Replace the comparisons, recounting the outcomes and re-indexing them."""
+        self.comparisons_outcomes = comparisons_outcomes
+
+        self.nConsolidated = 0
+        self.nRejected = 0
+        self.comparisonsByFeatureA = defaultdict(list)
+        self.comparisonsByFeatureB = defaultdict(list)
+
+        for _, outcome in self.comparisons_outcomes:
+            self._countOutcome(outcome)
+        self._indexComparisonsFrom(0)
+
+    def _countOutcome(self, outcome: Union[None, ComparisonOutcome[ComparisonT]]):
+        if outcome is None:
+            return
+        elif outcome.consolidate is False:
+            self.nRejected += 1
+        else:
+            self.nConsolidated += 1
+
+    def _indexComparisonsFrom(self, start: int):
+        """
+        (Re-)index the comparisons from position start onwards, e.g. after new ones
+        have been inserted there. The indexes of each feature are kept in order, so the
+        entries for those positions are always at their end.
+        """
+        tail = self.comparisons_outcomes[start:]
+        for comparison, _ in tail:
+            for indexes in (
+                    self.comparisonsByFeatureA[comparison.feature_a.id],
+                    self.comparisonsByFeatureB[comparison.feature_b.id],
+            ):
+                del indexes[bisect_left(indexes, start):]
+
+        for i, (comparison, _) in enumerate(tail, start=start):
+            self.comparisonsByFeatureA[comparison.feature_a.id].append(i)
+            self.comparisonsByFeatureB[comparison.feature_b.id].append(i)
+
+    def _isFeatureConsolidated(self, comparison: ComparisonT) -> bool:
+        """Whether either feature is already being consolidated with another."""
+        for indexes in (
+                self.comparisonsByFeatureA.get(comparison.feature_a.id, []),
+                self.comparisonsByFeatureB.get(comparison.feature_b.id, []),
+        ):
+            for i in indexes:
+                outcome = self.comparisons_outcomes[i][1]
+                if outcome is not None and outcome.consolidate is not False:
+                    return True
+        return False
+
+    def _consolidatedFeatureIds(self) -> Tuple[Set[str], Set[str]]:
+        """IDs of the features in A and B that the user has decided to consolidate."""
+        ids_a: Set[str] = set()
+        ids_b: Set[str] = set()
+        for comparison, outcome in self.comparisons_outcomes:
+            if outcome is not None and outcome.consolidate is not False:
+                ids_a.add(comparison.feature_a.id)
+                ids_b.add(comparison.feature_b.id)
+        return ids_a, ids_b
+
+    def addComparisons(self, comparisons: List[ComparisonT]):
+        """
+        Add comparisons found while the user is already comparing. They're merged in
+        priority order into the comparisons after the current one, so the most likely
+        matches are asked about next.
+        """
+        new_outcomes: List[
+            Tuple[ComparisonT, Union[None, ComparisonOutcome[ComparisonT]]]
+        ] = list()
+        for comparison in sorted(comparisons, key=review_priority):
+            if self._isFeatureConsolidated(comparison):
+                # One of the features is already being consolidated with another
+                outcome = self.ComparisonOutcomeCls(
+                    comparison=comparison, consolidate=False
+                )
+                self._journalOutcome(outcome)
+            else:
+                outcome = self._initialOutcome(comparison)
+            new_outcomes.append((comparison, outcome))
+            self._countOutcome(outcome)
+        self._flushJournal()
+
+        # Only the comparisons after the current one move, so only they're re-indexed
+        start = min(self.current + 1, self.nTotal)
+        tail = self.comparisons_outcomes[start:]
+        self.comparisons_outcomes[start:] = heapq.merge(
+            tail, new_outcomes, key=lambda co: review_priority(co[0])
+        )
+        self._indexComparisonsFrom(start)
+
+        self._notifyUpdated()
 
     def __str__(self):
         return (
@@ -146,7 +549,13 @@ class AbstractToolComparisonState(Generic[FeatureT, ComparisonT], AbstractToolSt
     def gotoPrevComparison(self):
         self.current -= 1
         if self.current < 0:
-            self.current = self.nTotal - 1
+            self.current = max(self.nTotal - 1, 0)
+
+    def gotoFirstUndecided(self):
+        for i, (_, outcome) in enumerate(self.comparisons_outcomes):
+            if outcome is None:
+                self.current = i
+                return
 
     @abstractmethod
     def finish(self) -> "ToolState":
@@ -158,13 +567,29 @@ class AbstractToolComparisonState(Generic[FeatureT, ComparisonT], AbstractToolSt
 
     @property
     def nCompared(self) -> int:
-        return len(
-            [1 for (_, outcome) in self.comparisons_outcomes if outcome is not None]
-        )
+        return self.nConsolidated + self.nRejected
 
     @property
     def all_compared(self) -> bool:
-        return all(outcome is not None for (_, outcome) in self.comparisons_outcomes)
+        return self.nCompared == self.nTotal
+
+    def _setOutcome(self, i: int, outcome: ComparisonOutcome[ComparisonT]):
+        """Set the outcome of comparison i, keeping the counts up to date."""
+        (comparison, old_outcome) = self.comparisons_outcomes[i]
+
+        if old_outcome is not None:
+            if old_outcome.consolidate is False:
+                self.nRejected -= 1
+            else:
+                self.nConsolidated -= 1
+
+        if outcome.consolidate is False:
+            self.nRejected += 1
+        else:
+            self.nConsolidated += 1
+
+        self.comparisons_outcomes[i] = (comparison, outcome)
+        self._journalOutcome(outcome)
 
     @property
     def currentComparison(self) -> Union[None, ComparisonT]:
@@ -173,6 +598,21 @@ class AbstractToolComparisonState(Generic[FeatureT, ComparisonT], AbstractToolSt
         except IndexError:
             return None
 
+    def comparisonsAround(self, distance: int) -> List[ComparisonT]:
+        """
+        The comparisons up to distance either side of the current one, nearest first
+        and next before previous, i.e. in the order the user is likely to go to them.
+        """
+        comparisons: List[ComparisonT] = list()
+        seen = {self.current}
+        for step in range(1, distance + 1):
+            for i in (self.current + step, self.current - step):
+                i %= max(self.nTotal, 1)
+                if i not in seen:
+                    seen.add(i)
+                    comparisons.append(self.comparisons_outcomes[i][0])
+        return comparisons
+
     @property
     def currentOutcome(self) -> Union[None, ComparisonOutcome[ComparisonT]]:
         try:
@@ -193,21 +633,26 @@ class AbstractToolComparisonState(Generic[FeatureT, ComparisonT], AbstractToolSt
         other_comparisons_with_feat_a: List[Tuple[int, FeatureT]] = list()
         other_comparisons_with_feat_b: List[Tuple[int, FeatureT]] = list()
 
-        for other_i in range(len(self.comparisons_outcomes)):
+        for other_i in self.comparisonsByFeatureA.get(comparison.feature_a.id, []):
             (other_comparison, other_outcome) = self.comparisons_outcomes[other_i]
-
-            if comparison == other_comparison:
+            if other_i == self.current or comparison == other_comparison:
                 continue
+            other_comparisons_with_feat_a.append(
+                (other_i, other_comparison.feature_b)  # type: ignore
+            )
 
-            if comparison.feature_a.id == other_comparison.feature_a.id:
-                other_comparisons_with_feat_a.append(
-                    (other_i, other_comparison.feature_b)  # type: ignore
-                )
-
-            elif comparison.feature_b.id == other_comparison.feature_b.id:
-                other_comparisons_with_feat_b.append(
-                    (other_i, other_comparison.feature_a)  # type: ignore
-                )
+        for other_i in self.comparisonsByFeatureB.get(comparison.feature_b.id, []):
+            (other_comparison, other_outcome) = self.comparisons_outcomes[other_i]
+            if (
+                    other_i == self.current
+                    or comparison == other_comparison
+                    # Already found via feature A
+                    or other_comparison.feature_a.id == comparison.feature_a.id
+            ):
+                continue
+            other_comparisons_with_feat_b.append(
+                (other_i, other_comparison.feature_a)  # type: ignore
+            )
 
         # Check that none of the other comparisons w/ overlapping nodes have already
         # been chosen to consolidate, if so display a warning to the user
@@ -231,51 +676,135 @@ class AbstractToolComparisonState(Generic[FeatureT, ComparisonT], AbstractToolSt
         # If we've got this far, update all the other comparisons to be "not same"
         for other_i, _ in other_comparisons_with_feat_a + other_comparisons_with_feat_b:
             (other_comparison, other_outcome) = self.comparisons_outcomes[other_i]
-            self.comparisons_outcomes[other_i] = (
-                other_comparison,
+            self._setOutcome(
+                other_i,
                 self.ComparisonOutcomeCls(
                     comparison=other_comparison, consolidate=False
                 ),
             )
 
         # Finally, update the outcome with a manual consolidation reason
-        reason = ConsolidationReason(
-            feature_type="NODE",
+        self._setOutcome(
+            self.current,
+            self.ComparisonOutcomeCls(
+                comparison=comparison,
+                consolidate=self._consolidationReason(comparison),
+            ),
+        )
+        self._flushJournal()
+
+        return True
+
+    def _consolidationReason(
+            self, comparison: ComparisonT, manual: bool = True
+    ) -> ConsolidationReason:
+        return ConsolidationReason(
+            feature_type=self.consolidator.FEATURE_TYPE,
             primary=comparison.feature_a,
             secondary=comparison.feature_b,
             confidence=comparison.confidence,
             # TODO: user's choice of matching properties? User text message?
             similar_fields=comparison.get_high_scoring_properties(),
-            manual=True,
+            manual=manual,
         )
 
-        self.comparisons_outcomes[self.current] = (
-            comparison,
-            self.ComparisonOutcomeCls(comparison=comparison, consolidate=reason),
-        )
-
-        return True
-
     def setOutcomeDontConsolidate(self):
         comparison = self.currentComparison
         assert comparison is not None
-        self.comparisons_outcomes[self.current] = (
-            comparison,
+        self._setOutcome(
+            self.current,
             self.ComparisonOutcomeCls(comparison=comparison, consolidate=False),
         )
+        self._flushJournal()
+
+    def consolidateAbove(self, threshold: float) -> int:
+        """
+        Mark every undecided comparison with a confidence of at least threshold as the
+        same, most confident first. Comparisons of features that are already being
+        consolidated (by the user, or earlier in this batch) are marked not the same,
+        rather than asking about each conflict.
+
+        Returns the number of comparisons marked as the same.
+        """
+        consolidate, keep = bulk_consolidate_above(self.comparisons_outcomes, threshold)
+        for i in consolidate:
+            comparison = self.comparisons_outcomes[i][0]
+            self._setOutcome(
+                i,
+                self.ComparisonOutcomeCls(
+                    comparison=comparison,
+                    # Chosen by the threshold, rather than the user looking at them
+                    consolidate=self._consolidationReason(comparison, manual=False),
+                ),
+            )
+        for i in keep:
+            self._setOutcome(
+                i,
+                self.ComparisonOutcomeCls(
+                    comparison=self.comparisons_outcomes[i][0], consolidate=False
+                ),
+            )
+        self._flushJournal()
+        return len(consolidate)
+
+    def keepBelow(self, threshold: float) -> int:
+        """
+        Mark every undecided comparison with a confidence of at most threshold as not
+        the same. Returns the number of comparisons marked.
+        """
+        keep = bulk_keep_below(self.comparisons_outcomes, threshold)
+        for i in keep:
+            self._setOutcome(
+                i,
+                self.ComparisonOutcomeCls(
+                    comparison=self.comparisons_outcomes[i][0], consolidate=False
+                ),
+            )
+        self._flushJournal()
+        return len(keep)
 
 
 class ToolNodeComparisonState(AbstractToolComparisonState[Node, NodeComparison]):
     state = ToolStateEnum.COMPARING_NODES
     ComparisonOutcomeCls = NodeComparisonOutcome
+    JOURNAL_STAGE = STAGE_NODES
 
     consolidator: NetworkNodesConsolidator
 
+    previous_run: Optional[RunRecord]
+
+    # Nodes are compared in the background, and the user can start comparing the
+    # ones found so far. Keep a reference to the task so it isn't garbage collected.
+    scoringTask: Optional[ScoreNodesTask]
+
+    # The journal of a review that's being resumed
+    restored: Optional[JournalContents]
+
     def __init__(
             self,
             networks: Tuple[Network, Network],
             settings: Settings,
+            previous_run: Optional[RunRecord] = None,
+            journal: Optional[ReviewJournal] = None,
+            restored: Optional[JournalContents] = None,
     ):
+        """
+        Start comparing nodes in the background. If restored is given, the review in
+        it is resumed instead, without comparing the nodes again.
+        """
+        if previous_run is not None and not previous_run.is_compatible(
+                networks[0].ofds_network.id, networks[1].ofds_network.id, settings
+        ):
+            logger.warning(
+                "Previous run was for different networks or settings, ignoring it"
+            )
+            show_warningbox(
+                "Previous run not used",
+                "The previous run was for different networks or settings, so all "
+                + "features will be compared again.",
+            )
+            previous_run = None
+        self.previous_run = previous_run
 
         consolidator = NetworkNodesConsolidator(
             networks[0],
@@ -283,12 +812,107 @@ class ToolNodeComparisonState(AbstractToolComparisonState[Node, NodeComparison])
             merge_above=settings.nodes_merge_threshold,
             ask_above=settings.nodes_ask_threshold,
             match_radius_km=settings.nodes_match_radius_km,
+            previous=previous_run.nodes if previous_run else None,
+            score_cache=get_score_cache(),
+            defer_scoring=True,
         )
+        self.restored = restored
+        restored_nodes = restored.stage(STAGE_NODES) if restored else None
         super().__init__(
-            networks=networks, consolidator=consolidator, settings=settings
+            networks=networks,
+            consolidator=consolidator,
+            settings=settings,
+            journal=journal,
+            restored=restored_nodes,
         )
 
+        if restored_nodes is not None and restored_nodes.asked is not None:
+            self.scoringTask = None
+            self.addComparisons(
+                consolidator.restore_scoring(
+                    restored_nodes.asked, restored_nodes.merged
+                )
+            )
+            self._autoConsolidate()
+            self.gotoFirstUndecided()
+            return
+
+        self.scoringTask = ScoreNodesTask(
+            consolidator, on_finished=self._onScoringFinished
+        )
+        self.scoringTask.comparisonsScored.connect(self._onComparisonsScored)
+        QgsApplication.taskManager().addTask(self.scoringTask)
+
+    @property
+    def scoring(self) -> bool:
+        """Whether nodes are still being compared in the background."""
+        return self.scoringTask is not None
+
+    def close(self):
+        if self.scoringTask is not None:
+            self.scoringTask.cancel()
+            self.scoringTask = None
+        super().close()
+
+    def _onComparisonsScored(self, comparisons: List[NodeComparison]):
+        # Batches can still arrive after the task has been cancelled
+        if self.scoringTask is not None:
+            self.addComparisons(comparisons)
+
+    def _onScoringFinished(self, success: bool, task: ScoreNodesTask):
+        if task is not self.scoringTask:
+            return
+
+        if not success:
+            show_warningbox(
+                "Comparing nodes stopped",
+                "Not all nodes were compared, so only the matches found so far can "
+                + "be consolidated.",
+            )
+
+        if self.journal is not None:
+            # So the review can be resumed without comparing the nodes again. If not
+            # all of them were compared, it's resumed with the matches found so far.
+            self.journal.record_comparisons(
+                STAGE_NODES,
+                (scored_pair(c) for (c, _) in self.comparisons_outcomes),
+                (scored_pair(c) for c in self.consolidator.merge_candidates),
+            )
+
+        self._autoConsolidate()
+        self.scoringTask = None
+        self._notifyUpdated()
+
+    def _autoConsolidate(self):
+        # Auto-consolidate, except for nodes the user has already consolidated
+        consolidated_a, consolidated_b = self._consolidatedFeatureIds()
+        self.consolidator.finish_scoring(consolidated_a, consolidated_b)
+
+        # Don't ask about nodes that have been auto-consolidated
+        current = self.currentComparison
+        remaining = set(
+            id(c)
+            for c in self.consolidator.without_consolidated(
+                c for (c, _) in self.comparisons_outcomes
+            )
+        )
+        self._setComparisons(
+            [(c, o) for (c, o) in self.comparisons_outcomes if id(c) in remaining]
+        )
+        self.current = 0
+        for i, (c, _) in enumerate(self.comparisons_outcomes):
+            if c is current:
+                self.current = i
+                break
+
     def finish(self) -> "ToolState":
+        if self.scoring:
+            show_warningbox(
+                "Still comparing nodes",
+                "Please wait until all the nodes have been compared before finishing.",
+            )
+            return self
+
         if not self.all_compared:
             # If not all comparisons are complete, ask the user if they're sure they
             # want to finish.
@@ -296,6 +920,15 @@ class ToolNodeComparisonState(AbstractToolComparisonState[Node, NodeComparison])
                 # If they're not sure (clicked Cancel), let them continue comparing
                 return self
 
+        return self.toSpanComparison()
+
+    def toSpanComparison(self) -> "ToolState":
+        """Consolidate the nodes as decided, and move on to comparing spans."""
+        # The journal carries on in the spans comparison, so isn't closed with this
+        journal, self.journal = self.journal, None
+        if journal is not None:
+            journal.record_finished(STAGE_NODES)
+
         # Gather outcomes, setting all all unmarked comparisons to "don't consolidate"
         outcomes: List[NodeComparisonOutcome] = list(
             o if o is not None else ComparisonOutcome(comparison=c, consolidate=False)
@@ -312,6 +945,11 @@ class ToolNodeComparisonState(AbstractToolComparisonState[Node, NodeComparison])
             networks=(new_network_a, new_network_b),
             settings=self.settings,
             new_ofds_network=self.consolidator.new_ofds_network,
+            nodes_record=self.consolidator.stage_record(),
+            ledger=self.consolidator.ledger,
+            previous_run=self.previous_run,
+            journal=journal,
+            restored=self.restored.stage(STAGE_SPANS) if self.restored else None,
         )
 
         if span_comparison_state.nTotal < 1:
@@ -329,24 +967,45 @@ class ToolNodeComparisonState(AbstractToolComparisonState[Node, NodeComparison])
 class ToolSpanComparisonState(AbstractToolComparisonState[Span, SpanComparison]):
     state = ToolStateEnum.COMPARING_SPANS
     ComparisonOutcomeCls = SpanComparisonOutcome
+    JOURNAL_STAGE = STAGE_SPANS
 
     consolidator: NetworkSpansConsolidator
 
+    # Record of the Nodes stage, to save with this stage's for reusing in later runs
+    nodes_record: StageRecord
+
     def __init__(
             self,
             networks: Tuple[Network, Network],
             new_ofds_network: NetworkDescription,
             settings: Settings,
+            nodes_record: StageRecord,
+            previous_run: Optional[RunRecord] = None,
+            journal: Optional[ReviewJournal] = None,
+            restored: Optional[JournalStage] = None,
+            ledger: Optional[ConsolidationLedger] = None,
     ):
+        self.nodes_record = nodes_record
+
         consolidator = NetworkSpansConsolidator(
             network_a=networks[0],
             network_b=networks[1],
             new_ofds_network=new_ofds_network,
+            match_distance_km=settings.spans_match_distance_km,
+            previous=previous_run.spans if previous_run else None,
+            score_cache=get_score_cache(),
+            ledger=ledger,
         )
 
         super().__init__(
-            networks=networks, consolidator=consolidator, settings=settings
+            networks=networks,
+            consolidator=consolidator,
+            settings=settings,
+            journal=journal,
+            restored=restored,
         )
+        if restored is not None:
+            self.gotoFirstUndecided()
 
     def finish(self) -> "ToolState":
         if not self.all_compared:
@@ -362,25 +1021,97 @@ class ToolSpanComparisonState(AbstractToolComparisonState[Span, SpanComparison])
             if outcome
         ]
 
-        return ToolOutputState(
-            network=self.consolidator.get_consolidated_network_from_outcomes(outcomes)
+        network = self.consolidator.get_consolidated_network_from_outcomes(outcomes)
+
+        if self.journal is not None:
+            self.journal.record_finished(STAGE_SPANS)
+        self.close()
+
+        run_record = RunRecord(
+            network_a_id=self.networks[0].ofds_network.id,
+            network_b_id=self.networks[1].ofds_network.id,
+            settings=dataclasses.asdict(self.settings),
+            nodes=self.nodes_record,
+            spans=self.consolidator.stage_record(),
         )
 
+        return ToolOutputState(network=network, run_record=run_record)
+
 
 class ToolOutputState(AbstractToolState):
     state = ToolStateEnum.OUTPUT
 
     output_network: Network
 
-    def __init__(self, network: Network) -> None:
+    # Record of this run, to reuse its decisions when the networks are next updated
+    run_record: Optional[RunRecord]
+
+    def __init__(self, network: Network, run_record: Optional[RunRecord] = None) -> None:
         self.output_network = network
+        self.run_record = run_record
 
-    def saveNodes(self):
-        save_geojson_file_dialog(self.output_network.nodes)
+    def _shared_metadata(self, shared_metadata: bool) -> Optional[Dict[str, Any]]:
+        return self.output_network.shared_metadata() if shared_metadata else None
+
+    def saveNodes(self, shared_metadata: bool = False):
+        if shared_metadata and not show_shared_metadata_warning():
+            return self
+        save_features_file_dialog(
+            self.output_network.nodes, Node, self._shared_metadata(shared_metadata)
+        )
+        return self
+
+    def saveSpans(self, shared_metadata: bool = False):
+        if shared_metadata and not show_shared_metadata_warning():
+            return self
+        save_features_file_dialog(
+            self.output_network.spans, Span, self._shared_metadata(shared_metadata)
+        )
+        return self
+
+    def savePackage(self):
+        save_ofds_json_package_file_dialog(self.output_network)
+        return self
+
+    def saveDelta(self):
+        export_delta_dialog(self.output_network)
         return self
 
-    def saveSpans(self):
-        save_geojson_file_dialog(self.output_network.spans)
+    def saveRun(self):
+        if self.run_record is not None:
+            save_run_record_file_dialog(self.run_record)
+        return self
+
+    def saveAll(self, shared_metadata: bool = False):
+        """
+        Save both Nodes and Spans in the background, so the UI stays responsive while
+        large files are written. Progress is shown in the QGIS task manager.
+
+        If shared_metadata is set, the network object and run provenance are written
+        once per GeoJSON file instead of on every feature.
+        """
+        if shared_metadata and not show_shared_metadata_warning():
+            return self
+        result = save_network_files_dialog()
+        if result is None:
+            return self
+
+        nodes_path, spans_path, export_format = result
+
+        def _on_finished(success: bool, task: SaveNetworkTask):
+            _running_save_tasks.discard(task)
+            show_save_finished_message(success, task.paths, task.errors)
+
+        task = SaveNetworkTask(
+            self.output_network,
+            nodes_path=nodes_path,
+            spans_path=spans_path,
+            export_format=export_format,
+            on_finished=_on_finished,
+            shared_metadata=self._shared_metadata(shared_metadata),
+        )
+        _running_save_tasks.add(task)
+        QgsApplication.taskManager().addTask(task)
         return self
 
 